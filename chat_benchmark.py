@@ -0,0 +1,209 @@
+import argparse
+import contextlib
+import json
+import os
+import random
+import tempfile
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+from chat_database import ChatDatabase
+from chatbot import EmotionChatbot
+from embedding_service import EmbeddingService, get_embedding_service
+from emotion_detection import EmotionDetector
+from fake_llm import FakeEmbeddingModel, FakeEmotionDetector, FakeGeminiModel
+from llm_client import ContextCachingModel
+from personality import DynamicPersonality
+from vector_store import create_vector_store
+
+# Vocabulary for synthetic stored messages and benchmark turns
+TOPIC_WORDS = [
+    "music", "movies", "work", "family", "travel", "food", "sports", "books", "games", "health",
+    "weather", "school", "friends", "money", "pets", "coding", "art", "sleep", "coffee", "garden",
+]
+FILLER_WORDS = [
+    "i", "really", "think", "about", "the", "today", "feel", "was", "my", "and", "so", "a", "lot",
+    "maybe", "we", "should", "talk", "again", "it", "kind", "of", "great", "tired", "happy", "worried",
+]
+
+STAGES = [
+    "detect_emotion", "save_message_sqlite", "vector_add", "embed", "retrieve",
+    "prompt_build", "llm", "personality_update", "total",
+]
+
+
+def synthetic_message(rng, words=18):
+    """Return a random sentence mixing filler words with a couple of topics."""
+    topics = rng.sample(TOPIC_WORDS, 2)
+    return " ".join(rng.choice(FILLER_WORDS + topics) for _ in range(words))
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+class StageTimer:
+    def __init__(self):
+        """Record per-call self time of wrapped methods, excluding time spent in nested wrapped calls."""
+        self.samples = defaultdict(list)
+        self._stack = []
+
+    def wrap(self, obj, attr, stage, inclusive=False):
+        """Replace obj.attr with a timed wrapper recording under stage (whole call time if inclusive)."""
+        original = getattr(obj, attr)
+
+        def timed(*args, **kwargs):
+            self._stack.append(0.0)
+            start = time.perf_counter()
+            try:
+                return original(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - start
+                nested = self._stack.pop()
+                if self._stack:
+                    self._stack[-1] += elapsed
+                self.samples[stage].append((elapsed if inclusive else elapsed - nested) * 1000)
+
+        setattr(obj, attr, timed)
+
+    def summary(self):
+        """Return count, mean and p50/p95/p99 in milliseconds per stage."""
+        return {
+            stage: {
+                "count": len(self.samples[stage]),
+                "mean_ms": sum(self.samples[stage]) / len(self.samples[stage]),
+                "p50_ms": percentile(self.samples[stage], 0.50),
+                "p95_ms": percentile(self.samples[stage], 0.95),
+                "p99_ms": percentile(self.samples[stage], 0.99),
+            }
+            for stage in STAGES if self.samples[stage]
+        }
+
+
+def prefill(db, size, rng, batch_size=1000, conversations=100, long_term_fraction=0.8):
+    """Store size synthetic messages, the oldest long_term_fraction of them in long-term memory."""
+    start_time = datetime.now() - timedelta(days=30)
+    long_term_count = int(size * long_term_fraction)
+    for start in range(0, size, batch_size):
+        rows = []
+        for message_id in range(start + 1, min(size, start + batch_size) + 1):
+            emotion, confidence = rng.choice(["joy", "sadness", "anger", "neutral"]), rng.random()
+            rows.append((
+                message_id, message_id % conversations + 1, rng.choice(["user", "assistant"]),
+                synthetic_message(rng), emotion, confidence,
+                start_time + timedelta(seconds=message_id), int(message_id <= long_term_count)
+            ))
+
+        with db.storage.write() as conn:
+            conn.executemany(
+                "INSERT INTO messages (id, conversation_id, role, content, emotion, emotion_confidence, timestamp, is_long_term) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                rows
+            )
+
+        for is_long_term in (1, 0):
+            db.memory_service.store_messages(
+                [(row[0], row[3], db.message_metadata(row[2], row[4], row[5], row[1]))
+                 for row in rows if row[7] == is_long_term],
+                is_recent=not is_long_term
+            )
+
+
+def run_corpus(size, turns, vector_backend, fake_models, context_cache=False, seed=0):
+    """Benchmark chat() turns against a temporary database holding size stored messages.
+
+    context_cache=True sends the stable prompt prefix as a cached context of the fake model.
+    """
+    rng = random.Random(seed)
+    with tempfile.TemporaryDirectory() as path:
+        if fake_models:
+            embedding_service = EmbeddingService(model=FakeEmbeddingModel())
+            emotion_detector = FakeEmotionDetector()
+        else:
+            embedding_service = get_embedding_service()
+            emotion_detector = EmotionDetector()
+
+        db = ChatDatabase(
+            os.path.join(path, "chat.db"),
+            embedding_service=embedding_service,
+            vector_store=create_vector_store(vector_backend, os.path.join(path, "vectors"))
+        )
+        personality = DynamicPersonality(os.path.join(path, "personality.db"))
+
+        prefill_start = time.perf_counter()
+        prefill(db, size, rng)
+        prefill_seconds = time.perf_counter() - prefill_start
+
+        # Turns start with a cold embedding cache and fresh counters
+        embedding_service.clear_cache()
+        embedding_service.hits = embedding_service.misses = 0
+
+        llm = FakeGeminiModel(lambda prompt: synthetic_message(rng, 40))
+        bot = EmotionChatbot(
+            model=ContextCachingModel(llm, llm.cache_context) if context_cache else llm,
+            emotion_detector=emotion_detector, db=db, personality=personality
+        )
+
+        # Wrap each pipeline stage on the instances the chatbot uses
+        timer = StageTimer()
+        memory_service = db.memory_service
+        timer.wrap(bot, "detect_emotion", "detect_emotion")
+        timer.wrap(db, "save_message", "save_message_sqlite")
+        timer.wrap(memory_service.recent_memory, "add", "vector_add")
+        timer.wrap(memory_service.long_term_memory, "add", "vector_add")
+        timer.wrap(embedding_service, "encode_batch", "embed")
+        timer.wrap(db, "find_similar_messages", "retrieve")
+        timer.wrap(bot, "build_prompt", "prompt_build")
+        timer.wrap(bot.model, "generate_content", "llm")
+        timer.wrap(personality, "update_from_interaction", "personality_update")
+        timer.wrap(bot, "chat", "total", inclusive=True)
+
+        # chat() prints the detected emotion every turn
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            for _ in range(turns):
+                bot.chat(synthetic_message(rng))
+
+        result = {
+            "corpus_size": size,
+            "turns": turns,
+            "prefill_s": prefill_seconds,
+            "stages": timer.summary(),
+            "embedding_cache": embedding_service.get_stats(),
+            "llm_tokens": llm.get_usage(),
+        }
+
+        bot.close()
+        personality.close()
+        db.close()
+        return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-stage latency of EmotionChatbot.chat() by stored corpus size")
+    parser.add_argument("--sizes", nargs="+", type=int, default=[1000, 10000, 100000])
+    parser.add_argument("--turns", type=int, default=200)
+    parser.add_argument("--vector-store", default="chroma", help="chroma, numpy, numpy16, numpy-int8 or numpy-pq")
+    parser.add_argument("--fake-models", action="store_true",
+                        help="Use hashing stand-ins for the embedding and emotion models")
+    parser.add_argument("--context-cache", action="store_true",
+                        help="Send the stable prompt prefix as a cached context and report billed vs cached tokens")
+    parser.add_argument("--output", help="Write the JSON report to this file")
+    args = parser.parse_args()
+
+    report = {
+        "vector_store": args.vector_store,
+        "fake_models": args.fake_models,
+        "context_cache": args.context_cache,
+        "results": [run_corpus(size, args.turns, args.vector_store, args.fake_models, args.context_cache)
+                    for size in args.sizes],
+    }
+
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,23 +1,116 @@
-import sqlite3
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict, deque
 from datetime import datetime
 from memory_service import EnhancedMemoryService
+from metrics import metrics
+from startup import BackgroundLoader
+from storage import SQLiteStorage
+
+# Secondary indexes for per-conversation history, feedback lookups and the memory lifecycle scans
+INDEX_STATEMENTS = [
+    "CREATE INDEX IF NOT EXISTS idx_messages_conversation ON messages (conversation_id, timestamp)",
+    "CREATE INDEX IF NOT EXISTS idx_messages_tier ON messages (is_long_term, is_evicted, id)",
+    "CREATE INDEX IF NOT EXISTS idx_feedback_message ON message_feedback (message_id)",
+    "CREATE INDEX IF NOT EXISTS idx_summaries_conversation ON conversation_summaries (conversation_id)",
+    "CREATE INDEX IF NOT EXISTS idx_conversations_context ON conversations (conversation_context, id)",
+]
+
+logger = logging.getLogger(__name__)
+
+# Longest wait between attempts to write a batch that failed
+MAX_RETRY_DELAY = 30.0
+# Attempts close() gives a failing batch before giving up
+CLOSE_ATTEMPTS = 3
+
 
 class ChatDatabase:
-    def __init__(self, db_path="emotion_chat_memory.db"):
-        """Initialize database with enhanced memory service."""
-        # SQLite connection
+    def __init__(self, db_path="emotion_chat_memory.db", embedding_service=None,
+                 write_behind=False, flush_size=32, flush_interval=0.5, vector_store=None, reader_pool_size=4,
+                 recent_turns=20, max_cached_conversations=1024):
+        """Initialize database with enhanced memory service.
+
+        With write_behind=True, save_message only queues the message and a
+        background worker group-commits queued messages to SQLite and Chroma
+        once flush_size messages are pending or flush_interval seconds pass.
+        Message ids are reserved from SQLite in blocks of flush_size, so other
+        writers on the same database never take them. A batch that fails to
+        write stays queued and is retried with backoff; flush() and close()
+        raise the last failure.
+        SQLite runs in WAL mode with one writer and up to reader_pool_size readers.
+
+        The last recent_turns messages of up to max_cached_conversations conversations
+        are kept in memory for get_recent_turns.
+        """
+        # SQLite storage
         self.db_path = db_path
-        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.storage = SQLiteStorage(db_path, pool_size=reader_pool_size)
 
-        # Enhanced memory service
-        self.memory_service = EnhancedMemoryService()
+        # Enhanced memory service, loaded in the background so SQLite is usable immediately
+        self._memory_service_loader = BackgroundLoader(
+            "memory_service",
+            lambda: EnhancedMemoryService(embedding_service=embedding_service, vector_store=vector_store)
+        )
 
         # Create tables
         self.create_tables()
 
+        # Per-conversation ring buffers of (id, role, content, emotion), least recently used first
+        self.recent_turns = recent_turns
+        self.max_cached_conversations = max_cached_conversations
+        self._recent = OrderedDict()
+        self._recent_lock = threading.Lock()
+
+        # Write-behind queue
+        self.write_behind = write_behind
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self._pending = []
+        self._in_flight = []
+        self._queue_cond = threading.Condition()
+        self._closing = False
+        self._flush_requested = False
+        self._flush_error = None
+        self._flush_failures = 0
+        self._reserved_ids = iter(())
+        self._worker = None
+
+        if self.write_behind:
+            self._worker = threading.Thread(target=self._write_behind_loop, name="chat-db-writer", daemon=True)
+            self._worker.start()
+            metrics.register_gauge("chatbot_write_behind_pending", self.get_pending_count,
+                                   "Messages queued for the write-behind worker", db=self.storage.name)
+
+    @property
+    def memory_service(self):
+        """Vector memory service, waiting for it to finish loading if needed."""
+        return self._memory_service_loader.get()
+
     def create_tables(self):
-        """Create database tables."""
-        cursor = self.conn.cursor()
+        """Create or upgrade the database schema."""
+        self.migrate_schema(self.storage)
+
+    @classmethod
+    def migrate_schema(cls, storage):
+        """Create or upgrade the chat schema on a SQLiteStorage and return its version.
+
+        For tools that open the database file without a ChatDatabase.
+        """
+        return storage.migrate([
+            cls._create_base_schema,
+            cls._create_indexes,
+            # Schema version 3: summaries whose vectors were evicted to respect the long-term cap
+            "ALTER TABLE conversation_summaries ADD COLUMN is_evicted INTEGER DEFAULT 0",
+            # Schema version 4: resuming a user's latest conversation by its context
+            "CREATE INDEX IF NOT EXISTS idx_conversations_context ON conversations (conversation_context, id)",
+        ])
+
+    @staticmethod
+    def _create_base_schema(conn):
+        """Schema version 1: the tables, including columns older databases lack."""
+        cursor = conn.cursor()
 
         # Conversations table (modified to include conversation_context)
         cursor.execute('''
@@ -55,80 +148,468 @@ class ChatDatabase:
         )
         ''')
 
-        self.conn.commit()
+        # Consolidated summaries of evicted messages
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS conversation_summaries (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            conversation_id INTEGER NOT NULL,
+            summary TEXT NOT NULL,
+            first_message_id INTEGER NOT NULL,
+            last_message_id INTEGER NOT NULL,
+            created_at TIMESTAMP NOT NULL,
+            FOREIGN KEY (conversation_id) REFERENCES conversations (id)
+        )
+        ''')
+
+        # Older databases lack the eviction flag and the response style features
+        cursor.execute("PRAGMA table_info(messages)")
+        columns = [row[1] for row in cursor.fetchall()]
+        if "is_evicted" not in columns:
+            cursor.execute("ALTER TABLE messages ADD COLUMN is_evicted INTEGER DEFAULT 0")
+        if "features" not in columns:
+            cursor.execute("ALTER TABLE messages ADD COLUMN features TEXT")
+
+    @staticmethod
+    def _create_indexes(conn):
+        """Schema version 2: secondary indexes."""
+        for statement in INDEX_STATEMENTS:
+            conn.execute(statement)
 
     def create_conversation(self, context=None):
         """Create a new conversation with optional context."""
-        cursor = self.conn.cursor()
-        cursor.execute(
-            "INSERT INTO conversations (created_at, conversation_context) VALUES (?, ?)",
-            (datetime.now(), context or '')
-        )
-        self.conn.commit()
-        return cursor.lastrowid
-
-    def save_message(self, conversation_id, role, content, emotion, emotion_confidence, is_long_term=False):
-        """Save message with option to mark as long-term memory."""
-        cursor = self.conn.cursor()
-        cursor.execute(
-            "INSERT INTO messages (conversation_id, role, content, emotion, emotion_confidence, timestamp, is_long_term) VALUES (?, ?, ?, ?, ?, ?, ?)",
-            (conversation_id, role, content, emotion, emotion_confidence, datetime.now(), int(is_long_term))
-        )
-        message_id = cursor.lastrowid
-        self.conn.commit()
+        with self.storage.write() as conn:
+            cursor = conn.execute(
+                "INSERT INTO conversations (created_at, conversation_context) VALUES (?, ?)",
+                (datetime.now(), context or '')
+            )
+            conversation_id = cursor.lastrowid
+
+        # A new conversation has no turns to load
+        with self._recent_lock:
+            self._cache_turns(conversation_id, [])
+        return conversation_id
+
+    def save_message(self, conversation_id, role, content, emotion, emotion_confidence, is_long_term=False,
+                     features=None):
+        """Save message with option to mark as long-term memory.
+
+        features is an optional dict of response style features stored with the message.
+        """
+        features_json = json.dumps(features) if features is not None else None
+        if self.write_behind:
+            message_id = self._enqueue_message(conversation_id, role, content, emotion, emotion_confidence,
+                                               is_long_term, features_json)
+            self._remember_turn(conversation_id, message_id, role, content, emotion)
+            return message_id
+
+        with self.storage.write() as conn:
+            cursor = conn.execute(
+                "INSERT INTO messages (conversation_id, role, content, emotion, emotion_confidence, timestamp, is_long_term, features) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (conversation_id, role, content, emotion, emotion_confidence, datetime.now(), int(is_long_term),
+                 features_json)
+            )
+            message_id = cursor.lastrowid
+        self._remember_turn(conversation_id, message_id, role, content, emotion)
 
         # Store in vector memory
         self.memory_service.store_message(
             message_id,
             content,
-            metadata={
-                'role': role,
-                'emotion': emotion,
-                'emotion_confidence': emotion_confidence,
-                'conversation_id': conversation_id
-            },
+            metadata=self.message_metadata(role, emotion, emotion_confidence, conversation_id),
             is_recent=not is_long_term
         )
 
         return message_id
 
+    def _cache_turns(self, conversation_id, turns):
+        """Start a conversation's ring buffer, evicting the least recently used one if full."""
+        buffer = deque(turns, maxlen=self.recent_turns)
+        self._recent[conversation_id] = buffer
+        while len(self._recent) > self.max_cached_conversations:
+            self._recent.popitem(last=False)
+        return buffer
+
+    def _remember_turn(self, conversation_id, message_id, role, content, emotion):
+        """Append a saved message to its conversation's ring buffer if that is cached."""
+        with self._recent_lock:
+            buffer = self._recent.get(conversation_id)
+            # Uncached conversations pick the message up when they are rehydrated
+            if buffer is not None and all(turn[0] != message_id for turn in buffer):
+                buffer.append((message_id, role, content, emotion))
+
+    def get_recent_turns(self, conversation_id, limit=None):
+        """Return the last (id, role, content, emotion) turns of a conversation, oldest first.
+
+        Served from the in-memory ring buffer; a conversation that is not cached is
+        loaded with one indexed query (plus any messages still queued for writing).
+        """
+        with self._recent_lock:
+            buffer = self._recent.get(conversation_id)
+            if buffer is None:
+                buffer = self._cache_turns(conversation_id, self._load_recent_turns(conversation_id))
+            else:
+                self._recent.move_to_end(conversation_id)
+            turns = list(buffer)
+        return turns[-limit:] if limit else turns
+
+    def _load_recent_turns(self, conversation_id):
+        """Read a conversation's last turns from SQLite and the write-behind queue."""
+        with self.storage.read() as conn:
+            rows = conn.execute(
+                "SELECT id, role, content, emotion FROM messages WHERE conversation_id = ? "
+                "ORDER BY timestamp DESC, id DESC LIMIT ?",
+                (conversation_id, self.recent_turns)
+            ).fetchall()
+
+        turns = {row[0]: tuple(row) for row in rows}
+        if self.write_behind:
+            with self._queue_cond:
+                for row in self._in_flight + self._pending:
+                    if row[1] == conversation_id:
+                        turns[row[0]] = (row[0], row[2], row[3], row[4])
+        return [turns[message_id] for message_id in sorted(turns)][-self.recent_turns:]
+
+    @staticmethod
+    def message_metadata(role, emotion, emotion_confidence, conversation_id):
+        """Build the vector-memory metadata for a message."""
+        return {
+            'role': role,
+            'emotion': emotion,
+            'emotion_confidence': emotion_confidence,
+            'conversation_id': conversation_id
+        }
+
+    def reserve_message_ids(self, count, conn=None):
+        """Reserve count consecutive message ids and return the first.
+
+        The messages AUTOINCREMENT sequence is advanced past the block inside a
+        write transaction (conn's, if given), so neither plain inserts nor other
+        reservations, in this process or another, can take the same ids.
+        """
+        if conn is None:
+            with self.storage.write() as conn:
+                return self.reserve_message_ids(count, conn)
+
+        last_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM messages").fetchone()[0]
+        result = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'messages'").fetchone()
+        first_id = max(last_id, result[0] if result else 0) + 1
+        if result:
+            conn.execute("UPDATE sqlite_sequence SET seq = ? WHERE name = 'messages'", (first_id + count - 1,))
+        else:
+            conn.execute("INSERT INTO sqlite_sequence (name, seq) VALUES ('messages', ?)", (first_id + count - 1,))
+        return first_id
+
+    def insert_messages(self, messages, conn=None):
+        """Bulk-insert messages under a freshly reserved block of ids.
+
+        messages are (conversation_id, role, content, emotion, emotion_confidence,
+        timestamp, is_long_term, features) tuples, written with one executemany in
+        conn's transaction if given. Returns the rows with their ids prepended,
+        ready for store_message_vectors.
+        """
+        if conn is None:
+            with self.storage.write() as conn:
+                return self.insert_messages(messages, conn)
+
+        messages = list(messages)
+        if not messages:
+            return []
+        first_id = self.reserve_message_ids(len(messages), conn)
+        rows = [(first_id + offset, *message) for offset, message in enumerate(messages)]
+        conn.executemany(
+            "INSERT INTO messages (id, conversation_id, role, content, emotion, emotion_confidence, timestamp, is_long_term, features) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            rows
+        )
+        return rows
+
+    def store_message_vectors(self, rows, batch_size=32):
+        """Add message rows (as returned by insert_messages) to vector memory with one add per tier."""
+        recent, long_term = [], []
+        for message_id, conversation_id, role, content, emotion, confidence, _, is_long_term, _ in rows:
+            entry = (message_id, content, self.message_metadata(role, emotion, confidence, conversation_id))
+            (long_term if is_long_term else recent).append(entry)
+
+        self.memory_service.store_messages(recent, is_recent=True, batch_size=batch_size)
+        self.memory_service.store_messages(long_term, is_recent=False, batch_size=batch_size)
+
+    def _enqueue_message(self, conversation_id, role, content, emotion, emotion_confidence, is_long_term,
+                         features_json=None):
+        """Queue a message for the write-behind worker and return its id immediately."""
+        with self._queue_cond:
+            if self._closing:
+                raise RuntimeError("ChatDatabase is closed")
+            message_id = next(self._reserved_ids, None)
+            if message_id is None:
+                first_id = self.reserve_message_ids(self.flush_size)
+                self._reserved_ids = iter(range(first_id + 1, first_id + self.flush_size))
+                message_id = first_id
+            self._pending.append((
+                message_id, conversation_id, role, content, emotion,
+                emotion_confidence, datetime.now(), int(is_long_term), features_json
+            ))
+            if len(self._pending) >= self.flush_size:
+                self._queue_cond.notify_all()
+        return message_id
+
+    def _write_behind_loop(self):
+        """Background worker that group-commits queued messages, retrying failed batches."""
+        retry_delay = 0.0
+        closing_failures = 0
+        while True:
+            with self._queue_cond:
+                # After a failure wait out the backoff even if the queue is full (briefly when closing)
+                delay = min(retry_delay, self.flush_interval) if self._closing else retry_delay
+                deadline = time.monotonic() + (delay or self.flush_interval)
+                while (not self._flush_requested
+                       and (delay or (not self._closing and len(self._pending) < self.flush_size))):
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._queue_cond.wait(remaining)
+
+                if not self._pending:
+                    self._flush_requested = False
+                    if self._closing:
+                        return
+                    continue
+
+                batch, self._pending = self._pending, []
+                self._flush_requested = False
+                self._in_flight = batch
+
+            try:
+                self._write_batch(batch, retry=retry_delay > 0)
+            except Exception as e:
+                logger.warning("Write-behind flush of %d messages failed: %s", len(batch), e)
+                with self._queue_cond:
+                    # Keep the batch, ahead of anything queued since, for the next attempt
+                    self._pending = batch + self._pending
+                    self._in_flight = []
+                    self._flush_error = e
+                    self._flush_failures += 1
+                    self._queue_cond.notify_all()
+                    if self._closing:
+                        closing_failures += 1
+                        if closing_failures >= CLOSE_ATTEMPTS:
+                            return
+                retry_delay = min(max(retry_delay * 2, self.flush_interval), MAX_RETRY_DELAY)
+            else:
+                retry_delay = 0.0
+                with self._queue_cond:
+                    self._in_flight = []
+                    self._flush_error = None
+                    self._queue_cond.notify_all()
+
+    def _write_batch(self, batch, retry=False):
+        """Write a batch with one executemany/commit and one add per memory tier.
+
+        Writes are idempotent: the ids are reserved for this database, so a retry
+        replaces rows and vectors an earlier partial attempt left behind.
+        """
+        with self.storage.write() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO messages (id, conversation_id, role, content, emotion, emotion_confidence, timestamp, is_long_term, features) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                batch
+            )
+
+        if retry:
+            message_ids = [row[0] for row in batch]
+            self.memory_service.delete_messages(message_ids, is_recent=True)
+            self.memory_service.delete_messages(message_ids, is_recent=False)
+
+        self.store_message_vectors(batch)
+
+    def flush(self, timeout=None):
+        """Block until every queued message is durable in SQLite and Chroma.
+
+        Raises the write error if an attempt fails meanwhile; the messages stay
+        queued and are retried.
+        """
+        if not self.write_behind:
+            return True
+
+        with self._queue_cond:
+            failures = self._flush_failures
+            self._flush_requested = True
+            self._queue_cond.notify_all()
+            finished = self._queue_cond.wait_for(
+                lambda: (not self._pending and not self._in_flight) or self._flush_failures > failures, timeout
+            )
+            if self._flush_error is not None and (self._pending or self._in_flight):
+                raise self._flush_error
+        return finished
+
+    def get_pending_count(self):
+        """Return the number of messages not yet written."""
+        with self._queue_cond:
+            return len(self._pending) + len(self._in_flight)
+
+    def get_message(self, message_id):
+        """Return (content, emotion, emotion_confidence) for a message, including queued ones."""
+        if self.write_behind:
+            with self._queue_cond:
+                for row in self._pending + self._in_flight:
+                    if row[0] == message_id:
+                        return row[3], row[4], row[5]
+
+        with self.storage.read() as conn:
+            return conn.execute("SELECT content, emotion, emotion_confidence FROM messages WHERE id = ?",
+                                (message_id,)).fetchone()
+
+    def get_message_features(self, message_id):
+        """Return the stored style features of a message, or None if none were saved."""
+        if self.write_behind:
+            with self._queue_cond:
+                for row in self._pending + self._in_flight:
+                    if row[0] == message_id:
+                        return json.loads(row[8]) if row[8] else None
+
+        with self.storage.read() as conn:
+            result = conn.execute("SELECT features FROM messages WHERE id = ?", (message_id,)).fetchone()
+        return json.loads(result[0]) if result and result[0] else None
+
     def save_feedback(self, message_id, feedback_score, feedback_text=None):
         """Save user feedback for a message."""
-        cursor = self.conn.cursor()
-        cursor.execute(
-            "INSERT INTO message_feedback (message_id, feedback_score, feedback_text, timestamp) VALUES (?, ?, ?, ?)",
-            (message_id, feedback_score, feedback_text or '', datetime.now())
-        )
-        self.conn.commit()
-        return cursor.lastrowid
+        with self.storage.write() as conn:
+            cursor = conn.execute(
+                "INSERT INTO message_feedback (message_id, feedback_score, feedback_text, timestamp) VALUES (?, ?, ?, ?)",
+                (message_id, feedback_score, feedback_text or '', datetime.now())
+            )
+            return cursor.lastrowid
 
     def get_conversation_context(self, conversation_id):
         """Retrieve conversation context."""
-        cursor = self.conn.cursor()
-        cursor.execute("SELECT conversation_context FROM conversations WHERE id = ?", (conversation_id,))
-        result = cursor.fetchone()
+        with self.storage.read() as conn:
+            result = conn.execute("SELECT conversation_context FROM conversations WHERE id = ?",
+                                  (conversation_id,)).fetchone()
         return result[0] if result else None
 
-    def find_similar_messages(self, query_text, include_long_term=True):
-        """Find similar messages using enhanced memory service."""
+    def get_latest_conversation(self, context):
+        """Return the id of the newest conversation with exactly this context, or None."""
+        with self.storage.read() as conn:
+            result = conn.execute(
+                "SELECT id FROM conversations WHERE conversation_context = ? ORDER BY id DESC LIMIT 1",
+                (context,)
+            ).fetchone()
+        return result[0] if result else None
+
+    def get_promotion_candidates(self, older_than=None, keep_recent=None, limit=1000):
+        """Return ids of recent-tier messages older than a cutoff or beyond the newest keep_recent."""
+        conditions = []
+        params = []
+        if older_than is not None:
+            conditions.append("timestamp < ?")
+            params.append(older_than)
+        if keep_recent is not None:
+            conditions.append(
+                "id NOT IN (SELECT id FROM messages WHERE is_long_term = 0 AND is_evicted = 0 ORDER BY id DESC LIMIT ?)"
+            )
+            params.append(keep_recent)
+        if not conditions:
+            return []
+
+        with self.storage.read() as conn:
+            cursor = conn.execute(
+                "SELECT id FROM messages WHERE is_long_term = 0 AND is_evicted = 0 AND ({}) ORDER BY id LIMIT ?".format(
+                    " OR ".join(conditions)
+                ),
+                params + [limit]
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+    def mark_long_term(self, message_ids):
+        """Flag messages as moved to long-term memory."""
+        with self.storage.write() as conn:
+            conn.executemany("UPDATE messages SET is_long_term = 1 WHERE id = ?",
+                             [(message_id,) for message_id in message_ids])
+
+    def get_long_term_count(self):
+        """Return the number of long-term vectors: live long-term messages plus live summaries."""
+        with self.storage.read() as conn:
+            messages = conn.execute(
+                "SELECT COUNT(*) FROM messages WHERE is_long_term = 1 AND is_evicted = 0"
+            ).fetchone()[0]
+            summaries = conn.execute("SELECT COUNT(*) FROM conversation_summaries WHERE is_evicted = 0").fetchone()[0]
+        return messages + summaries
+
+    def get_eviction_candidates(self, max_long_term, limit=1000):
+        """Return the oldest long-term messages beyond the max_long_term cap (summaries count toward it)."""
+        excess = self.get_long_term_count() - max_long_term
+        if excess <= 0:
+            return []
+        with self.storage.read() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                "SELECT id, conversation_id, role, content, emotion FROM messages WHERE is_long_term = 1 AND is_evicted = 0 ORDER BY id LIMIT ?",
+                (min(excess, limit),)
+            )
+            return cursor.fetchall()
+
+    def save_summary(self, conversation_id, summary, message_ids):
+        """Store a conversation summary and flag the summarized messages as evicted."""
+        with self.storage.write() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                "INSERT INTO conversation_summaries (conversation_id, summary, first_message_id, last_message_id, created_at) VALUES (?, ?, ?, ?, ?)",
+                (conversation_id, summary, min(message_ids), max(message_ids), datetime.now())
+            )
+            summary_id = cursor.lastrowid
+            cursor.executemany("UPDATE messages SET is_evicted = 1 WHERE id = ?",
+                               [(message_id,) for message_id in message_ids])
+            return summary_id
+
+    def get_summary_eviction_candidates(self, limit):
+        """Return the row ids of the oldest summaries whose vectors are still stored."""
+        with self.storage.read() as conn:
+            rows = conn.execute(
+                "SELECT id FROM conversation_summaries WHERE is_evicted = 0 ORDER BY id LIMIT ?", (limit,)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def mark_summaries_evicted(self, summary_ids):
+        """Flag summaries whose vectors were removed; their text stays in SQLite."""
+        with self.storage.write() as conn:
+            conn.executemany("UPDATE conversation_summaries SET is_evicted = 1 WHERE id = ?",
+                             [(row_id,) for row_id in summary_ids])
+
+    def find_similar_messages(self, query_text, include_long_term=True, top_k=10, min_similarity=None,
+                              exclude_ids=None, conversation_id=None, role=None, emotion=None):
+        """Find similar messages using enhanced memory service, best match first."""
         # Retrieve similar messages
         similar_messages = self.memory_service.retrieve_similar_messages(
             query_text,
-            include_long_term=include_long_term
+            top_k=top_k,
+            include_long_term=include_long_term,
+            min_similarity=min_similarity,
+            exclude_ids=exclude_ids,
+            where=self.memory_service.build_where(conversation_id=conversation_id, role=role, emotion=emotion)
         )
 
         # Convert to expected format
         return [
             (
-                message_meta.get('role', 'unknown'),
-                doc,
-                message_meta.get('emotion', 'neutral'),
-                message_meta.get('emotion_confidence', 0.0)
+                message['metadata'].get('role', 'unknown'),
+                message['document'],
+                message['metadata'].get('emotion', 'neutral'),
+                message['metadata'].get('emotion_confidence', 0.0)
             )
-            for doc, message_meta in similar_messages
+            for message in similar_messages
         ]
 
     def close(self):
         """Close database connection."""
-        if self.conn:
-            self.conn.close()
\ No newline at end of file
+        # Durability barrier: drain the write-behind queue before closing
+        error = None
+        if self._worker is not None:
+            with self._queue_cond:
+                self._closing = True
+                self._queue_cond.notify_all()
+            self._worker.join()
+            self._worker = None
+            if self._pending:
+                error = self._flush_error
+                logger.error("Closing with %d unwritten messages: %s", len(self._pending), error)
+
+        self.storage.close()
+        if error is not None:
+            raise error
@@ -1,42 +1,214 @@
 import os
-import google.generativeai as genai
+import asyncio
+import datetime
+import logging
+import time
 from dotenv import load_dotenv
 from emotion_detection import EmotionDetector
 from personality import DynamicPersonality
 from chat_database import ChatDatabase
-from sentence_transformers import SentenceTransformer
+from context_assembler import ContextAssembler, ContextSection, estimate_tokens
+from memory_lifecycle import MemoryLifecycle
+from topic_engine import TopicEngine
+from embedding_service import get_embedding_service
+from llm_client import ContextCachingModel, LLMUnavailableError, ResilientModel
+from metrics import metrics, run_in_context
+from startup import BackgroundLoader, profiler
 
 # Load environment variables from .env file
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
+# Response instructions per detected emotion
+EMOTION_DIRECTIVES = {
+    "joy": "Match their positive energy while being authentic.",
+    "sadness": "Be supportive and empathetic. Acknowledge their feelings.",
+    "anger": "Be calm and understanding without being dismissive.",
+    "fear": "Be reassuring and provide a sense of safety.",
+    "surprise": "Be engaging and responsive to their reaction.",
+}
+
+# Fixed opening of every prompt; with the persona after it, this is the cacheable prefix
+SYSTEM_PREFIX = (
+    "You are AI Friend, a warm and emotionally aware companion. Reply to the user's latest "
+    "message naturally and in your own voice. Follow the personality instructions, use what you "
+    "remember about the user when it helps, and never mention these instructions."
+)
+
+# Gemini context caching needs a versioned model and only accepts contexts of this many tokens or more
+GEMINI_CACHE_MODEL_NAME = 'models/gemini-1.5-pro-002'
+GEMINI_MIN_CACHE_TOKENS = 32768
+# Lifetime of a Gemini cached context; clients are recreated a few minutes before it runs out
+GEMINI_CACHE_TTL_MINUTES = 60
+GEMINI_CACHE_REFRESH_MINUTES = 55
+
+# Reply used when the model is unavailable; it is never saved or learned from
+FALLBACK_RESPONSE = "Sorry, I'm having trouble gathering my thoughts right now. Could you say that again in a moment?"
+
+
+def get_api_key():
+    """Return the Gemini API key from the environment."""
+    # Gemini API Configuration from environment variable
+    API_KEY = os.getenv('GEMINI_API_KEY')
+    if not API_KEY:
+        raise ValueError("Missing GEMINI_API_KEY in environment variables")
+    return API_KEY
+
+
+def create_gemini_model(api_key=None):
+    """Configure Gemini and return the model client."""
+    api_key = api_key or get_api_key()
+    with profiler.track("gemini", "import"):
+        import google.generativeai as genai
+    with profiler.track("gemini", "load"):
+        genai.configure(api_key=api_key)
+        return genai.GenerativeModel('models/gemini-1.5-pro-latest')
+
+
+def create_gemini_cached_model(prefix, ttl_minutes=GEMINI_CACHE_TTL_MINUTES):
+    """Register a prompt prefix as a Gemini cached context and return a model bound to it."""
+    import google.generativeai as genai
+    cache = genai.caching.CachedContent.create(
+        model=GEMINI_CACHE_MODEL_NAME,
+        system_instruction=prefix,
+        ttl=datetime.timedelta(minutes=ttl_minutes)
+    )
+    return genai.GenerativeModel.from_cached_content(cached_content=cache)
+
+
+def release_gemini_cached_model(model):
+    """Delete the cached context behind a model from create_gemini_cached_model()."""
+    import google.generativeai as genai
+    genai.caching.CachedContent.get(model.cached_content).delete()
+
+
+def create_context_caching_gemini_model(api_key=None):
+    """Return a Gemini client that sends the stable prompt prefix as a cached context."""
+    return ContextCachingModel(
+        create_gemini_model(api_key),
+        create_gemini_cached_model,
+        release_gemini_cached_model,
+        min_prefix_tokens=GEMINI_MIN_CACHE_TOKENS,
+        ttl=GEMINI_CACHE_REFRESH_MINUTES * 60
+    )
 
-class EmotionChatbot:
-    def __init__(self):
-        """Initialize the chatbot with enhanced memory and dynamic personality."""
-        # Gemini API Configuration from environment variable
-        API_KEY = os.getenv('GEMINI_API_KEY')
-        if not API_KEY:
-            raise ValueError("Missing GEMINI_API_KEY in environment variables")
 
-        genai.configure(api_key=API_KEY)
-        self.model = genai.GenerativeModel('models/gemini-1.5-pro-latest')
+class EmotionChatbot:
+    def __init__(self, write_behind=False, model=None, emotion_detector=None, db=None,
+                 personality=None, conversation_id=None, memory_lifecycle=False, token_budget=3000,
+                 topic_embeddings=False, response_cache=None, context_caching=False):
+        """Initialize the chatbot with enhanced memory and dynamic personality.
+
+        model can be any client with a Gemini-style generate_content(prompt, stream=...)
+        (e.g. fake_llm.FakeGeminiModel); by default Gemini is configured from the environment.
+        It is wrapped in a llm_client.ResilientModel unless it already is one; when the
+        model is unavailable the chatbot replies with FALLBACK_RESPONSE.
+        context_caching=True registers the default Gemini model's stable prompt prefix
+        as a cached context (a passed model can be wrapped in llm_client.ContextCachingModel).
+        Gemini only caches contexts of GEMINI_MIN_CACHE_TOKENS or more, so this needs a
+        token_budget at least that large; a warning is logged otherwise.
+        Passing emotion_detector, db or personality shares those components with other
+        chatbots (see server.py); shared components are not closed by close().
+        memory_lifecycle=True runs a MemoryLifecycle on the chatbot's own database.
+        topic_embeddings=True adds embedding-based topic classification to the personality.
+        response_cache (a response_cache.ResponseCache, possibly shared) answers short
+        turns similar to an earlier one from the same user without calling the model.
+
+        Models that are not passed in load on background threads, so the chatbot is
+        usable immediately and each stage only waits for the components it needs.
+        """
+        # Gemini client (the API key is checked up front)
+        self._owns_model = not isinstance(model, ResilientModel)
+        if model is None:
+            api_key = get_api_key()
+            if context_caching and token_budget < GEMINI_MIN_CACHE_TOKENS:
+                logger.warning("Context caching has no effect with a %d-token prompt budget: Gemini only caches "
+                               "prefixes of %d tokens or more", token_budget, GEMINI_MIN_CACHE_TOKENS)
+            create_model = create_context_caching_gemini_model if context_caching else create_gemini_model
+            self._model_loader = BackgroundLoader("gemini", lambda: ResilientModel(create_model(api_key)))
+        else:
+            self._model_loader = BackgroundLoader.ready(model if not self._owns_model else ResilientModel(model))
+        self.fallback_response = FALLBACK_RESPONSE
 
         # Emotion detection
-        self.emotion_detector = EmotionDetector()
-
-        # Initialize services
-        self.db = ChatDatabase()
-        self.embedding_service = SentenceTransformer("all-MiniLM-L6-v2")
+        if emotion_detector is None:
+            self._emotion_detector_loader = BackgroundLoader("emotion_detector", EmotionDetector)
+        else:
+            self._emotion_detector_loader = BackgroundLoader.ready(emotion_detector)
+
+        # Initialize services (one shared embedding model for the whole process, warmed
+        # up in parallel with the Chroma client that the database loads)
+        self._owns_db = db is None
+        if db is None:
+            BackgroundLoader("embedding_service", get_embedding_service)
+        self.db = db or ChatDatabase(write_behind=write_behind)
+
+        # Retrieval settings for past messages in the prompt
+        self.memory_top_k = 10
+        self.memory_min_similarity = 0.25
+
+        # Number of the conversation's latest turns always included in the prompt
+        self.recent_turn_count = 6
+
+        # Token-budgeted prompt assembly; last_prompt_report holds per-section token counts
+        self.context_assembler = ContextAssembler(token_budget)
+        self.last_prompt_report = None
+        self._trait_directives_key = None
+        self._trait_directives = []
+
+        # Keep the vector memory tiers bounded in the background
+        self.memory_lifecycle = None
+        if memory_lifecycle and self._owns_db:
+            self.memory_lifecycle = MemoryLifecycle(self.db)
+            self.memory_lifecycle.start()
 
         # Initialize dynamic personality system
-        self.personality = DynamicPersonality()
+        self._owns_personality = personality is None
+        self.personality = personality or DynamicPersonality(
+            topic_engine=TopicEngine(use_embeddings=True) if topic_embeddings else None
+        )
 
         # Retrieve or create conversation
-        self.conversation_id = self.get_or_create_conversation()
+        self.conversation_id = conversation_id or self.get_or_create_conversation()
+
+        # Semantic cache of replies to short repeated turns (opt-in)
+        self.response_cache = response_cache
 
         # Track last response for feedback
         self.last_response_id = None
 
+        # Seconds from sending the prompt to the first streamed chunk
+        self.last_time_to_first_token = None
+
+        # Post-response bookkeeping still running from the previous achat() turn
+        self._pending_bookkeeping = None
+
+    @property
+    def model(self):
+        """Gemini client, waiting for it to load if needed."""
+        return self._model_loader.get()
+
+    @property
+    def emotion_detector(self):
+        """Emotion detector, waiting for it to load if needed."""
+        return self._emotion_detector_loader.get()
+
+    @property
+    def embedding_service(self):
+        """Shared embedding service used by the memory service."""
+        return self.db.memory_service.embedding_service
+
+    def encode_message(self, text):
+        """Embed a message with the shared embedding service, waiting for it to load if needed."""
+        return self.embedding_service.encode(text)
+
+    def wait_until_ready(self, timeout=None):
+        """Block until every background component has loaded."""
+        self._model_loader.get(timeout)
+        self._emotion_detector_loader.get(timeout)
+        self.db.memory_service
+
     # Rest of the class remains the same
     def get_or_create_conversation(self, context=None):
         """Retrieve latest conversation or create new one."""
@@ -44,90 +216,291 @@ class EmotionChatbot:
 
     def detect_emotion(self, text):
         """Detects emotion from input text."""
-        return self.emotion_detector.detect_emotion(text)
-
-    def prepare_context(self, user_message, user_emotion):
-        """Prepare conversation context with similar past messages and personality."""
-        # Find similar past messages
-        similar_messages = self.db.find_similar_messages(user_message)
-
-        # Build context string
-        context = "Conversation History and Context:\n"
-        for msg_role, msg_content, msg_emotion, msg_emotion_confidence in similar_messages:
-            context += f"{msg_role} (Emotion: {msg_emotion}): {msg_content}\n"
-
-        # Add personality context
-        context += "\n---\nPersonality Instructions:\n"
-        context += self.personality.get_personality_instructions()
-        context += "\n---\n"
+        with metrics.span("detect_emotion"):
+            return self.emotion_detector.detect_emotion(text)
+
+    def prepare_context(self, user_message, user_emotion, exclude_ids=None):
+        """Prepare conversation context sections with personality, similar past messages and recent turns."""
+        with metrics.span("prepare_context"):
+            return self._prepare_context(user_message, user_emotion, exclude_ids)
+
+    def _prepare_context(self, user_message, user_emotion, exclude_ids):
+        # Latest turns of this conversation from the in-memory ring buffer, minus the message being answered
+        excluded = set(exclude_ids or ())
+        recent_turns = [
+            turn for turn in self.db.get_recent_turns(self.conversation_id, self.recent_turn_count + len(excluded))
+            if turn[0] not in excluded
+        ][-self.recent_turn_count:]
+
+        # Find similar past messages, skipping the ones already included as recent turns
+        similar_messages = self.db.find_similar_messages(
+            user_message,
+            top_k=self.memory_top_k,
+            min_similarity=self.memory_min_similarity,
+            exclude_ids=list(excluded) + [turn[0] for turn in recent_turns]
+        )
 
-        return context
+        history = [
+            f"{msg_role} (Emotion: {msg_emotion}): {msg_content}"
+            for msg_role, msg_content, msg_emotion, msg_emotion_confidence in similar_messages
+        ]
+        recent = [
+            f"{msg_role} (Emotion: {msg_emotion}): {msg_content}"
+            for _, msg_role, msg_content, msg_emotion in recent_turns
+        ]
+
+        # Sections are listed in prompt order, persona first so it extends the stable prefix;
+        # priority decides what survives the token budget
+        return [
+            ContextSection(
+                "personality",
+                self.personality.get_personality_instructions().split("\n") + self.get_trait_directives(),
+                priority=0,
+                header="Personality Instructions:",
+                stable=True
+            ),
+            ContextSection("memories", history, priority=2, header="Conversation History and Context:"),
+            ContextSection("recent_turns", recent, priority=1, header="Recent Conversation:", keep="tail"),
+        ]
+
+    def get_trait_directives(self):
+        """Return response directives for the current traits, rebuilt only when a trait bucket changes."""
+        buckets = self.personality.get_trait_buckets()
+        key = tuple(buckets.values())
+        if key == self._trait_directives_key:
+            return self._trait_directives
+
+        directives = []
+
+        if buckets["empathy"] > 0:
+            directives.append("Show deep understanding of their perspective.")
+
+        if buckets["humor"] > 0:
+            directives.append("Use appropriate humor to lighten the mood.")
+
+        if buckets["formality"] < 0:
+            directives.append("Use casual, friendly language.")
+        elif buckets["formality"] > 0:
+            directives.append("Maintain a more professional tone.")
+
+        if buckets["verbosity"] < 0:
+            directives.append("Keep your response concise.")
+        elif buckets["verbosity"] > 0:
+            directives.append("Provide a detailed, thoughtful response.")
+
+        self._trait_directives_key = key
+        self._trait_directives = directives
+        return directives
+
+    def build_prompt(self, question, detected_emotion, context):
+        """Build the personality-infused prompt sent to Gemini within the token budget.
+
+        The layout is system prefix, persona, memories, then the turn itself, so
+        everything that changes per turn comes after the stable prefix.
+        """
+        # Emotion directives for this turn
+        directives = [f"The user is feeling {detected_emotion}."]
+        if detected_emotion in EMOTION_DIRECTIVES:
+            directives.append(EMOTION_DIRECTIVES[detected_emotion])
+
+        sections = [ContextSection("system", [SYSTEM_PREFIX], required=True, stable=True)] + list(context) + [
+            ContextSection("directives", [" ".join(directives)], header="---", required=True),
+            ContextSection("user_turn", [f"User: {question}", "Chatbot:"], required=True),
+        ]
+
+        with metrics.span("prompt_build"):
+            assembled = self.context_assembler.assemble(sections)
+        self.last_prompt_report = assembled.report()
+        return assembled.text
 
     def get_gemini_response(self, question, detected_emotion, context):
-        """Generates response from Gemini model with personality-infused context."""
-        # Create personality-aware prompt
-        prompt = f"{context}\n\n"
-        prompt += f"The user is feeling {detected_emotion}. "
-
-        # Adjust response instructions based on emotion
-        if detected_emotion == "joy":
-            prompt += "Match their positive energy while being authentic. "
-        elif detected_emotion == "sadness":
-            prompt += "Be supportive and empathetic. Acknowledge their feelings. "
-        elif detected_emotion == "anger":
-            prompt += "Be calm and understanding without being dismissive. "
-        elif detected_emotion == "fear":
-            prompt += "Be reassuring and provide a sense of safety. "
-        elif detected_emotion == "surprise":
-            prompt += "Be engaging and responsive to their reaction. "
-
-        # Add personality-specific instructions
-        traits = self.personality.traits
-
-        if traits["empathy"] > 7:
-            prompt += "Show deep understanding of their perspective. "
-
-        if traits["humor"] > 7:
-            prompt += "Use appropriate humor to lighten the mood. "
-
-        if traits["formality"] < 4:
-            prompt += "Use casual, friendly language. "
-        elif traits["formality"] > 7:
-            prompt += "Maintain a more professional tone. "
-
-        if traits["verbosity"] < 4:
-            prompt += "Keep your response concise. "
-        elif traits["verbosity"] > 7:
-            prompt += "Provide a detailed, thoughtful response. "
-
-        prompt += "\n\nUser: " + question + "\nChatbot:"
+        """Generates response from Gemini model with personality-infused context.
 
+        Raises LLMUnavailableError when no reply can be produced, including an empty one.
+        """
+        prompt = self.build_prompt(question, detected_emotion, context)
+
+        try:
+            with metrics.span("llm"):
+                response = self.model.generate_content(prompt)
+            text = response.text
+        except LLMUnavailableError:
+            raise
+        except Exception as e:
+            # e.g. a blocked response whose .text cannot be read
+            raise LLMUnavailableError(f"Model response failed: {e}") from e
+        if not text.strip():
+            raise LLMUnavailableError("Model returned an empty reply")
+        self._record_token_usage(response, text)
+        return text
+
+    def _record_token_usage(self, response, text):
+        """Count prompt and response tokens, preferring the usage Gemini reports."""
+        if not metrics.enabled:
+            return
+        usage = getattr(response, "usage_metadata", None)
+        prompt_tokens = getattr(usage, "prompt_token_count", None) or self.last_prompt_report["total_tokens"]
+        response_tokens = getattr(usage, "candidates_token_count", None) or estimate_tokens(text)
+        metrics.inc("chatbot_prompt_tokens_total", prompt_tokens)
+        metrics.inc("chatbot_response_tokens_total", response_tokens)
+        metrics.inc("chatbot_cached_prompt_tokens_total", getattr(usage, "cached_content_token_count", None) or 0)
+
+    def stream_gemini_response(self, question, detected_emotion, context):
+        """Yield response text chunks from Gemini as they arrive.
+
+        Raises LLMUnavailableError if the stream cannot be started, breaks off or
+        yields no text.
+        """
+        prompt = self.build_prompt(question, detected_emotion, context)
+        self.last_time_to_first_token = None
+        start = time.perf_counter()
+
+        chunk, texts = None, []
         try:
-            response = self.model.generate_content(prompt)
-            return response.text
+            for chunk in self.model.generate_content(prompt, stream=True):
+                text = chunk.text
+                if not text:
+                    continue
+                if self.last_time_to_first_token is None:
+                    self.last_time_to_first_token = time.perf_counter() - start
+                    metrics.observe("chatbot_time_to_first_token_seconds", self.last_time_to_first_token)
+                texts.append(text)
+                yield text
+        except LLMUnavailableError:
+            raise
         except Exception as e:
-            return f"An error occurred: {e}"
+            raise LLMUnavailableError(f"Model stream failed: {e}") from e
+        if not "".join(texts).strip():
+            raise LLMUnavailableError("Model returned an empty reply")
+
+        # The last chunk carries the usage for the whole stream
+        metrics.record_stage("llm", time.perf_counter() - start)
+        self._record_token_usage(chunk, "".join(texts))
 
     def chat(self, user_input):
         """Main chat method with memory, emotion awareness, and personality adaptation."""
-        # Detect emotion
-        emotion, confidence = self.detect_emotion(user_input)
-        print(f"Detected Emotion: {emotion} (Confidence: {confidence:.2f})")
+        with metrics.turn(conversation_id=self.conversation_id, mode="chat"):
+            # Detect emotion
+            emotion, confidence = self.detect_emotion(user_input)
+            print(f"Detected Emotion: {emotion} (Confidence: {confidence:.2f})")
+            metrics.set_turn_field("emotion", emotion)
+
+            # Save user message
+            user_message_id = self.db.save_message(
+                self.conversation_id,
+                "user",
+                user_input,
+                emotion,
+                confidence
+            )
+
+            # Short repeated turns may be answered from the response cache
+            cache_key = self.get_response_cache_key(user_input, emotion)
+            response = self.lookup_cached_response(cache_key)
+
+            if response is None:
+                # Prepare context
+                context = self.prepare_context(user_input, emotion, exclude_ids=[user_message_id])
+
+                # Get AI response with personality influence
+                try:
+                    response = self.get_gemini_response(user_input, emotion, context)
+                except LLMUnavailableError:
+                    return self.use_fallback()
+                self.store_cached_response(cache_key, response)
+
+            # Save AI response and update personality
+            self.record_response(user_input, response, emotion, confidence)
+
+            return response
+
+    def chat_stream(self, user_input):
+        """Streaming version of chat() that yields response chunks as they arrive.
+
+        The complete reply is saved and fed to the personality once the stream ends.
+        The detected emotion is printed before the first chunk is yielded, so callers
+        should print their own reply label after receiving it (see main.py).
+        """
+        with metrics.turn(conversation_id=self.conversation_id, mode="stream"):
+            # Detect emotion
+            emotion, confidence = self.detect_emotion(user_input)
+            print(f"Detected Emotion: {emotion} (Confidence: {confidence:.2f})")
+            metrics.set_turn_field("emotion", emotion)
+
+            # Save user message
+            user_message_id = self.db.save_message(
+                self.conversation_id,
+                "user",
+                user_input,
+                emotion,
+                confidence
+            )
+
+            # A cached reply is sent as a single chunk
+            cache_key = self.get_response_cache_key(user_input, emotion)
+            cached = self.lookup_cached_response(cache_key)
+            if cached is not None:
+                yield cached
+                self.record_response(user_input, cached, emotion, confidence)
+                return
+
+            # Prepare context
+            context = self.prepare_context(user_input, emotion, exclude_ids=[user_message_id])
+
+            # Stream AI response, keeping the chunks for persistence
+            chunks = []
+            try:
+                for chunk in self.stream_gemini_response(user_input, emotion, context):
+                    chunks.append(chunk)
+                    yield chunk
+            except LLMUnavailableError:
+                # A reply cut off part way is not saved either
+                yield ("\n" if chunks else "") + self.use_fallback()
+                return
+            self.store_cached_response(cache_key, "".join(chunks))
+
+            # Save complete AI response and update personality
+            self.record_response(user_input, "".join(chunks), emotion, confidence)
+
+    def get_response_cache_key(self, user_input, emotion):
+        """Return the response cache key of a turn, or None when the turn is not cacheable.
+
+        The key scopes the entry to this user, the detected emotion and the current
+        trait buckets; the embedding is usually already cached from saving the message.
+        """
+        if self.response_cache is None or not self.response_cache.is_cacheable(user_input):
+            return None
+        personality_key = tuple(self.personality.get_trait_buckets().values())
+        return self.personality.user_id, self.encode_message(user_input), emotion, personality_key
+
+    def lookup_cached_response(self, cache_key):
+        """Return a cached reply for the turn, or None."""
+        if cache_key is None:
+            return None
+        with metrics.span("response_cache"):
+            response = self.response_cache.lookup(*cache_key)
+        metrics.set_turn_field("response_cache", "miss" if response is None else "hit")
+        return response
 
-        # Save user message
-        user_message_id = self.db.save_message(
-            self.conversation_id,
-            "user",
-            user_input,
-            emotion,
-            confidence
-        )
+    def store_cached_response(self, cache_key, response):
+        """Cache a model reply for later similar turns."""
+        if cache_key is not None:
+            self.response_cache.store(*cache_key, response)
 
-        # Prepare context
-        context = self.prepare_context(user_input, emotion)
+    def use_fallback(self):
+        """Return the fallback reply for a turn the model could not answer.
 
-        # Get AI response with personality influence
-        response = self.get_gemini_response(user_input, emotion, context)
+        Nothing is saved for the reply, so it never becomes a memory, shapes the
+        personality or receives feedback.
+        """
+        self.last_response_id = None
+        metrics.set_turn_field("fallback", True)
+        return self.fallback_response
+
+    def record_response(self, user_input, response, emotion, confidence):
+        """Save the AI response and update personality based on the interaction."""
+        # Style features are extracted once and stored with the response for later feedback
+        features = self.personality.analyze_response(response)
 
         # Save AI response
         self.last_response_id = self.db.save_message(
@@ -135,16 +508,88 @@ class EmotionChatbot:
             "assistant",
             response,
             emotion,
-            confidence
+            confidence,
+            features=features
         )
 
         # Update personality based on interaction
-        self.personality.update_from_interaction(
-            user_input, response, emotion, confidence
+        with metrics.span("personality_update"):
+            self.personality.update_from_interaction(
+                user_input, response, emotion, confidence
+            )
+
+    async def achat(self, user_input):
+        """Asyncio version of chat() that overlaps independent stages.
+
+        Model work runs in the default executor. Emotion detection overlaps with
+        embedding the user message (which warms the embedding cache for the
+        save and the retrieval), and saving the reply plus the personality
+        update run after the response is returned. The previous turn's
+        bookkeeping is awaited first, so replies match chat().
+        """
+        loop = asyncio.get_running_loop()
+        await self.wait_for_bookkeeping()
+
+        with metrics.turn(conversation_id=self.conversation_id, mode="async"):
+            # Detect emotion while the user message is embedded; the embedding service is
+            # resolved on the executor so a cold start does not block the event loop
+            (emotion, confidence), _ = await asyncio.gather(
+                loop.run_in_executor(None, run_in_context(self.detect_emotion), user_input),
+                loop.run_in_executor(None, run_in_context(self.encode_message), user_input)
+            )
+            logger.info("Detected emotion: %s (confidence %.2f)", emotion, confidence)
+            metrics.set_turn_field("emotion", emotion)
+
+            # Save user message
+            user_message_id = await loop.run_in_executor(
+                None, run_in_context(self.db.save_message),
+                self.conversation_id, "user", user_input, emotion, confidence
+            )
+
+            # Short repeated turns may be answered from the response cache (the embedding is already cached)
+            cache_key = self.get_response_cache_key(user_input, emotion)
+            response = self.lookup_cached_response(cache_key)
+
+            if response is None:
+                # Prepare context
+                context = await loop.run_in_executor(
+                    None, run_in_context(self.prepare_context), user_input, emotion, [user_message_id]
+                )
+
+                # Get AI response with personality influence
+                try:
+                    response = await loop.run_in_executor(
+                        None, run_in_context(self.get_gemini_response), user_input, emotion, context
+                    )
+                except LLMUnavailableError:
+                    return self.use_fallback()
+                self.store_cached_response(cache_key, response)
+
+        # Save AI response and update personality off the critical path
+        self._pending_bookkeeping = loop.run_in_executor(
+            None, self.record_response, user_input, response, emotion, confidence
         )
 
         return response
 
+    async def wait_for_bookkeeping(self):
+        """Wait for post-response bookkeeping from the last achat() turn."""
+        if self._pending_bookkeeping is not None:
+            pending, self._pending_bookkeeping = self._pending_bookkeeping, None
+            await pending
+
+    async def aprovide_feedback(self, feedback_score, feedback_text=None):
+        """Asyncio version of provide_feedback()."""
+        await self.wait_for_bookkeeping()
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self.provide_feedback, feedback_score, feedback_text)
+
+    async def aclose(self):
+        """Wait for pending bookkeeping, then clean up resources off the event loop."""
+        await self.wait_for_bookkeeping()
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self.close)
+
     def provide_feedback(self, feedback_score, feedback_text=None):
         """Allow user to provide feedback on last response."""
         if self.last_response_id:
@@ -152,16 +597,14 @@ class EmotionChatbot:
             self.db.save_feedback(self.last_response_id, feedback_score, feedback_text)
 
             # Get the actual response content for personality updating
-            cursor = self.db.conn.cursor()
-            cursor.execute("SELECT content, emotion, emotion_confidence FROM messages WHERE id = ?",
-                           (self.last_response_id,))
-            result = cursor.fetchone()
+            result = self.db.get_message(self.last_response_id)
 
             if result:
                 content, emotion, confidence = result
-                # Update personality with feedback
+                # Update personality with feedback, reusing the features stored with the response
                 self.personality.update_from_interaction(
-                    "", content, emotion, confidence, feedback_score
+                    "", content, emotion, confidence, feedback_score,
+                    response_features=self.db.get_message_features(self.last_response_id)
                 )
 
             return True
@@ -169,5 +612,14 @@ class EmotionChatbot:
 
     def close(self):
         """Clean up resources."""
-        self.db.close()
-        self.personality.close()
\ No newline at end of file
+        if self.memory_lifecycle is not None:
+            self.memory_lifecycle.stop()
+        if self._owns_db:
+            self.db.close()
+        if self._owns_personality:
+            self.personality.close()
+        if self._owns_model and self._model_loader.is_ready():
+            try:
+                self.model.close()
+            except Exception:
+                pass
\ No newline at end of file
@@ -0,0 +1,187 @@
+from collections import OrderedDict
+
+
+def estimate_tokens(text):
+    """Cheap token estimate (~4 characters per token) used when no tokenizer is given."""
+    return (len(text) + 3) // 4 if text else 0
+
+
+class PromptText(str):
+    """Prompt string that remembers how much of its start is the stable prefix.
+
+    It is an ordinary str to clients that do not care; prefix-caching clients
+    (see llm_client.ContextCachingModel) send prefix once and delta per call.
+    """
+
+    def __new__(cls, text, prefix_length=0):
+        prompt = super().__new__(cls, text)
+        prompt.prefix_length = prefix_length
+        return prompt
+
+    @property
+    def prefix(self):
+        return str(self)[:self.prefix_length]
+
+    @property
+    def delta(self):
+        return str(self)[self.prefix_length:]
+
+
+class ContextSection:
+    def __init__(self, name, items, priority=0, header=None, required=False, stable=False, keep="head"):
+        """One block of the prompt.
+
+        Sections are filled in ascending priority until the token budget runs out.
+        required sections are always included in full. stable sections are cached
+        between turns, and the stable sections at the start of the prompt form its
+        cacheable prefix. keep="head" drops items from the end when truncating,
+        keep="tail" drops the oldest items from the start.
+        """
+        self.name = name
+        self.items = [item for item in items if item]
+        self.priority = priority
+        self.header = header
+        self.required = required
+        self.stable = stable
+        self.keep = keep
+
+
+class AssembledPrompt:
+    def __init__(self, text, section_tokens, dropped_items, token_budget, prefix_tokens=0):
+        """Prompt text (a PromptText) plus per-section token accounting."""
+        self.text = text
+        self.prefix_tokens = prefix_tokens
+        self.section_tokens = section_tokens
+        self.dropped_items = dropped_items
+        self.token_budget = token_budget
+
+    @property
+    def total_tokens(self):
+        return sum(self.section_tokens.values())
+
+    def report(self):
+        """Return the token accounting as a dict."""
+        return {
+            "total_tokens": self.total_tokens,
+            "token_budget": self.token_budget,
+            "prefix_tokens": self.prefix_tokens,
+            "sections": dict(self.section_tokens),
+            "dropped_items": dict(self.dropped_items),
+        }
+
+
+class ContextAssembler:
+    def __init__(self, token_budget=3000, token_counter=None, section_separator="\n\n", cache_size=64):
+        """Assemble prompt sections under a token budget."""
+        self.token_budget = token_budget
+        self.count_tokens = token_counter or estimate_tokens
+        self.section_separator = section_separator
+        self.separator_tokens = self.count_tokens(section_separator)
+
+        # Rendered stable sections: (name, header, items) -> (text, tokens)
+        self.cache_size = cache_size
+        self._stable_cache = OrderedDict()
+
+    def _render(self, section, items):
+        """Render a section's header and items as text."""
+        lines = ([section.header] if section.header else []) + items
+        return "\n".join(lines)
+
+    def _render_full(self, section):
+        """Render a whole section, reusing the cached rendering for stable sections."""
+        if not section.stable:
+            text = self._render(section, section.items)
+            return text, self.count_tokens(text)
+
+        key = (section.name, section.header, tuple(section.items))
+        cached = self._stable_cache.get(key)
+        if cached is None:
+            text = self._render(section, section.items)
+            cached = (text, self.count_tokens(text))
+            self._stable_cache[key] = cached
+            while len(self._stable_cache) > self.cache_size:
+                self._stable_cache.popitem(last=False)
+        else:
+            self._stable_cache.move_to_end(key)
+        return cached
+
+    def _fit(self, section, remaining):
+        """Return the largest prefix (or suffix) of the section's items that fits."""
+        header_tokens = self.count_tokens(section.header + "\n") if section.header else 0
+        budget = remaining - header_tokens
+        ordered = section.items if section.keep == "head" else list(reversed(section.items))
+
+        kept = []
+        for item in ordered:
+            item_tokens = self.count_tokens(item + "\n")
+            if item_tokens <= budget:
+                kept.append(item)
+                budget -= item_tokens
+            else:
+                # Truncate the first item that does not fit if there is room for a useful part
+                if budget > 8:
+                    kept.append(self._truncate(item, budget))
+                break
+
+        if section.keep != "head":
+            kept.reverse()
+        return kept
+
+    def _truncate(self, text, max_tokens):
+        """Cut text down to roughly max_tokens."""
+        low, high = 0, len(text)
+        while low < high:
+            middle = (low + high + 1) // 2
+            if self.count_tokens(text[:middle] + "...") <= max_tokens:
+                low = middle
+            else:
+                high = middle - 1
+        return text[:low].rstrip() + "..."
+
+    def assemble(self, sections):
+        """Fill sections by priority within the budget and render them in the given order."""
+        rendered = {}
+        section_tokens = {}
+        dropped_items = {}
+        remaining = self.token_budget
+
+        # Required sections are always included
+        for section in sections:
+            if section.required:
+                text, tokens = self._render_full(section)
+                rendered[section.name] = text
+                section_tokens[section.name] = tokens
+                remaining -= tokens + self.separator_tokens
+
+        # Optional sections in priority order
+        optional = sorted((section for section in sections if not section.required),
+                          key=lambda section: section.priority)
+        for section in optional:
+            if not section.items:
+                continue
+            text, tokens = self._render_full(section)
+            if tokens + self.separator_tokens > remaining:
+                items = self._fit(section, remaining - self.separator_tokens)
+                dropped_items[section.name] = len(section.items) - len(items)
+                if not items:
+                    continue
+                text = self._render(section, items)
+                tokens = self.count_tokens(text)
+            rendered[section.name] = text
+            section_tokens[section.name] = tokens
+            remaining -= tokens + self.separator_tokens
+
+        included = [section for section in sections if section.name in rendered]
+        text = self.section_separator.join(rendered[section.name] for section in included)
+
+        # Leading stable sections that were included in full, with the separator after them
+        prefix_length, prefix_tokens = 0, 0
+        for section in included:
+            if not section.stable or section.name in dropped_items:
+                break
+            prefix_length += len(rendered[section.name]) + len(self.section_separator)
+            prefix_tokens += section_tokens[section.name] + self.separator_tokens
+        prefix_length = min(prefix_length, len(text))
+
+        return AssembledPrompt(PromptText(text, prefix_length), section_tokens, dropped_items,
+                               self.token_budget, prefix_tokens)
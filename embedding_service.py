@@ -0,0 +1,115 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from metrics import metrics
+from startup import profiler
+
+DEFAULT_MODEL_NAME = "all-MiniLM-L6-v2"
+
+# Process-wide embedding services, one per model name
+_shared_services = {}
+_shared_lock = threading.Lock()
+
+
+class EmbeddingService:
+    def __init__(self, model_name=DEFAULT_MODEL_NAME, cache_size=1024, model=None):
+        """Load the sentence embedding model with a bounded LRU cache.
+
+        model can be any object with SentenceTransformer's encode(texts, batch_size=...)
+        (e.g. fake_llm.FakeEmbeddingModel); by default model_name is loaded.
+        """
+        self.model_name = model_name
+        if model is None:
+            with profiler.track("embedding_service", "import"):
+                from sentence_transformers import SentenceTransformer
+            with profiler.track("embedding_service", "load"):
+                model = SentenceTransformer(model_name)
+        self.model = model
+
+        # LRU cache of content hash -> embedding
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+        # Cache statistics
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def content_key(text):
+        """Hash text content into a cache key."""
+        return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+    def encode(self, text):
+        """Encode a single text, reusing a cached embedding when available."""
+        return self.encode_batch([text])[0]
+
+    def encode_batch(self, texts, batch_size=32):
+        """Encode many texts in one forward pass, skipping cached ones."""
+        keys = [self.content_key(text) for text in texts]
+        results = [None] * len(texts)
+        pending = {}
+
+        with self._lock:
+            for index, key in enumerate(keys):
+                cached = self._cache.get(key)
+                if cached is not None:
+                    self._cache.move_to_end(key)
+                    results[index] = cached
+                    self.hits += 1
+                else:
+                    # Duplicate texts within the batch are encoded once
+                    pending.setdefault(key, []).append(index)
+                    self.misses += 1
+
+        misses = sum(len(indexes) for indexes in pending.values())
+        metrics.inc("chatbot_embedding_cache_hits_total", len(texts) - misses)
+        metrics.inc("chatbot_embedding_cache_misses_total", misses)
+
+        if pending:
+            pending_keys = list(pending)
+            pending_texts = [texts[pending[key][0]] for key in pending_keys]
+            with metrics.span("embed"):
+                embeddings = self.model.encode(pending_texts, batch_size=batch_size)
+
+            with self._lock:
+                for key, embedding in zip(pending_keys, embeddings):
+                    for index in pending[key]:
+                        results[index] = embedding
+                    self._store(key, embedding)
+
+        return results
+
+    def _store(self, key, embedding):
+        """Insert an embedding into the cache, evicting the oldest entries."""
+        self._cache[key] = embedding
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def get_stats(self):
+        """Return cache hit/miss counters."""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "size": len(self._cache),
+                "capacity": self.cache_size,
+            }
+
+    def clear_cache(self):
+        """Drop all cached embeddings."""
+        with self._lock:
+            self._cache.clear()
+
+
+def get_embedding_service(model_name=DEFAULT_MODEL_NAME):
+    """Return the shared embedding service for a model, loading it once."""
+    with _shared_lock:
+        service = _shared_services.get(model_name)
+        if service is None:
+            service = EmbeddingService(model_name)
+            _shared_services[model_name] = service
+        return service
@@ -0,0 +1,120 @@
+import argparse
+import json
+import statistics
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from emotion_detection import EmotionDetector
+
+SAMPLE_TEXTS = [
+    "I just got the job, I can't believe it!",
+    "I miss my grandmother so much today.",
+    "Why does nobody ever listen to me? This is ridiculous.",
+    "I'm really nervous about the exam tomorrow.",
+    "Wow, I did not expect that ending at all.",
+    "I love spending weekends hiking with my friends.",
+    "My code finally compiles after three days.",
+    "I feel so lonely since I moved to this city.",
+    "Stop interrupting me when I'm talking!",
+    "What if the doctor calls with bad news?",
+    "Thanks for listening, that really helped.",
+    "Can you recommend a good book about space?",
+]
+
+
+def load_texts(path):
+    """Read one text per line, or fall back to the built-in samples."""
+    if not path:
+        return SAMPLE_TEXTS
+    with open(path, encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+def time_calls(fn, items):
+    """Call fn on each item and return per-call latencies in milliseconds."""
+    latencies = []
+    for item in items:
+        start = time.perf_counter()
+        fn(item)
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+
+def summarize(latencies):
+    """Return mean/p50/p95 of a latency list."""
+    ordered = sorted(latencies)
+    return {
+        "mean_ms": statistics.mean(ordered),
+        "p50_ms": ordered[len(ordered) // 2],
+        "p95_ms": ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))],
+    }
+
+
+def parity_report(baseline, candidate):
+    """Compare candidate predictions against the full-precision baseline."""
+    agree = sum(1 for (a, _), (b, _) in zip(baseline, candidate) if a == b)
+    score_diffs = [abs(a - b) for (_, a), (_, b) in zip(baseline, candidate)]
+    return {
+        "label_agreement": agree / len(baseline),
+        "mean_abs_score_diff": statistics.mean(score_diffs),
+        "baseline_distribution": dict(Counter(label for label, _ in baseline)),
+        "candidate_distribution": dict(Counter(label for label, _ in candidate)),
+    }
+
+
+def run(texts, repeat=3, batch_size=32, concurrency=8, batch_window=0.01):
+    """Benchmark the baseline, batched, quantized and micro-batched paths."""
+    corpus = texts * repeat
+    baseline = EmotionDetector()
+    quantized = EmotionDetector(quantize=True)
+
+    # Warm up both models
+    baseline.detect_emotion(corpus[0])
+    quantized.detect_emotion(corpus[0])
+
+    report = {"texts": len(corpus)}
+    report["baseline_single"] = summarize(time_calls(baseline.detect_emotion, corpus))
+    report["quantized_single"] = summarize(time_calls(quantized.detect_emotion, corpus))
+
+    for name, detector in (("baseline_batched", baseline), ("quantized_batched", quantized)):
+        start = time.perf_counter()
+        detector.detect_emotions(corpus, batch_size=batch_size)
+        elapsed = time.perf_counter() - start
+        report[name] = {"total_s": elapsed, "per_text_ms": elapsed * 1000 / len(corpus)}
+
+    # Concurrent single-text callers with and without micro-batching
+    batched = EmotionDetector(quantize=True, batch_window=batch_window, max_batch_size=batch_size)
+    for name, detector in (("quantized_concurrent", quantized), ("quantized_microbatched", batched)):
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            list(pool.map(detector.detect_emotion, corpus))
+        elapsed = time.perf_counter() - start
+        report[name] = {"total_s": elapsed, "throughput_per_s": len(corpus) / elapsed}
+    batched.close()
+
+    baseline_predictions = [baseline.detect_emotion(text) for text in texts]
+    report["parity"] = parity_report(baseline_predictions, quantized.detect_emotions(texts))
+    report["speedup_single"] = report["baseline_single"]["mean_ms"] / report["quantized_single"]["mean_ms"]
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Parity and latency benchmark for EmotionDetector backends")
+    parser.add_argument("--input", help="Text file with one message per line (defaults to built-in samples)")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--batch-window", type=float, default=0.01)
+    parser.add_argument("--output", help="Write the JSON report to this file")
+    args = parser.parse_args()
+
+    report = run(load_texts(args.input), args.repeat, args.batch_size, args.concurrency, args.batch_window)
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,128 @@
-from transformers import pipeline
+import threading
+import time
+from concurrent.futures import Future
+from metrics import metrics
+from startup import profiler
+
+# Pipeline arguments shared by the single-text and batched paths, so long inputs
+# are truncated to the model's maximum length and get the same label either way
+PIPELINE_KWARGS = {"truncation": True}
 
 
 class EmotionDetector:
-    def __init__(self, model_name="bhadresh-savani/distilbert-base-uncased-emotion"):
-        """Initialize the emotion detection model."""
-        self.emotion_classifier = pipeline("text-classification", model=model_name)
+    def __init__(self, model_name="bhadresh-savani/distilbert-base-uncased-emotion", quantize=False,
+                 batch_window=None, max_batch_size=32):
+        """Initialize the emotion detection model.
+
+        quantize=True applies dynamic int8 quantization to the model's Linear layers
+        for faster CPU inference. Setting batch_window (seconds) routes detect_emotion
+        calls through a micro-batcher that groups concurrent requests.
+        """
+        self.model_name = model_name
+        self.quantized = quantize
+        with profiler.track("emotion_detector", "import"):
+            from transformers import pipeline
+        with profiler.track("emotion_detector", "load"):
+            self.emotion_classifier = pipeline("text-classification", model=model_name)
+
+        if quantize:
+            self._quantize_model()
+
+        self.batcher = None
+        if batch_window is not None:
+            self.batcher = MicroBatcher(self.detect_emotions, batch_window, max_batch_size)
+
+    def _quantize_model(self):
+        """Replace the classifier's Linear layers with dynamic int8 versions."""
+        import torch
+
+        self.emotion_classifier.model = torch.quantization.quantize_dynamic(
+            self.emotion_classifier.model, {torch.nn.Linear}, dtype=torch.qint8
+        )
 
     def detect_emotion(self, text):
         """Detects emotion from input text using DistilBERT."""
-        result = self.emotion_classifier(text)[0]
-        return result['label'], result['score']
\ No newline at end of file
+        if self.batcher is not None:
+            return self.batcher.submit(text).result()
+        result = self.emotion_classifier(text, **PIPELINE_KWARGS)[0]
+        return result['label'], result['score']
+
+    def detect_emotions(self, texts, batch_size=32):
+        """Detect emotions for many texts in batched forward passes."""
+        if not texts:
+            return []
+        results = self.emotion_classifier(list(texts), batch_size=batch_size, **PIPELINE_KWARGS)
+        return [(result['label'], result['score']) for result in results]
+
+    def close(self):
+        """Stop the micro-batcher, if any."""
+        if self.batcher is not None:
+            self.batcher.close()
+            self.batcher = None
+
+
+class MicroBatcher:
+    def __init__(self, batch_fn, window=0.01, max_batch_size=32):
+        """Group single-item requests arriving within window seconds into one batch_fn call."""
+        self.batch_fn = batch_fn
+        self.window = window
+        self.max_batch_size = max_batch_size
+        self._queue = []
+        self._cond = threading.Condition()
+        self._closing = False
+        self._worker = threading.Thread(target=self._run, name="emotion-batcher", daemon=True)
+        self._worker.start()
+        metrics.register_gauge("chatbot_emotion_batch_queue", self.get_queue_depth,
+                               "Emotion requests waiting for the micro-batcher")
+
+    def get_queue_depth(self):
+        """Return the number of queued requests."""
+        with self._cond:
+            return len(self._queue)
+
+    def submit(self, item):
+        """Queue an item and return a Future for its result."""
+        future = Future()
+        with self._cond:
+            if self._closing:
+                raise RuntimeError("MicroBatcher is closed")
+            self._queue.append((item, future))
+            self._cond.notify_all()
+        return future
+
+    def _run(self):
+        """Collect requests for one window, then run them as a batch."""
+        while True:
+            with self._cond:
+                while not self._queue and not self._closing:
+                    self._cond.wait()
+                if not self._queue:
+                    return
+
+                # Wait for more requests until the window closes or the batch is full
+                deadline = time.monotonic() + self.window
+                while len(self._queue) < self.max_batch_size and not self._closing:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+
+                batch = self._queue[:self.max_batch_size]
+                self._queue = self._queue[self.max_batch_size:]
+
+            items = [item for item, _ in batch]
+            try:
+                results = self.batch_fn(items)
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            for (_, future), result in zip(batch, results):
+                future.set_result(result)
+
+    def close(self):
+        """Finish queued requests and stop the worker."""
+        with self._cond:
+            self._closing = True
+            self._cond.notify_all()
+        self._worker.join()
@@ -0,0 +1,192 @@
+import argparse
+import json
+import random
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from fake_llm import FakeResponse
+from llm_client import LLMUnavailableError, ResilientModel
+
+
+class ModelHTTPError(Exception):
+    def __init__(self, code, message):
+        """HTTP error from the model endpoint; code is the status."""
+        super().__init__(f"{code}: {message}")
+        self.code = code
+
+
+class FakeGeminiServer:
+    def __init__(self, host="127.0.0.1", port=0, reply="I'm here for you.", latency=0.05, jitter=0.0,
+                 slow_rate=0.0, slow_latency=2.0, failure_rate=0.0, failure_status=503, seed=None):
+        """Local HTTP stand-in for the Gemini API that injects latency and failures.
+
+        Each POST /generate sleeps latency (+ up to jitter) seconds; a slow_rate share
+        of requests take slow_latency instead, and a failure_rate share answer with
+        failure_status. Faults can be changed while running with set_faults().
+        """
+        self.reply = reply
+        self.latency = latency
+        self.jitter = jitter
+        self.slow_rate = slow_rate
+        self.slow_latency = slow_latency
+        self.failure_rate = failure_rate
+        self.failure_status = failure_status
+        self.requests = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                status, delay = server._plan_request()
+                time.sleep(delay)
+                if status != 200:
+                    payload = {"error": "injected failure"}
+                else:
+                    text = server.reply(body.get("prompt", "")) if callable(server.reply) else server.reply
+                    payload = {"text": text}
+                data = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        self._httpd = ThreadingHTTPServer((host, port), Handler)
+        self._httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}/generate"
+
+    def _plan_request(self):
+        """Pick the status and delay of the next request."""
+        with self._lock:
+            self.requests += 1
+            delay = self.latency + self._rng.uniform(0, self.jitter)
+            if self._rng.random() < self.slow_rate:
+                delay = self.slow_latency
+            status = self.failure_status if self._rng.random() < self.failure_rate else 200
+        return status, delay
+
+    def set_faults(self, **faults):
+        """Change latency or failure settings, e.g. set_faults(failure_rate=1.0)."""
+        with self._lock:
+            for name, value in faults.items():
+                if not hasattr(self, name):
+                    raise AttributeError(name)
+                setattr(self, name, value)
+
+    def start(self):
+        """Serve on a background thread."""
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name="fake-gemini", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+
+class HTTPModelClient:
+    def __init__(self, url, timeout=None):
+        """Gemini-style client for a FakeGeminiServer endpoint."""
+        self.url = url
+        self.timeout = timeout
+
+    def generate_content(self, prompt, stream=False):
+        """POST the prompt and return a response with .text (a one-chunk list when stream=True)."""
+        request = urllib.request.Request(
+            self.url, data=json.dumps({"prompt": prompt}).encode("utf-8"),
+            headers={"Content-Type": "application/json"}
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                text = json.loads(response.read())["text"]
+        except urllib.error.HTTPError as e:
+            raise ModelHTTPError(e.code, e.reason) from e
+        except urllib.error.URLError as e:
+            raise ConnectionError(str(e.reason)) from e
+        return [FakeResponse(text)] if stream else FakeResponse(text)
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))] if ordered else None
+
+
+def load_test(model, requests, concurrency):
+    """Send requests prompts with concurrency callers and summarize outcomes and latency."""
+    def one(index):
+        start = time.perf_counter()
+        try:
+            model.generate_content(f"prompt {index}")
+            outcome = "success"
+        except LLMUnavailableError:
+            outcome = "fallback"
+        except Exception:
+            outcome = "error"
+        return outcome, (time.perf_counter() - start) * 1000
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(one, range(requests)))
+    latencies = [latency for _, latency in results]
+    return {
+        "success_rate": sum(1 for outcome, _ in results if outcome == "success") / requests,
+        "fallbacks": sum(1 for outcome, _ in results if outcome == "fallback"),
+        "raw_errors": sum(1 for outcome, _ in results if outcome == "error"),
+        "p50_ms": percentile(latencies, 0.50),
+        "p95_ms": percentile(latencies, 0.95),
+        "p99_ms": percentile(latencies, 0.99),
+        "max_ms": max(latencies),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare a plain and a resilient model client against injected faults")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--jitter", type=float, default=0.02)
+    parser.add_argument("--slow-rate", type=float, default=0.05)
+    parser.add_argument("--slow-latency", type=float, default=2.0)
+    parser.add_argument("--failure-rate", type=float, default=0.1)
+    parser.add_argument("--deadline", type=float, default=3.0)
+    parser.add_argument("--output", help="Write the JSON report to this file")
+    args = parser.parse_args()
+
+    server = FakeGeminiServer(latency=args.latency, jitter=args.jitter, slow_rate=args.slow_rate,
+                              slow_latency=args.slow_latency, failure_rate=args.failure_rate, seed=0).start()
+    try:
+        client = HTTPModelClient(server.url)
+        report = {
+            "plain": load_test(client, args.requests, args.concurrency),
+            "retries": load_test(ResilientModel(client, deadline=args.deadline, backoff_base=0.05),
+                                 args.requests, args.concurrency),
+            "retries_and_hedging": load_test(
+                ResilientModel(client, deadline=args.deadline, backoff_base=0.05, hedge_after="p95"),
+                args.requests, args.concurrency
+            ),
+        }
+    finally:
+        server.stop()
+
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+import hashlib
+import time
+import threading
+import numpy as np
+from context_assembler import estimate_tokens
+
+
+class FakeUsage:
+    def __init__(self, prompt_token_count, candidates_token_count, cached_content_token_count=0):
+        """Token counts mirroring Gemini's usage_metadata (prompt tokens include cached ones)."""
+        self.prompt_token_count = prompt_token_count
+        self.candidates_token_count = candidates_token_count
+        self.cached_content_token_count = cached_content_token_count
+
+
+class FakeResponse:
+    def __init__(self, text, usage_metadata=None):
+        """Response object exposing Gemini's .text and .usage_metadata attributes."""
+        self.text = text
+        self.usage_metadata = usage_metadata
+
+
+class FakeStreamingResponse:
+    def __init__(self, chunks, first_token_delay=0.0, chunk_delay=0.0, usage_metadata=None):
+        """Iterable of response chunks mimicking a streamed Gemini response; the last chunk carries the usage."""
+        self.chunks = chunks
+        self.first_token_delay = first_token_delay
+        self.chunk_delay = chunk_delay
+        self.usage_metadata = usage_metadata
+
+    def __iter__(self):
+        for index, chunk in enumerate(self.chunks):
+            time.sleep(self.first_token_delay if index == 0 else self.chunk_delay)
+            yield FakeResponse(chunk, self.usage_metadata if index == len(self.chunks) - 1 else None)
+
+    @property
+    def text(self):
+        return "".join(self.chunks)
+
+
+class FakeGeminiModel:
+    def __init__(self, reply="I'm here for you.", chunk_size=8, first_token_delay=0.0, chunk_delay=0.0):
+        """Local stand-in for genai.GenerativeModel used in tests and benchmarks.
+
+        reply may be a string or a callable taking the prompt and returning a string.
+        Token usage is tallied as a provider would bill it: cache_context() registers a
+        prompt prefix as a cached context, and calls through the returned client bill
+        only the rest of the prompt (see get_usage()).
+        """
+        self.reply = reply
+        self.chunk_size = chunk_size
+        self.first_token_delay = first_token_delay
+        self.chunk_delay = chunk_delay
+        self.prompts = []
+
+        # Billing counters
+        self.requests = 0
+        self.prompt_tokens = 0
+        self.cached_tokens = 0
+        self.response_tokens = 0
+        self.contexts_created = 0
+        self.cache_write_tokens = 0
+        self._usage_lock = threading.Lock()
+
+    def _reply_for(self, prompt):
+        """Return the reply text for a prompt."""
+        return self.reply(prompt) if callable(self.reply) else self.reply
+
+    def generate_content(self, prompt, stream=False):
+        """Return a canned reply, streamed in chunk_size pieces when stream=True."""
+        return self._respond(prompt, 0, stream)
+
+    def cache_context(self, prefix):
+        """Register prefix as a cached context and return a client that sends prompts after it."""
+        with self._usage_lock:
+            self.contexts_created += 1
+            self.cache_write_tokens += estimate_tokens(prefix)
+        return FakeCachedContextModel(self, prefix)
+
+    def _respond(self, prompt, cached_tokens, stream):
+        """Reply to a full prompt of which cached_tokens came from a cached context."""
+        self.prompts.append(prompt)
+        text = self._reply_for(prompt)
+        usage = FakeUsage(estimate_tokens(prompt), estimate_tokens(text), cached_tokens)
+        with self._usage_lock:
+            self.requests += 1
+            self.prompt_tokens += usage.prompt_token_count
+            self.cached_tokens += cached_tokens
+            self.response_tokens += usage.candidates_token_count
+
+        if stream:
+            chunks = [text[i:i + self.chunk_size] for i in range(0, len(text), self.chunk_size)]
+            return FakeStreamingResponse(chunks, self.first_token_delay, self.chunk_delay, usage)
+
+        time.sleep(self.first_token_delay + self.chunk_delay * max(0, len(text) // self.chunk_size - 1))
+        return FakeResponse(text, usage)
+
+    def get_usage(self):
+        """Return prompt tokens split into billed and cached, plus cache creation and reply tokens."""
+        with self._usage_lock:
+            return {
+                "requests": self.requests,
+                "prompt_tokens": self.prompt_tokens,
+                "billed_prompt_tokens": self.prompt_tokens - self.cached_tokens,
+                "cached_prompt_tokens": self.cached_tokens,
+                "cached_fraction": self.cached_tokens / self.prompt_tokens if self.prompt_tokens else 0.0,
+                "contexts_created": self.contexts_created,
+                "cache_write_tokens": self.cache_write_tokens,
+                "response_tokens": self.response_tokens,
+            }
+
+
+class FakeCachedContextModel:
+    def __init__(self, model, prefix):
+        """Client bound to a cached context on a FakeGeminiModel, like GenerativeModel.from_cached_content."""
+        self.model = model
+        self.prefix = prefix
+        self.prefix_tokens = estimate_tokens(prefix)
+
+    def generate_content(self, prompt, stream=False):
+        """Reply as if prompt followed the cached prefix, billing only prompt."""
+        return self.model._respond(self.prefix + prompt, self.prefix_tokens, stream)
+
+
+class FakeEmbeddingModel:
+    def __init__(self, dim=384):
+        """Offline stand-in for SentenceTransformer that hashes words into a fixed-size vector.
+
+        Texts sharing words get similar embeddings, which is enough for retrieval to
+        behave realistically in benchmarks.
+        """
+        self.dim = dim
+
+    def encode(self, texts, batch_size=32, **kwargs):
+        """Return one normalized float32 embedding per text (a single vector for a str)."""
+        single = isinstance(texts, str)
+        texts = [texts] if single else list(texts)
+        embeddings = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for word in text.lower().split():
+                digest = hashlib.md5(word.encode("utf-8")).digest()
+                embeddings[row, int.from_bytes(digest[:4], "little") % self.dim] += 1.0
+            embeddings[row, -1] += 0.01
+        embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+        return embeddings[0] if single else embeddings
+
+
+class FakeEmotionDetector:
+    def __init__(self, emotions=("joy", "sadness", "anger", "fear", "surprise", "neutral")):
+        """Offline stand-in for EmotionDetector that picks an emotion from a hash of the text."""
+        self.emotions = emotions
+
+    def detect_emotion(self, text):
+        digest = hashlib.md5(text.encode("utf-8")).digest()
+        return self.emotions[digest[0] % len(self.emotions)], 0.5 + digest[1] / 512
+
+    def detect_emotions(self, texts, batch_size=32):
+        return [self.detect_emotion(text) for text in texts]
+
+    def close(self):
+        pass
@@ -0,0 +1,240 @@
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from datetime import datetime
+from itertools import islice
+from chat_database import ChatDatabase
+from embedding_service import EmbeddingService, get_embedding_service
+from emotion_detection import EmotionDetector
+
+CHECKPOINT_TABLE = '''
+CREATE TABLE IF NOT EXISTS ingest_checkpoints (
+    source TEXT PRIMARY KEY,
+    records_done INTEGER NOT NULL,
+    pending_first_id INTEGER,
+    pending_last_id INTEGER,
+    updated_at TIMESTAMP NOT NULL
+)
+'''
+
+
+def read_records(path, file_format=None):
+    """Stream transcript records from a JSONL or CSV file.
+
+    Each record has conversation_id, role and content, plus optional timestamp
+    (ISO 8601), emotion and emotion_confidence.
+    """
+    file_format = file_format or ("csv" if path.lower().endswith(".csv") else "jsonl")
+    with open(path, newline="", encoding="utf-8") as f:
+        if file_format == "csv":
+            yield from csv.DictReader(f)
+        else:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+
+class TranscriptIngester:
+    def __init__(self, db, emotion_detector, source, chunk_size=2048, batch_size=128, long_term=True):
+        """Bulk-load transcripts into a ChatDatabase and its vector memory.
+
+        Records are processed chunk_size at a time: emotions are detected and
+        messages embedded in batch_size batches, SQLite rows are written with one
+        executemany per chunk, and each memory tier gets one vector add per chunk.
+
+        Progress is checkpointed per source (use the file's absolute path, so
+        same-named files in different directories stay apart) in the same SQLite
+        transaction as the chunk's rows, so an interrupted run resumes after the
+        last committed chunk. A chunk whose vectors may not have been written is
+        re-added on resume.
+        """
+        self.db = db
+        self.emotion_detector = emotion_detector
+        self.source = source
+        self.chunk_size = chunk_size
+        self.batch_size = batch_size
+        self.long_term = long_term
+        self.timings = {"emotion": 0.0, "sqlite": 0.0, "vectors": 0.0}
+
+        with self.db.storage.write() as conn:
+            conn.execute(CHECKPOINT_TABLE)
+
+        # Conversations created by earlier runs of this source
+        self._conversation_prefix = f"import:{source}:"
+        with self.db.storage.read() as conn:
+            rows = conn.execute(
+                # Exact prefix match: LIKE would treat _ and % in the path as wildcards
+                "SELECT id, conversation_context FROM conversations "
+                "WHERE substr(conversation_context, 1, length(?)) = ?",
+                (self._conversation_prefix, self._conversation_prefix)
+            ).fetchall()
+        self.conversations = {context[len(self._conversation_prefix):]: conversation_id
+                              for conversation_id, context in rows}
+
+    def get_checkpoint(self):
+        """Return (records_done, pending id range or None) for the source."""
+        with self.db.storage.read() as conn:
+            row = conn.execute(
+                "SELECT records_done, pending_first_id, pending_last_id FROM ingest_checkpoints WHERE source = ?",
+                (self.source,)
+            ).fetchone()
+        if row is None:
+            return 0, None
+        return row[0], (row[1], row[2]) if row[1] is not None else None
+
+    def ingest(self, records, progress=None):
+        """Ingest an iterable of records, skipping those a previous run committed; return the count added."""
+        records_done, pending = self.get_checkpoint()
+        if pending is not None:
+            self._readd_vectors(*pending)
+
+        records = iter(records)
+        for _ in islice(records, records_done):
+            pass
+
+        added = 0
+        while True:
+            chunk = list(islice(records, self.chunk_size))
+            if not chunk:
+                return added
+            self._ingest_chunk(chunk, records_done + added)
+            added += len(chunk)
+            if progress is not None:
+                progress(records_done + added, added)
+
+    def _ingest_chunk(self, chunk, records_done):
+        """Write one chunk of records to SQLite, then to vector memory."""
+        # Emotions for records that do not carry one, in large batches
+        start = time.perf_counter()
+        missing = [index for index, record in enumerate(chunk) if not record.get("emotion")]
+        detected = dict(zip(missing, self.emotion_detector.detect_emotions(
+            [chunk[index]["content"] for index in missing], batch_size=self.batch_size
+        )))
+        self.timings["emotion"] += time.perf_counter() - start
+
+        start = time.perf_counter()
+        with self.db.storage.write() as conn:
+            messages = []
+            for offset, record in enumerate(chunk):
+                emotion, confidence = detected.get(offset) or (record["emotion"], record.get("emotion_confidence"))
+                timestamp = record.get("timestamp")
+                messages.append((
+                    self._conversation_id(conn, str(record["conversation_id"])),
+                    record["role"],
+                    record["content"],
+                    emotion,
+                    float(confidence if confidence not in (None, "") else 1.0),
+                    datetime.fromisoformat(timestamp) if timestamp else datetime.now(),
+                    int(self.long_term),
+                    None,
+                ))
+            rows = self.db.insert_messages(messages, conn)
+            conn.execute(
+                "INSERT OR REPLACE INTO ingest_checkpoints VALUES (?, ?, ?, ?, ?)",
+                (self.source, records_done + len(rows), rows[0][0], rows[-1][0], datetime.now())
+            )
+        self.timings["sqlite"] += time.perf_counter() - start
+
+        self._store_vectors(rows)
+        self._clear_pending()
+
+    def _conversation_id(self, conn, key):
+        """Return the conversation for an archive's conversation key, creating it in the open transaction."""
+        conversation_id = self.conversations.get(key)
+        if conversation_id is None:
+            conversation_id = conn.execute(
+                "INSERT INTO conversations (created_at, conversation_context) VALUES (?, ?)",
+                (datetime.now(), self._conversation_prefix + key)
+            ).lastrowid
+            self.conversations[key] = conversation_id
+        return conversation_id
+
+    def _store_vectors(self, rows):
+        """Embed and add message rows to vector memory with one add per tier."""
+        start = time.perf_counter()
+        self.db.store_message_vectors(rows, batch_size=self.batch_size)
+        self.timings["vectors"] += time.perf_counter() - start
+
+    def _readd_vectors(self, first_id, last_id):
+        """Replace the vectors of a chunk that was committed to SQLite but may not have reached vector memory."""
+        with self.db.storage.read() as conn:
+            rows = conn.execute(
+                "SELECT id, conversation_id, role, content, emotion, emotion_confidence, timestamp, is_long_term, features FROM messages WHERE id BETWEEN ? AND ?",
+                (first_id, last_id)
+            ).fetchall()
+        ids = [row[0] for row in rows]
+        self.db.memory_service.delete_messages(ids, is_recent=True)
+        self.db.memory_service.delete_messages(ids, is_recent=False)
+        self._store_vectors(rows)
+        self._clear_pending()
+
+    def _clear_pending(self):
+        with self.db.storage.write() as conn:
+            conn.execute(
+                "UPDATE ingest_checkpoints SET pending_first_id = NULL, pending_last_id = NULL WHERE source = ?",
+                (self.source,)
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk-import chat transcripts into the chat database and vector memory")
+    parser.add_argument("paths", nargs="+", help="JSONL or CSV transcript files")
+    parser.add_argument("--format", choices=["jsonl", "csv"], help="Input format (default: from the file extension)")
+    parser.add_argument("--db", default="emotion_chat_memory.db")
+    parser.add_argument("--vector-store", default=None, help="chroma, numpy, numpy16, numpy-int8 or numpy-pq (default: $VECTOR_BACKEND)")
+    parser.add_argument("--chunk-size", type=int, default=2048, help="Records per transaction and vector add")
+    parser.add_argument("--batch-size", type=int, default=128, help="Texts per emotion and embedding forward pass")
+    parser.add_argument("--recent", action="store_true",
+                        help="Store messages in recent instead of long-term memory")
+    parser.add_argument("--fake-models", action="store_true",
+                        help="Use hashing stand-ins for the embedding and emotion models")
+    parser.add_argument("--output", help="Write the JSON report to this file")
+    args = parser.parse_args()
+
+    if args.fake_models:
+        from fake_llm import FakeEmbeddingModel, FakeEmotionDetector
+        embedding_service = EmbeddingService(model=FakeEmbeddingModel(), cache_size=0)
+        emotion_detector = FakeEmotionDetector()
+    else:
+        embedding_service = get_embedding_service()
+        emotion_detector = EmotionDetector()
+    db = ChatDatabase(args.db, embedding_service=embedding_service, vector_store=args.vector_store)
+
+    report = {"chunk_size": args.chunk_size, "batch_size": args.batch_size, "sources": []}
+    try:
+        for path in args.paths:
+            ingester = TranscriptIngester(
+                db, emotion_detector, os.path.abspath(path),
+                chunk_size=args.chunk_size, batch_size=args.batch_size, long_term=not args.recent
+            )
+            start = time.perf_counter()
+
+            def progress(total, added):
+                rate = added / (time.perf_counter() - start)
+                print(f"{path}: {total} records ({rate:.0f} messages/s)", file=sys.stderr)
+
+            added = ingester.ingest(read_records(path, args.format), progress)
+            seconds = time.perf_counter() - start
+            report["sources"].append({
+                "path": path,
+                "messages": added,
+                "seconds": seconds,
+                "messages_per_second": added / seconds if seconds else 0.0,
+                "stage_seconds": ingester.timings,
+            })
+    finally:
+        emotion_detector.close()
+        db.close()
+
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output)
+
+
+if __name__ == "__main__":
+    main()
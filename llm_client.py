@@ -0,0 +1,359 @@
+import logging
+import random
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from context_assembler import estimate_tokens
+from metrics import metrics
+
+# HTTP status codes and exception class names (google.api_core and builtins) worth retrying
+RETRYABLE_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+RETRYABLE_ERROR_NAMES = {
+    "TimeoutError", "ConnectionError", "ConnectionResetError", "ServiceUnavailable", "ResourceExhausted",
+    "DeadlineExceeded", "InternalServerError", "TooManyRequests", "GatewayTimeout", "BadGateway",
+}
+
+logger = logging.getLogger(__name__)
+
+
+class LLMUnavailableError(Exception):
+    """Raised when the model cannot answer: deadline passed, retries exhausted or circuit open."""
+
+
+class _DeadlinePassed(Exception):
+    """The overall deadline of a call ran out while waiting for the model."""
+
+
+# Returned by next() on the worker pool when a stream is exhausted
+_STREAM_END = object()
+
+
+def is_retryable_error(error):
+    """Return True for timeouts, connection failures, rate limits and 5xx errors."""
+    code = getattr(error, "code", None)
+    if callable(code):
+        code = code()
+    if code in RETRYABLE_STATUS_CODES:
+        return True
+    return any(cls.__name__ in RETRYABLE_ERROR_NAMES for cls in type(error).__mro__)
+
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        """Open after failure_threshold consecutive failures and reject calls for reset_timeout seconds.
+
+        After the timeout one trial call is let through (half-open); its success
+        closes the circuit and its failure opens it again.
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """Return True if a call may be made now."""
+        with self._lock:
+            if self.state == "open" and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = "half_open"
+                self._trial_in_flight = False
+            if self.state == "half_open":
+                if self._trial_in_flight:
+                    return False
+                self._trial_in_flight = True
+                return True
+            return self.state == "closed"
+
+    def record_success(self):
+        with self._lock:
+            self.state = "closed"
+            self.failures = 0
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == "half_open" or self.failures >= self.failure_threshold:
+                self.state = "open"
+                self.opened_at = time.monotonic()
+            self._trial_in_flight = False
+
+    def get_state_value(self):
+        """Circuit state as a number for the metrics gauge: 0 closed, 1 half-open, 2 open."""
+        return {"closed": 0, "half_open": 1, "open": 2}[self.state]
+
+
+class ResilientModel:
+    def __init__(self, model, deadline=30.0, max_retries=2, backoff_base=0.5, backoff_max=8.0,
+                 hedge_after=None, circuit_breaker=None, retryable=is_retryable_error, max_workers=16,
+                 latency_window=200, chunk_timeout=None):
+        """Wrap a Gemini-style client with deadlines, retries, hedging and a circuit breaker.
+
+        generate_content(prompt, stream=False) has the wrapped client's interface but
+        raises LLMUnavailableError instead of hanging or failing outright:
+
+        - every call must finish within deadline seconds, including retries;
+        - retryable errors are retried up to max_retries times with full-jitter
+          exponential backoff (backoff_base doubled per attempt, capped at backoff_max);
+        - hedge_after ("p95" or seconds) sends a second identical request when the
+          first is still running after that delay, and the first answer wins; "p95"
+          uses the p95 of the last latency_window successful calls;
+        - the circuit breaker rejects calls immediately while the model keeps failing.
+
+        Calls run on a worker pool so deadlines hold even when the client has no
+        timeout; a timed-out request is abandoned, not cancelled. For streams, the
+        deadline and retries cover the call up to the first chunk, and every later
+        chunk must arrive within chunk_timeout seconds (default: deadline) or the
+        stream raises LLMUnavailableError.
+        """
+        self.model = model
+        self.deadline = deadline
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.hedge_after = hedge_after
+        self.circuit_breaker = circuit_breaker or CircuitBreaker()
+        self.retryable = retryable
+        self.chunk_timeout = chunk_timeout if chunk_timeout is not None else deadline
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="llm-call")
+        self._latencies = deque(maxlen=latency_window)
+        self._latency_lock = threading.Lock()
+        metrics.register_gauge("chatbot_llm_circuit_state", self.circuit_breaker.get_state_value,
+                               "Model circuit breaker state: 0 closed, 1 half-open, 2 open")
+
+    def _hedge_delay(self):
+        """Seconds to wait before hedging, or None when hedging is off or there is no latency history."""
+        if self.hedge_after is None:
+            return None
+        if self.hedge_after != "p95":
+            return float(self.hedge_after)
+        with self._latency_lock:
+            if len(self._latencies) < 20:
+                return None
+            ordered = sorted(self._latencies)
+        return ordered[int(len(ordered) * 0.95)]
+
+    def _backoff(self, attempt):
+        """Full-jitter exponential backoff for a retry attempt (1-based)."""
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** (attempt - 1)))
+
+    def _attempt(self, call, deadline_at):
+        """Run call once (plus a hedge if it is slow) and return its result before deadline_at."""
+        start = time.monotonic()
+        futures = {self._executor.submit(call)}
+        hedge_delay = self._hedge_delay()
+        hedged = False
+        errors = []
+
+        while futures:
+            remaining = deadline_at - time.monotonic()
+            if remaining <= 0:
+                raise _DeadlinePassed("Model call exceeded its deadline")
+            timeout = remaining
+            if not hedged and hedge_delay is not None:
+                timeout = min(timeout, max(0.0, start + hedge_delay - time.monotonic()))
+
+            done, futures = wait(futures, timeout=timeout, return_when=FIRST_COMPLETED)
+            for future in done:
+                error = future.exception()
+                if error is None:
+                    elapsed = time.monotonic() - start
+                    with self._latency_lock:
+                        self._latencies.append(elapsed)
+                    metrics.observe("chatbot_llm_call_seconds", elapsed)
+                    return future.result()
+                errors.append(error)
+
+            if not done and not hedged and hedge_delay is not None:
+                hedged = True
+                metrics.inc("chatbot_llm_hedges_total")
+                futures.add(self._executor.submit(call))
+
+        raise errors[-1]
+
+    def _call(self, call):
+        """Run call with the circuit breaker, deadline and retries."""
+        if not self.circuit_breaker.allow():
+            metrics.inc("chatbot_llm_requests_total", outcome="circuit_open")
+            raise LLMUnavailableError("Model circuit breaker is open")
+
+        deadline_at = time.monotonic() + self.deadline
+        attempt = 0
+        while True:
+            try:
+                result = self._attempt(call, deadline_at)
+            except Exception as e:
+                attempt += 1
+                timed_out = isinstance(e, _DeadlinePassed)
+                retryable = timed_out or self.retryable(e)
+                delay = self._backoff(attempt)
+                if timed_out or not retryable or attempt > self.max_retries or time.monotonic() + delay >= deadline_at:
+                    # Only outages count against the circuit; a rejected request means the model is reachable
+                    if retryable:
+                        self.circuit_breaker.record_failure()
+                    else:
+                        self.circuit_breaker.record_success()
+                    metrics.inc("chatbot_llm_requests_total", outcome="timeout" if timed_out else "error")
+                    raise LLMUnavailableError(f"Model call failed after {attempt} attempt(s): {e}") from e
+                metrics.inc("chatbot_llm_retries_total")
+                time.sleep(delay)
+                continue
+
+            self.circuit_breaker.record_success()
+            metrics.inc("chatbot_llm_requests_total", outcome="success")
+            return result
+
+    def generate_content(self, prompt, stream=False):
+        """Gemini-style generate_content with deadlines, retries, hedging and circuit breaking."""
+        if not stream:
+            return self._call(lambda: self.model.generate_content(prompt))
+        return self._stream(prompt)
+
+    def _stream(self, prompt):
+        """Yield streamed chunks; the first chunk is fetched under the resilience policy.
+
+        Later chunks are fetched on the worker pool under chunk_timeout, so a stream
+        that stalls part way raises LLMUnavailableError instead of hanging.
+        """
+        def first_chunk():
+            chunks = iter(self.model.generate_content(prompt, stream=True))
+            return next(chunks, _STREAM_END), chunks
+
+        chunk, chunks = self._call(first_chunk)
+        while chunk is not _STREAM_END:
+            yield chunk
+            try:
+                chunk = self._executor.submit(next, chunks, _STREAM_END).result(timeout=self.chunk_timeout)
+            except FutureTimeoutError:
+                self.circuit_breaker.record_failure()
+                metrics.inc("chatbot_llm_stream_stalls_total")
+                raise LLMUnavailableError(f"Model stream stalled for {self.chunk_timeout}s") from None
+            except Exception as e:
+                if self.retryable(e):
+                    self.circuit_breaker.record_failure()
+                raise LLMUnavailableError(f"Model stream failed: {e}") from e
+
+    def close(self):
+        """Stop the worker pool without waiting for abandoned calls, then close the wrapped client."""
+        self._executor.shutdown(wait=False)
+        close = getattr(self.model, "close", None)
+        if close is not None:
+            close()
+
+
+class ContextCachingModel:
+    def __init__(self, model, create_cached_model, release_cached_model=None, min_prefix_tokens=0,
+                 max_contexts=64, token_counter=None, ttl=None):
+        """Send each prompt's stable prefix as a reusable cached context and only the rest per call.
+
+        Prompts built by ContextAssembler are PromptText strings whose prefix holds
+        the system and persona sections. create_cached_model(prefix) registers a
+        prefix with the provider and returns a Gemini-style client answering with it
+        as context. It runs once per distinct prefix, so a new context is only made
+        when the personality instructions change; the last max_contexts clients are
+        kept (one per user on a shared server) and release_cached_model(client) is
+        called on evicted ones. Plain prompts, prefixes under min_prefix_tokens and
+        prefixes the provider refused go to model in full; a warning is logged the
+        first time a prefix is too short to cache.
+
+        ttl (seconds) should be a little shorter than the provider-side lifetime of a
+        context: older entries, including refusals, are released and created again
+        instead of referencing a context the provider has already expired.
+
+        Contexts are created outside the lock, so a cache miss does not hold up turns
+        on other prefixes; concurrent misses on one prefix wait for a single creation.
+        """
+        self.model = model
+        self.create_cached_model = create_cached_model
+        self.release_cached_model = release_cached_model
+        self.min_prefix_tokens = min_prefix_tokens
+        self.max_contexts = max_contexts
+        self.count_tokens = token_counter or estimate_tokens
+        self.ttl = ttl
+        self._warned_short_prefix = False
+
+        # LRU of prefix -> (cached client or None when the provider refused it, creation time)
+        self._contexts = OrderedDict()
+        # prefix -> Future of the client being created for it
+        self._creating = {}
+        self._lock = threading.Lock()
+
+    def _cached_model(self, prefix):
+        """Return the client bound to prefix, registering the prefix on first use or after the ttl."""
+        with self._lock:
+            entry = self._contexts.get(prefix)
+            if entry is not None and (self.ttl is None or time.monotonic() - entry[1] < self.ttl):
+                self._contexts.move_to_end(prefix)
+                return entry[0]
+            waiting = self._creating.get(prefix)
+            if waiting is None:
+                creating = self._creating[prefix] = Future()
+        if waiting is not None:
+            return waiting.result()
+
+        # The provider round-trip runs unlocked; an expired entry stays until it is replaced
+        cached = None
+        try:
+            cached = self.create_cached_model(prefix)
+            metrics.inc("chatbot_llm_context_caches_created_total")
+        except Exception:
+            metrics.inc("chatbot_llm_context_cache_failures_total")
+        finally:
+            evicted = []
+            with self._lock:
+                entry = self._contexts.pop(prefix, None)
+                if entry is not None:
+                    evicted.append(entry[0])
+                self._contexts[prefix] = (cached, time.monotonic())
+                while len(self._contexts) > self.max_contexts:
+                    evicted.append(self._contexts.popitem(last=False)[1][0])
+                del self._creating[prefix]
+            creating.set_result(cached)
+
+        for client in evicted:
+            self._release(client)
+        return cached
+
+    def _release(self, client):
+        if client is not None and self.release_cached_model is not None:
+            try:
+                self.release_cached_model(client)
+            except Exception:
+                pass
+
+    def generate_content(self, prompt, stream=False):
+        """Gemini-style generate_content sending the cached prefix by reference when possible."""
+        prefix = getattr(prompt, "prefix", "")
+        cached = None
+        if prefix:
+            prefix_tokens = self.count_tokens(prefix)
+            if prefix_tokens >= self.min_prefix_tokens:
+                cached = self._cached_model(prefix)
+            elif not self._warned_short_prefix:
+                self._warned_short_prefix = True
+                logger.warning("Prompt prefix of %d tokens is below the %d-token minimum for a cached context; "
+                               "context caching has no effect", prefix_tokens, self.min_prefix_tokens)
+        if cached is None:
+            return self.model.generate_content(prompt, stream=stream)
+        return cached.generate_content(prompt.delta, stream=stream)
+
+    def close(self):
+        """Release every cached context."""
+        with self._lock:
+            clients = [client for client, _ in self._contexts.values()]
+            self._contexts.clear()
+        for client in clients:
+            self._release(client)
+
+
+metrics.describe("chatbot_llm_requests_total", "Model calls by outcome (success, error, timeout, circuit_open)")
+metrics.describe("chatbot_llm_retries_total", "Model call retries")
+metrics.describe("chatbot_llm_hedges_total", "Hedged model requests sent")
+metrics.describe("chatbot_llm_call_seconds", "Latency of successful model calls")
+metrics.describe("chatbot_llm_stream_stalls_total", "Streams abandoned because a chunk missed chunk_timeout")
+metrics.describe("chatbot_llm_context_caches_created_total", "Prompt prefixes registered as cached contexts")
+metrics.describe("chatbot_llm_context_cache_failures_total", "Prompt prefixes the provider refused to cache")
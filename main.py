@@ -1,7 +1,43 @@
+import argparse
+import logging
+from metrics import metrics, turn_logger
+from startup import profiler
 from chatbot import EmotionChatbot
+from response_cache import ResponseCache
 
 def main():
-    chatbot = EmotionChatbot()
+    parser = argparse.ArgumentParser(description="Enhanced AI Friend Chatbot")
+    parser.add_argument("--profile-startup", action="store_true",
+                        help="Print import and load time per component once everything has loaded")
+    parser.add_argument("--metrics", metavar="PATH",
+                        help="Log one JSON line per turn to stderr and write Prometheus metrics to PATH on exit")
+    parser.add_argument("--response-cache", action="store_true",
+                        help="Answer short repeated messages from a semantic cache instead of the model")
+    parser.add_argument("--memory-lifecycle", action="store_true",
+                        help="Promote, consolidate and evict vector memories in the background")
+    parser.add_argument("--context-cache", action="store_true",
+                        help="Register the stable prompt prefix as a Gemini cached context "
+                             "(only takes effect for prefixes of 32768 tokens or more)")
+    args = parser.parse_args()
+
+    if args.metrics:
+        metrics.enable()
+        logging.basicConfig(format="%(message)s")
+        turn_logger.setLevel(logging.INFO)
+
+    with profiler.track("chatbot", "init"):
+        chatbot = EmotionChatbot(
+            response_cache=ResponseCache() if args.response_cache else None,
+            context_caching=args.context_cache,
+            memory_lifecycle=args.memory_lifecycle
+        )
+
+    if args.profile_startup:
+        with profiler.track("chatbot", "ready"):
+            chatbot.wait_until_ready()
+        print("Startup profile (models load in the background; the prompt is available after 'chatbot init'):")
+        print(profiler.report())
+
     print("Enhanced AI Friend Chatbot with Dynamic Personality started.")
     print("Type 'quit', 'exit', or 'bye' to end.")
     print("Type 'feedback <1-5>' to provide feedback on the last response.")
@@ -32,11 +68,18 @@ def main():
         if user_input.lower() in ['quit', 'exit', 'bye']:
             print("Chatbot: It was nice talking with you! Goodbye!")
             chatbot.close()
+            if args.metrics:
+                with open(args.metrics, "w", encoding="utf-8") as f:
+                    f.write(metrics.export_prometheus())
             break
 
-        # Normal chat flow
-        response = chatbot.chat(user_input)
-        print("Chatbot:", response)
+        # Normal chat flow, printing the reply as it streams in. The first chunk is
+        # awaited before the label because the stream prints the detected emotion first
+        chunks = chatbot.chat_stream(user_input)
+        print("Chatbot:", next(chunks, ""), end="", flush=True)
+        for chunk in chunks:
+            print(chunk, end="", flush=True)
+        print()
         print("(You can provide feedback with 'feedback <1-5>')")
 
 if __name__ == "__main__":
@@ -0,0 +1,159 @@
+import logging
+import threading
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+logger = logging.getLogger(__name__)
+
+
+def extractive_summary(conversation_id, messages, max_chars=1000, snippet_chars=120):
+    """Summarize (id, role, content, emotion) rows by keeping the start of each turn."""
+    lines = []
+    length = 0
+    for _, role, content, emotion in messages:
+        snippet = content if len(content) <= snippet_chars else content[:snippet_chars].rstrip() + "..."
+        line = f"{role} ({emotion}): {snippet}"
+        if length + len(line) > max_chars:
+            lines.append(f"... and {len(messages) - len(lines)} more turns")
+            break
+        lines.append(line)
+        length += len(line)
+    return f"Summary of earlier turns in conversation {conversation_id}:\n" + "\n".join(lines)
+
+
+def summary_id(summary_row_id):
+    """Vector id of a stored conversation summary."""
+    return f"summary-{summary_row_id}"
+
+
+def summary_metadata(conversation_id):
+    """Vector-memory metadata for a conversation summary."""
+    return {
+        'role': 'summary',
+        'emotion': 'neutral',
+        'emotion_confidence': 0.0,
+        'conversation_id': conversation_id
+    }
+
+
+class MemoryLifecycle:
+    def __init__(self, db, promote_after=timedelta(days=1), max_recent=500, max_long_term=5000,
+                 interval=300, batch_size=500, summarizer=None):
+        """Background engine that keeps the vector memory tiers bounded.
+
+        Recent messages older than promote_after, or beyond the newest max_recent, move
+        to long-term memory. Long-term messages beyond max_long_term are consolidated
+        into per-conversation summaries and their raw vectors are evicted. Summaries
+        count toward max_long_term too; when consolidating no longer brings the tier
+        under the cap, the oldest summary vectors are evicted as well. summarizer
+        is called as summarizer(conversation_id, [(id, role, content, emotion), ...]).
+        """
+        self.db = db
+        self.promote_after = promote_after
+        self.max_recent = max_recent
+        self.max_long_term = max_long_term
+        self.interval = interval
+        self.batch_size = batch_size
+        self.summarizer = summarizer or extractive_summary
+
+        self._stop = threading.Event()
+        self._thread = None
+        self._run_lock = threading.Lock()
+
+    def start(self):
+        """Run the lifecycle on a background thread every interval seconds."""
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._loop, name="memory-lifecycle", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """Stop the background thread."""
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.run_once()
+            except Exception:
+                logger.exception("Memory lifecycle run failed")
+
+    def run_once(self):
+        """Promote and evict once, returning counts of what was moved."""
+        with self._run_lock:
+            # Queued messages must reach Chroma before they can be moved
+            self.db.flush()
+            promoted = self.promote()
+            summaries, evicted, evicted_summaries = self.evict()
+            return {"promoted": promoted, "summaries": summaries, "evicted": evicted,
+                    "evicted_summaries": evicted_summaries}
+
+    def promote(self):
+        """Move aged or overflowing recent messages into long-term memory."""
+        older_than = datetime.now() - self.promote_after if self.promote_after is not None else None
+        promoted = 0
+        while True:
+            message_ids = self.db.get_promotion_candidates(older_than, self.max_recent, self.batch_size)
+            if not message_ids:
+                return promoted
+            self.db.memory_service.move_to_long_term(message_ids)
+            self.db.mark_long_term(message_ids)
+            promoted += len(message_ids)
+
+    def evict(self):
+        """Consolidate the oldest long-term messages past the cap into summaries.
+
+        Returns (summaries created, messages evicted, summaries evicted).
+        """
+        if self.max_long_term is None:
+            return 0, 0, 0
+
+        summaries = evicted = evicted_summaries = 0
+        while True:
+            excess = self.db.get_long_term_count() - self.max_long_term
+            if excess <= 0:
+                return summaries, evicted, evicted_summaries
+
+            rows = self.db.get_eviction_candidates(self.max_long_term, self.batch_size)
+            if rows:
+                created, consolidated = self._consolidate(rows)
+                summaries += created
+                evicted += consolidated
+                if created < consolidated:
+                    continue
+
+            # Only summaries are left, or each summary replaced a single message:
+            # drop the oldest summary vectors instead
+            row_ids = self.db.get_summary_eviction_candidates(min(excess, self.batch_size))
+            if not row_ids:
+                return summaries, evicted, evicted_summaries
+            self.db.memory_service.delete_messages([summary_id(row_id) for row_id in row_ids], is_recent=False)
+            self.db.mark_summaries_evicted(row_ids)
+            evicted_summaries += len(row_ids)
+
+    def _consolidate(self, rows):
+        """Replace long-term message rows with one summary per conversation; return (summaries, messages)."""
+        summaries = evicted = 0
+
+        by_conversation = defaultdict(list)
+        for message_id, conversation_id, role, content, emotion in rows:
+            by_conversation[conversation_id].append((message_id, role, content, emotion))
+
+        for conversation_id, messages in by_conversation.items():
+            message_ids = [message[0] for message in messages]
+            summary = self.summarizer(conversation_id, messages)
+            summary_row_id = self.db.save_summary(conversation_id, summary, message_ids)
+
+            self.db.memory_service.store_message(
+                summary_id(summary_row_id),
+                summary,
+                metadata=summary_metadata(conversation_id),
+                is_recent=False
+            )
+            self.db.memory_service.delete_messages(message_ids, is_recent=False)
+            summaries += 1
+            evicted += len(message_ids)
+        return summaries, evicted
@@ -1,40 +1,95 @@
-import os
 import json
-import chromadb
-from sentence_transformers import SentenceTransformer
+from embedding_service import DEFAULT_MODEL_NAME, get_embedding_service
+from metrics import metrics
+from vector_store import create_vector_store
+
+# Vector collections of the two memory tiers
+RECENT_COLLECTION = "recent_conversations"
+LONG_TERM_COLLECTION = "long_term_conversations"
 
-class EnhancedMemoryService:
-    def __init__(self, model_name="all-MiniLM-L6-v2"):
-        """Initialize embedding model and vector database."""
-        # Embedding model
-        self.embedding_model = SentenceTransformer(model_name)
 
-        # Ensure memory directory exists
-        os.makedirs("./chatbot_memory", exist_ok=True)
+class EnhancedMemoryService:
+    def __init__(self, model_name=DEFAULT_MODEL_NAME, embedding_service=None, vector_store=None):
+        """Initialize embedding model and vector database.
 
-        # Chroma client with persistent storage
-        self.client = chromadb.PersistentClient(path="./chatbot_memory")
+        vector_store is a backend name (see vector_store.create_vector_store) or a store
+        instance; by default $VECTOR_BACKEND or Chroma in ./chatbot_memory is used.
+        """
+        # Vector store with persistent storage
+        if vector_store is None or isinstance(vector_store, str):
+            vector_store = create_vector_store(vector_store)
+        self.vector_store = vector_store
 
         # Create collections for different memory types
-        self.long_term_memory = self.client.get_or_create_collection(
-            name="long_term_conversations",
-            metadata={"hnsw:space": "cosine"}
-        )
+        self.long_term_memory = self.vector_store.get_collection(LONG_TERM_COLLECTION)
+        self.recent_memory = self.vector_store.get_collection(RECENT_COLLECTION)
 
-        self.recent_memory = self.client.get_or_create_collection(
-            name="recent_conversations",
-            metadata={"hnsw:space": "cosine"}
-        )
+        # Shared, cached embedding service (may already be loading on another thread)
+        self.embedding_service = embedding_service or get_embedding_service(model_name)
 
     def store_message(self, message_id, content, metadata=None, is_recent=True):
         """Store a message in the appropriate memory collection."""
-        # Generate embedding
-        embedding = self.embedding_model.encode(content).tolist()
+        self.store_messages([(message_id, content, metadata)], is_recent=is_recent)
+
+    def store_messages(self, messages, is_recent=True, batch_size=32):
+        """Store a batch of (message_id, content, metadata) with one encode and one add."""
+        if not messages:
+            return
+
+        # Generate embeddings in a single batch
+        embeddings = self.embedding_service.encode_batch([content for _, content, _ in messages], batch_size)
 
         # Choose collection based on recency
         collection = self.recent_memory if is_recent else self.long_term_memory
 
-        # Serialize metadata to ensure it can be stored
+        # Add to collection
+        with metrics.span("vector_add"):
+            collection.add(
+                ids=[str(message_id) for message_id, _, _ in messages],
+                embeddings=[embedding.tolist() for embedding in embeddings],
+                documents=[content for _, content, _ in messages],
+                metadatas=[self._serialize_metadata(metadata) for _, _, metadata in messages]
+            )
+
+    def move_to_long_term(self, message_ids):
+        """Move messages from recent to long-term memory, keeping their embeddings."""
+        if not message_ids:
+            return 0
+
+        with metrics.span("vector_get"):
+            records = self.recent_memory.get(
+                ids=[str(message_id) for message_id in message_ids],
+                include_embeddings=True
+            )
+        if records["ids"]:
+            with metrics.span("vector_add"):
+                self.long_term_memory.add(
+                    ids=records["ids"],
+                    embeddings=records["embeddings"],
+                    documents=records["documents"],
+                    metadatas=records["metadatas"]
+                )
+            with metrics.span("vector_delete"):
+                self.recent_memory.delete(records["ids"])
+        return len(records["ids"])
+
+    def delete_messages(self, message_ids, is_recent=False):
+        """Remove message vectors from a memory collection."""
+        if message_ids:
+            collection = self.recent_memory if is_recent else self.long_term_memory
+            with metrics.span("vector_delete"):
+                collection.delete([str(message_id) for message_id in message_ids])
+
+    def get_counts(self):
+        """Return the number of vectors in each memory collection."""
+        return {
+            "recent": self.recent_memory.count(),
+            "long_term": self.long_term_memory.count()
+        }
+
+    @staticmethod
+    def _serialize_metadata(metadata):
+        """Serialize metadata to ensure it can be stored."""
         serialized_metadata = {}
         if metadata:
             for key, value in metadata.items():
@@ -43,52 +98,69 @@ class EnhancedMemoryService:
                     serialized_metadata[key] = json.dumps(value)
                 else:
                     serialized_metadata[key] = str(value)
+        return serialized_metadata
 
-        # Add to collection
-        collection.add(
-            ids=[str(message_id)],
-            embeddings=[embedding],
-            documents=[content],
-            metadatas=[serialized_metadata or {}]
-        )
-
-    def retrieve_similar_messages(self, query, top_k=10, include_long_term=True):
-        """Retrieve similar messages from both recent and long-term memory."""
-        # Generate query embedding
-        query_embedding = self.embedding_model.encode(query).tolist()
+    def retrieve_similar_messages(self, query, top_k=10, include_long_term=True, min_similarity=None,
+                                  exclude_ids=None, where=None):
+        """Retrieve the most similar messages from both recent and long-term memory.
 
-        # Search recent memory
-        recent_results = self.recent_memory.query(
-            query_embeddings=[query_embedding],
-            n_results=top_k // 2
-        )
+        Returns up to top_k dicts with id, document, metadata and cosine similarity,
+        ranked across both tiers. Messages below min_similarity or whose id is in
+        exclude_ids are dropped; where is passed to Chroma as a metadata filter.
+        """
+        # Generate query embedding
+        query_embedding = self.embedding_service.encode(query).tolist()
+        excluded = {str(message_id) for message_id in exclude_ids or ()}
 
-        # Search long-term memory if requested
-        long_term_results = []
+        # Over-fetch by the number of excluded ids so exclusions don't shrink results
+        n_results = top_k + len(excluded)
+        collections = [self.recent_memory]
         if include_long_term:
-            long_term_results = self.long_term_memory.query(
-                query_embeddings=[query_embedding],
-                n_results=top_k // 2
-            )
+            collections.append(self.long_term_memory)
+
+        candidates = []
+        for collection in collections:
+            with metrics.span("vector_query"):
+                results = collection.query(query_embedding, n_results, where)
+            for message_id, doc, meta, distance in results:
+                if message_id in excluded:
+                    continue
+                similarity = 1.0 - distance
+                if min_similarity is not None and similarity < min_similarity:
+                    continue
+                candidates.append({
+                    "id": message_id,
+                    "document": doc,
+                    "metadata": self._deserialize_metadata(meta),
+                    "similarity": similarity
+                })
+
+        # Merge tiers by similarity, keeping the best hit per id
+        candidates.sort(key=lambda candidate: candidate["similarity"], reverse=True)
+        merged = []
+        seen = set()
+        for candidate in candidates:
+            if candidate["id"] not in seen:
+                seen.add(candidate["id"])
+                merged.append(candidate)
+        return merged[:top_k]
+
+    @staticmethod
+    def _deserialize_metadata(meta):
+        """Deserialize stored metadata values."""
+        processed_meta = {}
+        for key, value in (meta or {}).items():
+            try:
+                # Try to parse JSON, fallback to original value
+                processed_meta[key] = json.loads(value) if isinstance(value, str) else value
+            except (json.JSONDecodeError, TypeError):
+                processed_meta[key] = value
+        return processed_meta
 
-        # Process and combine results
-        def process_results(res_docs, res_metadata):
-            processed = []
-            for doc, meta in zip(res_docs[0], res_metadata[0]):
-                # Deserialize metadata
-                processed_meta = {}
-                for key, value in meta.items():
-                    try:
-                        # Try to parse JSON, fallback to original value
-                        processed_meta[key] = json.loads(value) if isinstance(value, str) else value
-                    except (json.JSONDecodeError, TypeError):
-                        processed_meta[key] = value
-                processed.append((doc, processed_meta))
-            return processed
-
-        recent_processed = process_results(recent_results['documents'], recent_results['metadatas'])
-        long_term_processed = process_results(long_term_results['documents'],
-                                             long_term_results['metadatas']) if include_long_term else []
-
-        # Combine and sort results
-        return recent_processed + long_term_processed
\ No newline at end of file
+    @staticmethod
+    def build_where(**filters):
+        """Build a Chroma metadata filter from equality filters, skipping None values."""
+        clauses = [{key: str(value)} for key, value in filters.items() if value is not None]
+        if not clauses:
+            return None
+        return clauses[0] if len(clauses) == 1 else {"$and": clauses}
@@ -0,0 +1,245 @@
+import bisect
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+import weakref
+from contextlib import contextmanager
+
+# Latency histogram bucket upper bounds in seconds
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+turn_logger = logging.getLogger("chatbot.turns")
+
+# Turn being recorded on the current thread or task
+_current_turn = contextvars.ContextVar("current_turn", default=None)
+
+
+class _NullSpan:
+    """Shared no-op context manager returned while metrics are disabled."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(key, extra=()):
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{value}"' for name, value in pairs) + "}"
+
+
+class _Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class TurnRecord:
+    def __init__(self, name):
+        """Stage timings and fields collected for one chat turn."""
+        self.name = name
+        self.started_at = time.perf_counter()
+        self.stages_ms = {}
+        self.fields = {}
+        self._lock = threading.Lock()
+
+    def add_stage(self, stage, seconds):
+        with self._lock:
+            self.stages_ms[stage] = self.stages_ms.get(stage, 0.0) + seconds * 1000
+
+    def add_count(self, name, amount):
+        with self._lock:
+            self.fields[name] = self.fields.get(name, 0) + amount
+
+
+class Metrics:
+    def __init__(self, enabled=False, buckets=DEFAULT_BUCKETS):
+        """Process-wide timing spans, counters and gauges with Prometheus text export.
+
+        Spans time a block into the chatbot_stage_seconds histogram and into the
+        current turn (see turn()), which is logged as one JSON line when it ends.
+        While disabled, span() returns a shared no-op context manager and inc()
+        returns immediately, so instrumented code costs one attribute check.
+        """
+        self.enabled = enabled
+        self.buckets = tuple(buckets)
+        self._histograms = {}
+        self._counters = {}
+        self._gauges = {}
+        self._help = {}
+        self._lock = threading.Lock()
+
+    def enable(self, enabled=True):
+        self.enabled = enabled
+
+    def span(self, stage, **labels):
+        """Context manager timing a block as a stage."""
+        if not self.enabled:
+            return _NULL_SPAN
+        return self._span(stage, labels)
+
+    @contextmanager
+    def _span(self, stage, labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record_stage(stage, time.perf_counter() - start, **labels)
+
+    def record_stage(self, stage, seconds, **labels):
+        """Record a stage timed elsewhere, as a span would."""
+        if not self.enabled:
+            return
+        self.observe("chatbot_stage_seconds", seconds, stage=stage, **labels)
+        turn = _current_turn.get()
+        if turn is not None:
+            turn.add_stage(stage, seconds)
+
+    def observe(self, name, value, **labels):
+        """Record a value in a histogram."""
+        if not self.enabled:
+            return
+        key = (name, _label_key(labels))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = _Histogram(self.buckets)
+            histogram.observe(value)
+
+    def inc(self, name, amount=1, **labels):
+        """Add to a counter."""
+        if not self.enabled:
+            return
+        key = (name, _label_key(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+        turn = _current_turn.get()
+        if turn is not None and not labels:
+            turn.add_count(name, amount)
+
+    def register_gauge(self, name, fn, help_text=None, **labels):
+        """Report fn() as a gauge at export time.
+
+        Bound methods are held weakly, so registering a component's method does not
+        keep the component alive; gauges of collected objects disappear.
+        """
+        ref = weakref.WeakMethod(fn) if hasattr(fn, "__self__") else (lambda: fn)
+        with self._lock:
+            self._gauges[(name, _label_key(labels))] = ref
+            if help_text:
+                self._help[name] = help_text
+
+    def set_turn_field(self, name, value):
+        """Attach a field to the current turn's log line, if a turn is being recorded."""
+        turn = _current_turn.get() if self.enabled else None
+        if turn is not None:
+            turn.fields[name] = value
+
+    def describe(self, name, help_text):
+        """Set the HELP text of a metric."""
+        self._help[name] = help_text
+
+    @contextmanager
+    def turn(self, name="chat_turn", **fields):
+        """Collect the spans and counters of one turn and log them as a JSON line."""
+        if not self.enabled:
+            yield None
+            return
+        record = TurnRecord(name)
+        record.fields.update(fields)
+        token = _current_turn.set(record)
+        try:
+            yield record
+        finally:
+            _current_turn.reset(token)
+            total = time.perf_counter() - record.started_at
+            self.observe("chatbot_turn_seconds", total)
+            turn_logger.info(json.dumps({
+                "event": record.name,
+                "total_ms": round(total * 1000, 3),
+                "stages_ms": {stage: round(ms, 3) for stage, ms in record.stages_ms.items()},
+                **record.fields,
+            }, default=str))
+
+    def export_prometheus(self):
+        """Render every metric in the Prometheus text exposition format."""
+        with self._lock:
+            histograms = sorted(self._histograms.items())
+            counters = sorted(self._counters.items())
+            gauges = sorted(self._gauges.items())
+
+        lines = []
+        described = set()
+
+        def header(name, metric_type):
+            if name not in described:
+                described.add(name)
+                if name in self._help:
+                    lines.append(f"# HELP {name} {self._help[name]}")
+                lines.append(f"# TYPE {name} {metric_type}")
+
+        for (name, key), histogram in histograms:
+            header(name, "histogram")
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), histogram.counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f"{name}_bucket{_format_labels(key, [('le', le)])} {cumulative}")
+            lines.append(f"{name}_sum{_format_labels(key)} {histogram.sum}")
+            lines.append(f"{name}_count{_format_labels(key)} {histogram.count}")
+
+        for (name, key), value in counters:
+            header(name, "counter")
+            lines.append(f"{name}{_format_labels(key)} {value}")
+
+        for (name, key), ref in gauges:
+            fn = ref()
+            if fn is None:
+                continue
+            try:
+                value = fn()
+            except Exception:
+                continue
+            header(name, "gauge")
+            lines.append(f"{name}{_format_labels(key)} {value}")
+
+        return "\n".join(lines) + "\n"
+
+
+def run_in_context(fn):
+    """Wrap fn so it runs in a copy of the caller's context (and so inside its turn) on another thread."""
+    context = contextvars.copy_context()
+    return lambda *args: context.run(fn, *args)
+
+
+# Process-wide metrics, enabled with METRICS_ENABLED=1 or metrics.enable()
+metrics = Metrics(enabled=os.getenv("METRICS_ENABLED", "0").lower() in ("1", "true", "yes"))
+
+metrics.describe("chatbot_stage_seconds", "Time spent in each pipeline stage, SQLite and vector store call")
+metrics.describe("chatbot_turn_seconds", "Wall-clock time of a whole chat turn")
+metrics.describe("chatbot_time_to_first_token_seconds", "Time from sending a streamed prompt to its first chunk")
+metrics.describe("chatbot_prompt_tokens_total", "Tokens sent to the language model")
+metrics.describe("chatbot_response_tokens_total", "Tokens received from the language model")
+metrics.describe("chatbot_cached_prompt_tokens_total", "Prompt tokens served from a cached context")
+metrics.describe("chatbot_embedding_cache_hits_total", "Embedding cache hits")
+metrics.describe("chatbot_embedding_cache_misses_total", "Embedding cache misses")
@@ -1,41 +1,174 @@
+import atexit
+import bisect
+import heapq
 import sqlite3
 import random
-from datetime import datetime
+import threading
+import time
+import weakref
+from datetime import datetime, timedelta
+from response_features import ResponseFeatureExtractor
+from storage import SQLiteStorage
+from topic_engine import TopicEngine
+
+DEFAULT_USER_ID = "default"
+
+# Default personality traits (scale 0-10)
+DEFAULT_TRAITS = {
+    "formality": 5.0,  # Higher = more formal
+    "verbosity": 5.0,  # Higher = more verbose
+    "empathy": 6.0,  # Higher = more empathetic
+    "humor": 5.0,  # Higher = more humorous
+    "assertiveness": 5.0,  # Higher = more assertive
+    "positivity": 6.0,  # Higher = more positive/optimistic
+    "curiosity": 7.0,  # Higher = more inquisitive
+    "supportiveness": 7.0,  # Higher = more supportive
+}
+
+# (low, high) thresholds where trait-driven instructions change; a trait's bucket is
+# -1 below low, 1 above high and 0 in between
+TRAIT_THRESHOLDS = {
+    "formality": (4, 7),
+    "verbosity": (4, 7),
+    "empathy": (0, 7),
+    "humor": (3, 7),
+    "positivity": (0, 7),
+    "curiosity": (0, 7),
+}
+
+# Keyword topic engine shared by personalities that are not given their own
+_default_topic_engine = None
+
+
+def get_default_topic_engine():
+    """Return the shared keyword-only topic engine, compiling it once."""
+    global _default_topic_engine
+    if _default_topic_engine is None:
+        _default_topic_engine = TopicEngine()
+    return _default_topic_engine
+
+
+# Personalities with unsaved changes are flushed at interpreter exit
+_live_personalities = weakref.WeakSet()
+
+
+def _flush_all_personalities():
+    """Flush every open personality at exit."""
+    for personality in list(_live_personalities):
+        try:
+            personality.flush()
+        except sqlite3.Error:
+            pass
+
+
+atexit.register(_flush_all_personalities)
+
+
+def _parse_timestamp(value):
+    """Parse a stored timestamp back into a datetime."""
+    if isinstance(value, datetime):
+        return value
+    try:
+        return datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        return datetime.now()
+
 
 class DynamicPersonality:
-    def __init__(self, db_path="personality_profile.db"):
-        """Initialize personality system with database storage."""
-        # Connect to SQLite database for persistent personality
-        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+    def __init__(self, db_path="personality_profile.db", user_id=DEFAULT_USER_ID, storage=None,
+                 flush_interval=30.0, flush_every=10, topic_engine=None, feature_extractor=None):
+        """Initialize personality system with database storage.
+
+        Each user_id has its own traits and topic interests. Many personalities can
+        share one SQLiteStorage (and its writer and reader pool) by passing storage.
+
+        Traits and topic interests are authoritative in memory. Changes are written
+        in one transaction once flush_every interactions or flush_interval seconds
+        have passed since the last write, and on flush(), close() and exit.
+
+        topic_engine is the TopicEngine used by extract_topics (keyword matching
+        over topic_taxonomy.json by default). feature_extractor scores the style of
+        bot responses for feedback (a ResponseFeatureExtractor with the default
+        lexicons unless given).
+        """
+        self.user_id = user_id
+        self.topic_engine = topic_engine or get_default_topic_engine()
+        self.feature_extractor = feature_extractor or ResponseFeatureExtractor()
+
+        # SQLite storage for persistent personality; the lock guards this profile's in-memory state
+        self._owns_storage = storage is None
+        self.storage = storage or SQLiteStorage(db_path)
+        self._lock = threading.RLock()
         self.create_tables()
 
-        # Initialize or load personality traits
+        # Initialize or load personality traits and topic interests
         self.traits = self.load_personality()
+        self.topic_interests = self._load_topic_interests()
+
+        # Dirty tracking: last persisted trait values and changed topics
+        self.flush_interval = flush_interval
+        self.flush_every = flush_every
+        self._saved_traits = dict(self.traits)
+        self._dirty_topics = set()
+        self._unflushed_interactions = 0
+        self._last_flush = time.monotonic()
+        _live_personalities.add(self)
+
+        # Top topics kept ranked in memory, and the instruction block built from them
+        self.top_topics_size = 3
+        self._top_topics = []
+        self._rebuild_top_topics()
+        self._instructions_key = None
+        self._instructions = ""
 
         # Track conversation patterns
         self.successful_patterns = []
         self.last_responses = []
 
     def create_tables(self):
-        """Create database tables for personality system."""
-        cursor = self.conn.cursor()
+        """Create or upgrade the personality schema."""
+        self.storage.migrate([self._migrate_to_per_user_tables])
+
+    def _migrate_to_per_user_tables(self, conn):
+        """Schema version 1: per-user tables, rebuilt from older single-user profiles."""
+        cursor = conn.cursor()
+        for table, key in (("personality_traits", "trait_name"), ("topic_interests", "topic")):
+            cursor.execute(f"PRAGMA table_info({table})")
+            columns = [row[1] for row in cursor.fetchall()]
+            if columns and "user_id" not in columns:
+                cursor.execute(f"ALTER TABLE {table} RENAME TO {table}_single_user")
+        self._create_tables(conn)
+
+        cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name LIKE '%_single_user'")
+        for (old_table,) in cursor.fetchall():
+            table = old_table[:-len("_single_user")]
+            cursor.execute(f"INSERT INTO {table} SELECT 'default', * FROM {old_table}")
+            cursor.execute(f"DROP TABLE {old_table}")
+
+    def _create_tables(self, conn):
+        """Create any missing personality tables."""
+        cursor = conn.cursor()
 
         # Personality traits table
         cursor.execute('''
         CREATE TABLE IF NOT EXISTS personality_traits (
-            trait_name TEXT PRIMARY KEY,
+            user_id TEXT NOT NULL DEFAULT 'default',
+            trait_name TEXT NOT NULL,
             trait_value REAL NOT NULL,
-            last_updated TIMESTAMP NOT NULL
+            last_updated TIMESTAMP NOT NULL,
+            PRIMARY KEY (user_id, trait_name)
         )
         ''')
 
         # Topic interests table
         cursor.execute('''
         CREATE TABLE IF NOT EXISTS topic_interests (
-            topic TEXT PRIMARY KEY,
+            user_id TEXT NOT NULL DEFAULT 'default',
+            topic TEXT NOT NULL,
             interest_level REAL NOT NULL,
             mention_count INTEGER NOT NULL,
-            last_mentioned TIMESTAMP NOT NULL
+            last_mentioned TIMESTAMP NOT NULL,
+            PRIMARY KEY (user_id, topic)
         )
         ''')
 
@@ -50,41 +183,51 @@ class DynamicPersonality:
         )
         ''')
 
-        self.conn.commit()
-
     def load_personality(self):
         """Load or initialize personality traits."""
-        cursor = self.conn.cursor()
-        cursor.execute("SELECT trait_name, trait_value FROM personality_traits")
+        with self.storage.write() as conn:
+            return self._load_personality(conn)
+
+    def _load_personality(self, conn):
+        """Load or initialize personality traits for this user."""
+        cursor = conn.cursor()
+        cursor.execute("SELECT trait_name, trait_value FROM personality_traits WHERE user_id = ?",
+                       (self.user_id,))
         results = cursor.fetchall()
 
-        if results:
-            return {trait: value for trait, value in results}
-        else:
-            # Default personality traits (scale 0-10)
-            default_traits = {
-                "formality": 5.0,  # Higher = more formal
-                "verbosity": 5.0,  # Higher = more verbose
-                "empathy": 6.0,  # Higher = more empathetic
-                "humor": 5.0,  # Higher = more humorous
-                "assertiveness": 5.0,  # Higher = more assertive
-                "positivity": 6.0,  # Higher = more positive/optimistic
-                "curiosity": 7.0,  # Higher = more inquisitive
-                "supportiveness": 7.0,  # Higher = more supportive
-            }
+        # Default personality traits (scale 0-10), overridden by stored values
+        traits = dict(DEFAULT_TRAITS)
+        traits.update({trait: value for trait, value in results})
+
+        # Store any traits this profile does not have yet
+        missing = [trait for trait in traits if trait not in dict(results)]
+        if missing:
+            now = datetime.now()
+            cursor.executemany(
+                "INSERT INTO personality_traits VALUES (?, ?, ?, ?)",
+                [(self.user_id, trait, traits[trait], now) for trait in missing]
+            )
 
-            # Store default traits
-            for trait, value in default_traits.items():
-                cursor.execute(
-                    "INSERT INTO personality_traits VALUES (?, ?, ?)",
-                    (trait, value, datetime.now())
-                )
-            self.conn.commit()
+        return traits
+
+    def _load_topic_interests(self):
+        """Load this user's topic interests into memory."""
+        with self.storage.read() as conn:
+            cursor = conn.execute(
+                "SELECT topic, interest_level, mention_count, last_mentioned FROM topic_interests WHERE user_id = ?",
+                (self.user_id,)
+            )
+            return {
+                topic: [interest_level, mention_count, _parse_timestamp(last_mentioned)]
+                for topic, interest_level, mention_count, last_mentioned in cursor.fetchall()
+            }
 
-            return default_traits
+    def update_from_interaction(self, user_message, bot_response, user_emotion, emotion_confidence, feedback=None,
+                                response_features=None):
+        """Update personality based on interaction and detected emotion.
 
-    def update_from_interaction(self, user_message, bot_response, user_emotion, emotion_confidence, feedback=None):
-        """Update personality based on interaction and detected emotion."""
+        response_features are the bot response's stored features, if already extracted.
+        """
         # Store interaction for pattern analysis
         self.last_responses.append({
             "user_message": user_message,
@@ -107,68 +250,49 @@ class DynamicPersonality:
 
         # If explicit feedback provided, make stronger adjustments
         if feedback is not None:
-            self.adjust_traits_based_on_feedback(bot_response, feedback)
+            self.adjust_traits_based_on_feedback(bot_response, feedback, response_features)
 
-        # Periodically save traits to database
-        self.save_traits()
+        # Periodically save traits and topics to database
+        self._unflushed_interactions += 1
+        if (self._unflushed_interactions >= self.flush_every
+                or time.monotonic() - self._last_flush >= self.flush_interval):
+            self.flush()
 
     def extract_topics(self, text):
-        """Simple topic extraction from text."""
-        # For a production system, this would use NLP techniques
-        # Simplified version for demonstration
-        possible_topics = [
-            "family", "work", "health", "relationships",
-            "education", "technology", "entertainment", "food",
-            "travel", "fitness", "music", "movies", "books",
-            "sports", "news", "politics", "science", "art"
-        ]
-
-        found_topics = []
-        text_lower = text.lower()
-
-        for topic in possible_topics:
-            if topic in text_lower:
-                found_topics.append(topic)
-
-        return found_topics
+        """Extract topics from text with the topic engine."""
+        return self.topic_engine.extract_topics(text)
 
     def update_topic_interests(self, topics):
         """Update interest levels for topics."""
-        cursor = self.conn.cursor()
-        now = datetime.now()
-
-        for topic in topics:
-            # Check if topic exists
-            cursor.execute("SELECT interest_level, mention_count FROM topic_interests WHERE topic = ?", (topic,))
-            result = cursor.fetchone()
-
-            if result:
-                interest_level, mention_count = result
-                # Increase interest level (with diminishing returns)
-                new_interest = min(10.0, interest_level + (10 - interest_level) * 0.1)
-                new_count = mention_count + 1
-
-                cursor.execute(
-                    "UPDATE topic_interests SET interest_level = ?, mention_count = ?, last_mentioned = ? WHERE topic = ?",
-                    (new_interest, new_count, now, topic)
-                )
-            else:
-                # New topic
-                cursor.execute(
-                    "INSERT INTO topic_interests VALUES (?, ?, ?, ?)",
-                    (topic, 5.0, 1, now)
-                )
-
-        # Decay interest in topics not mentioned (only periodically to save computation)
-        if random.random() < 0.2:  # 20% chance each interaction
-            cursor.execute(
-                "UPDATE topic_interests SET interest_level = MAX(1.0, interest_level * 0.99) WHERE topic NOT IN ({}) AND last_mentioned < datetime('now', '-7 day')".format(
-                    ','.join(['?'] * len(topics))
-                ),
-                topics
-            )
-
-        self.conn.commit()
+        with self._lock:
+            now = datetime.now()
+
+            for topic in topics:
+                entry = self.topic_interests.get(topic)
+                if entry:
+                    interest_level, mention_count, _ = entry
+                    # Increase interest level (with diminishing returns)
+                    new_interest = min(10.0, interest_level + (10 - interest_level) * 0.1)
+                    self.topic_interests[topic] = [new_interest, mention_count + 1, now]
+                else:
+                    # New topic
+                    self.topic_interests[topic] = [5.0, 1, now]
+                self._dirty_topics.add(topic)
+                self._rank_topic(topic)
+
+            # Decay interest in topics not mentioned (only periodically to save computation)
+            if random.random() < 0.2:  # 20% chance each interaction
+                stale_before = now - timedelta(days=7)
+                decayed_top = False
+                for topic, entry in self.topic_interests.items():
+                    if topic not in topics and entry[2] < stale_before:
+                        entry[0] = max(1.0, entry[0] * 0.99)
+                        self._dirty_topics.add(topic)
+                        decayed_top = decayed_top or topic in self._top_topic_names()
+
+                # A decayed top topic may now rank below one outside the top list
+                if decayed_top:
+                    self._rebuild_top_topics()
 
     def adjust_traits_based_on_emotion(self, emotion, confidence):
         """Adjust personality traits based on detected user emotion."""
@@ -204,8 +328,16 @@ class DynamicPersonality:
         # Apply small random drift to avoid getting stuck
         self._apply_random_drift()
 
-    def adjust_traits_based_on_feedback(self, response, feedback_score):
-        """Adjust traits based on explicit feedback (1-5 rating)."""
+    def analyze_response(self, response):
+        """Extract the style features of a bot response."""
+        return self.feature_extractor.extract(response)
+
+    def adjust_traits_based_on_feedback(self, response, feedback_score, features=None):
+        """Adjust traits based on explicit feedback (1-5 rating).
+
+        features are the response's precomputed style features; they are extracted
+        from the response when not given.
+        """
         # Normalize feedback to -1.0 to 1.0 range
         normalized_feedback = (feedback_score - 3) / 2
 
@@ -216,10 +348,12 @@ class DynamicPersonality:
         adjustment = normalized_feedback * 0.3  # Scale factor
 
         # Analyze response characteristics
-        is_formal = self._is_formal(response)
-        is_verbose = self._is_verbose(response)
-        is_empathetic = self._is_empathetic(response)
-        is_humorous = self._is_humorous(response)
+        if features is None:
+            features = self.analyze_response(response)
+        is_formal = features.get("formal", 0) > features.get("informal", 0)
+        is_verbose = self.feature_extractor.is_verbose(features)
+        is_empathetic = features.get("empathy", 0) > 0
+        is_humorous = features.get("humor", 0) > 0
 
         # Adjust traits based on characteristics and feedback
         if is_formal:
@@ -234,38 +368,6 @@ class DynamicPersonality:
         # Normalize all traits
         self._normalize_traits()
 
-    def _is_formal(self, text):
-        """Check if text has formal characteristics."""
-        formal_indicators = ["furthermore", "however", "nevertheless", "regarding",
-                             "additionally", "consequently", "therefore"]
-        informal_indicators = ["gonna", "wanna", "yeah", "nah", "lol", "haha"]
-
-        text_lower = text.lower()
-        formal_count = sum(1 for word in formal_indicators if word in text_lower)
-        informal_count = sum(1 for word in informal_indicators if word in text_lower)
-
-        return formal_count > informal_count
-
-    def _is_verbose(self, text):
-        """Check if text is verbose."""
-        # Simple word count check
-        return len(text.split()) > 60
-
-    def _is_empathetic(self, text):
-        """Check if text shows empathy."""
-        empathy_phrases = ["i understand", "that must be", "i can imagine",
-                           "that sounds", "you feel", "you're feeling"]
-
-        text_lower = text.lower()
-        return any(phrase in text_lower for phrase in empathy_phrases)
-
-    def _is_humorous(self, text):
-        """Check if text contains humor."""
-        humor_indicators = ["😄", "😂", "🤣", "haha", "lol", "funny", "joke", "😉"]
-
-        text_lower = text.lower()
-        return any(indicator in text_lower for indicator in humor_indicators)
-
     def _apply_random_drift(self):
         """Apply small random changes to prevent stagnation."""
         for trait in self.traits:
@@ -280,63 +382,125 @@ class DynamicPersonality:
             self.traits[trait] = max(1.0, min(10.0, self.traits[trait]))
 
     def save_traits(self):
-        """Save current traits to database."""
-        cursor = self.conn.cursor()
-        now = datetime.now()
-
-        for trait, value in self.traits.items():
-            cursor.execute(
-                "UPDATE personality_traits SET trait_value = ?, last_updated = ? WHERE trait_name = ?",
-                (value, now, trait)
-            )
+        """Save current traits and topic interests to database."""
+        self.flush()
+
+    def flush(self):
+        """Write changed traits and topics in a single UPSERT transaction."""
+        with self._lock:
+            changed_traits = [(trait, value) for trait, value in self.traits.items()
+                              if self._saved_traits.get(trait) != value]
+            changed_topics = [(topic, self.topic_interests[topic]) for topic in self._dirty_topics]
+
+            if changed_traits or changed_topics:
+                now = datetime.now()
+                with self.storage.write() as conn:
+                    conn.executemany(
+                        """INSERT INTO personality_traits (user_id, trait_name, trait_value, last_updated)
+                           VALUES (?, ?, ?, ?)
+                           ON CONFLICT(user_id, trait_name) DO UPDATE SET
+                               trait_value = excluded.trait_value, last_updated = excluded.last_updated""",
+                        [(self.user_id, trait, value, now) for trait, value in changed_traits]
+                    )
+                    conn.executemany(
+                        """INSERT INTO topic_interests (user_id, topic, interest_level, mention_count, last_mentioned)
+                           VALUES (?, ?, ?, ?, ?)
+                           ON CONFLICT(user_id, topic) DO UPDATE SET
+                               interest_level = excluded.interest_level,
+                               mention_count = excluded.mention_count,
+                               last_mentioned = excluded.last_mentioned""",
+                        [(self.user_id, topic, interest, count, last_mentioned)
+                         for topic, (interest, count, last_mentioned) in changed_topics]
+                    )
+                self._saved_traits.update(changed_traits)
+                self._dirty_topics.clear()
+
+            self._unflushed_interactions = 0
+            self._last_flush = time.monotonic()
+
+    def _topic_rank_key(self, topic):
+        """Sort key ranking topics by interest level, then mention count."""
+        interest_level, mention_count, _ = self.topic_interests[topic]
+        return (-interest_level, -mention_count, topic)
+
+    def _top_topic_names(self):
+        return [key[2] for key in self._top_topics]
+
+    def _rebuild_top_topics(self):
+        """Recompute the ranked top topics from all topic interests."""
+        self._top_topics = heapq.nsmallest(
+            self.top_topics_size, (self._topic_rank_key(topic) for topic in self.topic_interests)
+        )
 
-        self.conn.commit()
+    def _rank_topic(self, topic):
+        """Update the top topics after a topic's interest increased."""
+        self._top_topics = [key for key in self._top_topics if key[2] != topic]
+        bisect.insort(self._top_topics, self._topic_rank_key(topic))
+        del self._top_topics[self.top_topics_size:]
 
     def get_favorite_topics(self, limit=3):
         """Get user's favorite topics based on interest level."""
-        cursor = self.conn.cursor()
-        cursor.execute(
-            "SELECT topic FROM topic_interests ORDER BY interest_level DESC, mention_count DESC LIMIT ?",
-            (limit,)
-        )
-        return [topic[0] for topic in cursor.fetchall()]
+        with self._lock:
+            if limit <= self.top_topics_size:
+                return self._top_topic_names()[:limit]
+            return [key[2] for key in heapq.nsmallest(
+                limit, (self._topic_rank_key(topic) for topic in self.topic_interests)
+            )]
+
+    def get_trait_buckets(self):
+        """Return which threshold bucket each instruction-relevant trait is in."""
+        buckets = {}
+        for trait, (low, high) in TRAIT_THRESHOLDS.items():
+            value = self.traits[trait]
+            buckets[trait] = 1 if value > high else -1 if value < low else 0
+        return buckets
 
     def get_personality_instructions(self):
-        """Generate instructions based on current personality traits."""
+        """Return instructions for the current traits, rebuilt only when a bucket or top topic changes."""
+        with self._lock:
+            buckets = self.get_trait_buckets()
+            favorite_topics = self.get_favorite_topics()
+            key = (tuple(buckets.values()), tuple(favorite_topics))
+            if key != self._instructions_key:
+                self._instructions = self._build_personality_instructions(buckets, favorite_topics)
+                self._instructions_key = key
+            return self._instructions
+
+    def _build_personality_instructions(self, buckets, favorite_topics):
+        """Generate instructions based on current personality trait buckets."""
         instructions = []
 
         # Formality instructions
-        if self.traits["formality"] > 7:
+        if buckets["formality"] > 0:
             instructions.append("Use formal language and avoid contractions.")
-        elif self.traits["formality"] < 4:
+        elif buckets["formality"] < 0:
             instructions.append("Use casual, conversational language.")
 
         # Verbosity instructions
-        if self.traits["verbosity"] > 7:
+        if buckets["verbosity"] > 0:
             instructions.append("Be thorough and detailed in your responses.")
-        elif self.traits["verbosity"] < 4:
+        elif buckets["verbosity"] < 0:
             instructions.append("Keep responses brief and to the point.")
 
         # Empathy instructions
-        if self.traits["empathy"] > 7:
+        if buckets["empathy"] > 0:
             instructions.append("Show strong empathy and understanding for the user's emotions.")
 
         # Humor instructions
-        if self.traits["humor"] > 7:
+        if buckets["humor"] > 0:
             instructions.append("Incorporate light humor where appropriate.")
-        elif self.traits["humor"] < 3:
+        elif buckets["humor"] < 0:
             instructions.append("Maintain a serious tone.")
 
         # Positivity instructions
-        if self.traits["positivity"] > 7:
+        if buckets["positivity"] > 0:
             instructions.append("Maintain an optimistic and encouraging tone.")
 
         # Curiosity instructions
-        if self.traits["curiosity"] > 7:
+        if buckets["curiosity"] > 0:
             instructions.append("Show interest in learning more about the user.")
 
         # Add favorite topics if available
-        favorite_topics = self.get_favorite_topics()
         if favorite_topics:
             topics_str = ", ".join(favorite_topics)
             instructions.append(f"The user enjoys discussing these topics: {topics_str}. Reference them when relevant.")
@@ -344,6 +508,10 @@ class DynamicPersonality:
         return "\n".join(instructions)
 
     def close(self):
-        """Close database connection."""
-        if self.conn:
-            self.conn.close()
\ No newline at end of file
+        """Flush pending changes and close database connection."""
+        if self.storage is not None:
+            self.flush()
+            _live_personalities.discard(self)
+            if self._owns_storage:
+                self.storage.close()
+            self.storage = None
\ No newline at end of file
@@ -0,0 +1,53 @@
+import re
+
+# Words (with an optional apostrophe suffix) or single symbols such as emoji
+_TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:'[a-z]+)?|[^\w\s]")
+
+
+def tokenize(text):
+    """Lowercase text and split it into word and symbol tokens."""
+    return _TOKEN_PATTERN.findall(text.lower())
+
+
+class PhraseMatcher:
+    def __init__(self, phrases=None):
+        """Whole-token phrase matcher backed by a hash table of token n-grams.
+
+        Matching a message looks up every n-gram up to the longest phrase, so the
+        cost depends on the message length, not on how many phrases are registered.
+        """
+        self.phrases = {}
+        self.max_phrase_tokens = 1
+        # Single-token phrases are looked up by the token itself; longer n-grams are only
+        # built at positions where a multi-token phrase could start
+        self._unigrams = {}
+        self._multi_starts = set()
+        for phrase, value in (phrases or {}).items():
+            self.add(phrase, value)
+
+    def add(self, phrase, value):
+        """Register a phrase; the first value registered for a phrase wins."""
+        tokens = tuple(tokenize(phrase))
+        if tokens:
+            self.phrases.setdefault(tokens, value)
+            if len(tokens) == 1:
+                self._unigrams.setdefault(tokens[0], value)
+            else:
+                self._multi_starts.add(tokens[0])
+            self.max_phrase_tokens = max(self.max_phrase_tokens, len(tokens))
+
+    def __len__(self):
+        return len(self.phrases)
+
+    def iter_matches(self, tokens):
+        """Yield the value of every phrase occurrence in a token list."""
+        unigrams, multi_starts = self._unigrams, self._multi_starts
+        for start, token in enumerate(tokens):
+            value = unigrams.get(token)
+            if value is not None:
+                yield value
+            if token in multi_starts:
+                for length in range(2, min(self.max_phrase_tokens, len(tokens) - start) + 1):
+                    value = self.phrases.get(tuple(tokens[start:start + length]))
+                    if value is not None:
+                        yield value
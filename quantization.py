@@ -0,0 +1,119 @@
+import numpy as np
+
+# Rows decoded at a time while scoring, so the float temporaries stay in cache
+SCORE_BLOCK_ROWS = 1024
+
+
+def _blocked(score_block, codes, prepared):
+    """Score code rows in SCORE_BLOCK_ROWS blocks."""
+    scores = np.empty(len(codes), dtype=np.float32)
+    for start in range(0, len(codes), SCORE_BLOCK_ROWS):
+        scores[start:start + SCORE_BLOCK_ROWS] = score_block(codes[start:start + SCORE_BLOCK_ROWS], prepared)
+    return scores
+
+
+class Int8Codec:
+    name = "int8"
+    # Default shortlist, as a multiple of n_results, re-scored at full precision
+    rerank_factor = 4
+
+    def __init__(self, dim):
+        """Symmetric int8 scalar quantization with one float32 scale per vector.
+
+        A code row is dim int8 components followed by the 4-byte scale, so a 384-dim
+        vector takes 388 bytes instead of 1536.
+        """
+        self.dim = dim
+        self.code_size = dim + 4
+
+    def encode(self, vectors):
+        """Return the uint8 code rows of float vectors."""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        scales = np.abs(vectors).max(axis=1) / 127.0
+        scales[scales == 0] = 1.0
+        codes = np.empty((len(vectors), self.code_size), dtype=np.uint8)
+        codes[:, :self.dim] = np.round(vectors / scales[:, None]).astype(np.int8).view(np.uint8)
+        codes[:, self.dim:] = scales.astype(np.float32)[:, None].view(np.uint8)
+        return codes
+
+    def prepare(self, query):
+        """Per-query state for score()."""
+        return np.asarray(query, dtype=np.float32)
+
+    def score(self, codes, prepared):
+        """Approximate inner products of code rows with the prepared query."""
+        return _blocked(self._score_block, codes, prepared)
+
+    def _score_block(self, codes, prepared):
+        components = codes[:, :self.dim].view(np.int8).astype(np.float32)
+        scales = np.ascontiguousarray(codes[:, self.dim:]).view(np.float32)[:, 0]
+        return (components @ prepared) * scales
+
+
+class PQCodec:
+    name = "pq"
+    rerank_factor = 16
+
+    def __init__(self, codebooks):
+        """Product quantization: each vector is split into subspaces coded by one byte each.
+
+        codebooks has shape (subspaces, 256, dim // subspaces). A 384-dim vector with
+        48 subspaces takes 48 bytes. Scores use asymmetric distance computation: the
+        query stays exact and is compared to the centroids through a lookup table.
+        """
+        self.codebooks = np.asarray(codebooks, dtype=np.float32)
+        self.subspaces, self.centroids, self.subspace_dim = self.codebooks.shape
+        self.dim = self.subspaces * self.subspace_dim
+        self.code_size = self.subspaces
+        self._offsets = np.arange(self.subspaces) * self.centroids
+
+    @classmethod
+    def train(cls, sample, subspaces, centroids=256, iterations=15, seed=0):
+        """Learn one k-means codebook per subspace from sample vectors."""
+        sample = np.asarray(sample, dtype=np.float32)
+        if sample.shape[1] % subspaces:
+            raise ValueError(f"dimension {sample.shape[1]} is not divisible by {subspaces} subspaces")
+        rng = np.random.default_rng(seed)
+        subspace_dim = sample.shape[1] // subspaces
+        centroids = min(centroids, len(sample))
+        codebooks = np.empty((subspaces, centroids, subspace_dim), dtype=np.float32)
+
+        for index in range(subspaces):
+            points = sample[:, index * subspace_dim:(index + 1) * subspace_dim]
+            means = points[rng.choice(len(points), centroids, replace=False)].copy()
+            for _ in range(iterations):
+                assignment = cls._nearest(points, means)
+                sums = np.zeros_like(means)
+                np.add.at(sums, assignment, points)
+                counts = np.bincount(assignment, minlength=centroids)
+                filled = counts > 0
+                means[filled] = sums[filled] / counts[filled, None]
+            codebooks[index] = means
+        return cls(codebooks)
+
+    @staticmethod
+    def _nearest(points, means):
+        """Index of the closest mean (Euclidean) for each point."""
+        distances = (means ** 2).sum(axis=1) - 2.0 * points @ means.T
+        return np.argmin(distances, axis=1)
+
+    def encode(self, vectors):
+        """Return the uint8 code rows of float vectors."""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        codes = np.empty((len(vectors), self.subspaces), dtype=np.uint8)
+        for index in range(self.subspaces):
+            points = vectors[:, index * self.subspace_dim:(index + 1) * self.subspace_dim]
+            codes[:, index] = self._nearest(points, self.codebooks[index])
+        return codes
+
+    def prepare(self, query):
+        """Lookup table of the query's inner product with every centroid, flattened."""
+        query = np.asarray(query, dtype=np.float32).reshape(self.subspaces, 1, self.subspace_dim)
+        return (self.codebooks * query).sum(axis=2).ravel()
+
+    def score(self, codes, prepared):
+        """Approximate inner products of code rows with the query behind the lookup table."""
+        return _blocked(self._score_block, codes, prepared)
+
+    def _score_block(self, codes, prepared):
+        return prepared[codes.astype(np.intp) + self._offsets].sum(axis=1)
@@ -0,0 +1,130 @@
+import argparse
+import json
+import tempfile
+import time
+import numpy as np
+from memory_service import LONG_TERM_COLLECTION
+from vector_store import NumpyCollection, create_vector_store
+from vector_store_benchmark import percentile
+
+# name -> NumpyCollection options; float32 is the baseline
+CONFIGS = {
+    "float32": {},
+    "float16": {"dtype": "float16"},
+    "int8": {"quantization": "int8", "rerank_factor": 0},
+    "int8+rerank": {"quantization": "int8"},
+    "pq48": {"quantization": "pq", "pq_subspaces": 48, "rerank_factor": 0},
+    "pq48+rerank": {"quantization": "pq", "pq_subspaces": 48},
+    "pq96+rerank": {"quantization": "pq", "pq_subspaces": 96},
+}
+
+
+def synthetic_vectors(size, dim, clusters, seed):
+    """Clustered unit vectors, closer to sentence embeddings than isotropic noise."""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dim))
+    vectors = centers[rng.integers(clusters, size=size)] + rng.normal(scale=0.6, size=(size, dim))
+    return vectors.astype(np.float32)
+
+
+def load_vectors(backend, path, collection_name, limit, page_size=5000):
+    """Read up to limit stored embeddings from an existing collection."""
+    collection = create_vector_store(backend, path).get_collection(collection_name)
+    pages = []
+    while sum(len(page) for page in pages) < limit:
+        records = collection.get(include_embeddings=True, limit=page_size, offset=sum(len(page) for page in pages))
+        if not records["ids"]:
+            break
+        pages.append(np.asarray(records["embeddings"], dtype=np.float32))
+    if not pages:
+        raise SystemExit(f"No embeddings in {collection_name} at {path}")
+    return np.concatenate(pages)[:limit]
+
+
+def normalize(vectors):
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def bench_config(name, options, vectors, queries, truth, top_k, batch_size):
+    """Load vectors into a collection with the given options and measure recall@k against float32."""
+    with tempfile.TemporaryDirectory() as path:
+        # IVF is kept off so only the vector representation differs between configs
+        collection = NumpyCollection(path, ann_threshold=len(vectors) + 1,
+                                     pq_train_size=min(10000, len(vectors)), **options)
+        for start in range(0, len(vectors), batch_size):
+            chunk = vectors[start:start + batch_size]
+            collection.add([str(start + offset) for offset in range(len(chunk))], chunk,
+                           [None] * len(chunk), [None] * len(chunk))
+        collection.query(queries[0], top_k)  # trains PQ and encodes codes outside the timings
+        storage = collection.get_storage_report()
+
+        hits, latencies = 0, []
+        for query, expected in zip(queries, truth):
+            start = time.perf_counter()
+            results = collection.query(query, top_k)
+            latencies.append((time.perf_counter() - start) * 1000)
+            hits += len({int(message_id) for message_id, *_ in results} & set(expected.tolist()))
+        collection.close()
+
+    return {
+        "config": name,
+        "recall_at_k": hits / (len(queries) * top_k),
+        "scan_bytes_per_vector": storage["scan_bytes_per_vector"],
+        "scan_mb": storage["scan_bytes_per_vector"] * len(vectors) / 2 ** 20,
+        "disk_bytes_per_vector": storage["disk_bytes"] / len(vectors),
+        "query_p50_ms": percentile(latencies, 0.50),
+        "query_p95_ms": percentile(latencies, 0.95),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Report recall@k against memory per vector for quantized vector storage")
+    parser.add_argument("--configs", nargs="+", default=list(CONFIGS), choices=list(CONFIGS))
+    parser.add_argument("--size", type=int, default=50000, help="Number of stored vectors")
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--clusters", type=int, default=256, help="Clusters in the synthetic data")
+    parser.add_argument("--source", help="Measure on embeddings read from this vector store path instead")
+    parser.add_argument("--source-backend", default=None, help="Backend of --source (default: $VECTOR_BACKEND)")
+    parser.add_argument("--collection", default=LONG_TERM_COLLECTION, help="Collection to read from --source")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--batch-size", type=int, default=5000)
+    parser.add_argument("--output", help="Write the JSON report to this file")
+    args = parser.parse_args()
+
+    if args.source:
+        vectors = load_vectors(args.source_backend, args.source, args.collection, args.size + args.queries)
+    else:
+        vectors = synthetic_vectors(args.size + args.queries, args.dim, args.clusters, seed=0)
+    vectors = normalize(vectors)
+
+    # Held-out vectors are the queries; exact float32 search gives the true neighbours
+    queries, vectors = vectors[:args.queries], vectors[args.queries:]
+    scores = queries @ vectors.T
+    truth = np.argpartition(-scores, args.top_k - 1, axis=1)[:, :args.top_k]
+
+    report = {
+        "size": len(vectors),
+        "dim": vectors.shape[1],
+        "top_k": args.top_k,
+        "source": args.source or "synthetic",
+        "results": [],
+    }
+    for name in args.configs:
+        options = CONFIGS[name]
+        if options.get("pq_subspaces") and vectors.shape[1] % options["pq_subspaces"]:
+            continue
+        report["results"].append(bench_config(name, options, vectors, queries, truth,
+                                              args.top_k, args.batch_size))
+
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output)
+
+
+if __name__ == "__main__":
+    main()
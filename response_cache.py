@@ -0,0 +1,112 @@
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
+from metrics import metrics
+
+
+class ResponseCache:
+    def __init__(self, similarity_threshold=0.95, ttl=3600.0, max_entries=4096, max_input_words=12):
+        """Semantic cache of model replies for short, repeated user turns.
+
+        Entries are partitioned by (scope, emotion, personality key), where scope is
+        usually the user id, so a hit never crosses users, moods or personality
+        buckets. Within a partition a turn hits when the cosine similarity of its
+        embedding to a cached turn is at least similarity_threshold. Entries expire
+        after ttl seconds, and the least recently used are evicted beyond
+        max_entries. Turns longer than max_input_words are not cached.
+        """
+        self.similarity_threshold = similarity_threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_input_words = max_input_words
+
+        # LRU of entry id -> (partition, unit embedding, response, expires_at)
+        self._entries = OrderedDict()
+        # partition -> ids of its entries
+        self._partitions = {}
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+        # Cache statistics
+        self.hits = 0
+        self.misses = 0
+        metrics.register_gauge("chatbot_response_cache_entries", self.get_size, "Replies in the response cache")
+
+    def is_cacheable(self, text):
+        """Return True for turns short enough to be answered from the cache."""
+        return len(text.split()) <= self.max_input_words
+
+    @staticmethod
+    def _unit(embedding):
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def lookup(self, scope, embedding, emotion, personality_key):
+        """Return the cached reply for a similar turn, or None."""
+        partition = (scope, emotion, personality_key)
+        query = self._unit(embedding)
+        now = time.monotonic()
+
+        with self._lock:
+            ids = self._partitions.get(partition, ())
+            for entry_id in [entry_id for entry_id in ids if self._entries[entry_id][3] <= now]:
+                self._remove(entry_id)
+
+            response = None
+            ids = list(self._partitions.get(partition, ()))
+            if ids:
+                similarities = np.stack([self._entries[entry_id][1] for entry_id in ids]) @ query
+                best = int(np.argmax(similarities))
+                if similarities[best] >= self.similarity_threshold:
+                    self._entries.move_to_end(ids[best])
+                    response = self._entries[ids[best]][2]
+
+            if response is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+
+        metrics.inc("chatbot_response_cache_hits_total" if response is not None
+                    else "chatbot_response_cache_misses_total")
+        return response
+
+    def store(self, scope, embedding, emotion, personality_key, response):
+        """Cache a reply for a turn, evicting the least recently used entries."""
+        partition = (scope, emotion, personality_key)
+        with self._lock:
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = (partition, self._unit(embedding), response, time.monotonic() + self.ttl)
+            self._partitions.setdefault(partition, set()).add(entry_id)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def _remove(self, entry_id):
+        """Drop an entry; the caller holds the lock."""
+        partition = self._entries.pop(entry_id)[0]
+        ids = self._partitions[partition]
+        ids.discard(entry_id)
+        if not ids:
+            del self._partitions[partition]
+
+    def get_size(self):
+        """Return the number of cached replies."""
+        return len(self._entries)
+
+    def get_stats(self):
+        """Return cache hit/miss counters."""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "size": len(self._entries),
+                "capacity": self.max_entries,
+            }
+
+
+metrics.describe("chatbot_response_cache_hits_total", "Turns answered from the semantic response cache")
+metrics.describe("chatbot_response_cache_misses_total", "Cacheable turns that went to the model")
@@ -0,0 +1,61 @@
+from phrase_matcher import PhraseMatcher, tokenize
+
+# Style lexicons: feature -> phrases. Words, multi-word phrases and emoji are all matched on whole tokens.
+DEFAULT_LEXICONS = {
+    "formal": ["furthermore", "however", "nevertheless", "regarding", "additionally", "consequently",
+               "therefore"],
+    "informal": ["gonna", "wanna", "yeah", "nah", "lol", "haha"],
+    "empathy": ["i understand", "that must be", "i can imagine", "that sounds", "you feel", "you're feeling"],
+    "humor": ["😄", "😂", "🤣", "haha", "lol", "funny", "joke", "😉"],
+}
+
+# Word count above which a response counts as verbose
+VERBOSE_WORD_COUNT = 60
+
+
+class ResponseFeatureExtractor:
+    def __init__(self, lexicons=None, verbose_word_count=VERBOSE_WORD_COUNT):
+        """Score a response's style features in one pass over its tokens.
+
+        lexicons maps each feature to its phrases (defaults to DEFAULT_LEXICONS) and
+        can be extended with add_phrases. A phrase may count towards several features,
+        as "haha" does for informal and humor. The text is tokenized once and every
+        token n-gram is looked up in a single table, so adding phrases or features does
+        not add passes over the text.
+        """
+        self.verbose_word_count = verbose_word_count
+        self.features = []
+        self.matcher = PhraseMatcher()
+        self._owners = {}
+        for feature, phrases in (lexicons if lexicons is not None else DEFAULT_LEXICONS).items():
+            self.add_phrases(feature, phrases)
+
+    def add_phrases(self, feature, phrases):
+        """Register extra phrases for a feature, creating the feature if needed."""
+        if feature not in self.features:
+            self.features.append(feature)
+        for phrase in phrases:
+            key = tuple(tokenize(phrase))
+            if not key:
+                continue
+            # The matcher holds the owner list itself, so later features are seen without re-adding
+            owners = self._owners.get(key)
+            if owners is None:
+                owners = self._owners[key] = []
+                self.matcher.add(phrase, owners)
+            if feature not in owners:
+                owners.append(feature)
+
+    def extract(self, text):
+        """Return {"word_count": n, <feature>: occurrences, ...} for a response."""
+        tokens = tokenize(text)
+        features = dict.fromkeys(self.features, 0)
+        # Words are whitespace-separated chunks, matching how verbosity was always measured
+        features["word_count"] = len(text.split())
+        for owners in self.matcher.iter_matches(tokens):
+            for feature in owners:
+                features[feature] += 1
+        return features
+
+    def is_verbose(self, features):
+        return features.get("word_count", 0) > self.verbose_word_count
@@ -0,0 +1,323 @@
+import argparse
+import asyncio
+import json
+import logging
+import time
+from chatbot import EmotionChatbot, create_context_caching_gemini_model, create_gemini_model
+from chat_database import ChatDatabase
+from emotion_detection import EmotionDetector
+from memory_lifecycle import MemoryLifecycle
+from metrics import metrics, turn_logger
+from embedding_service import get_embedding_service
+from llm_client import ResilientModel
+from personality import DynamicPersonality
+from response_cache import ResponseCache
+from storage import SQLiteStorage
+
+
+class ChatSession:
+    def __init__(self, user_id, chatbot):
+        """Lightweight per-user state wrapped around a chatbot sharing the heavy components."""
+        self.user_id = user_id
+        self.chatbot = chatbot
+        self.last_active = time.monotonic()
+
+        # Turns for one user run one at a time
+        self.lock = asyncio.Lock()
+
+    def touch(self):
+        """Mark the session as active now."""
+        self.last_active = time.monotonic()
+
+
+class SessionManager:
+    def __init__(self, model=None, db_path="emotion_chat_memory.db",
+                 personality_db_path="personality_profile.db", idle_timeout=1800, write_behind=False,
+                 quantize_emotion=False, emotion_batch_window=None, memory_lifecycle=False,
+                 llm_deadline=30.0, llm_hedge_after=None, response_cache=False, context_caching=False):
+        """Load the shared models and stores once for all user sessions."""
+        # One resilient client, so every session shares its worker pool and circuit breaker
+        if model is None:
+            model = create_context_caching_gemini_model() if context_caching else create_gemini_model()
+        if not isinstance(model, ResilientModel):
+            model = ResilientModel(model, deadline=llm_deadline, hedge_after=llm_hedge_after)
+        self.model = model
+        self.emotion_detector = EmotionDetector(quantize=quantize_emotion, batch_window=emotion_batch_window)
+        self.embedding_service = get_embedding_service()
+        self.db = ChatDatabase(db_path, embedding_service=self.embedding_service, write_behind=write_behind)
+
+        # Tiered memory promotion and eviction shared by all users
+        self.memory_lifecycle = MemoryLifecycle(self.db) if memory_lifecycle else None
+        if self.memory_lifecycle is not None:
+            self.memory_lifecycle.start()
+
+        # Semantic reply cache shared by all sessions; entries are scoped per user
+        self.response_cache = ResponseCache() if response_cache else None
+
+        # One personality storage (writer plus reader pool) shared by every user's profile
+        self.personality_storage = SQLiteStorage(personality_db_path)
+
+        self.idle_timeout = idle_timeout
+        self.sessions = {}
+        # user_id -> task opening or closing that user's session
+        self._opening = {}
+        self._closing = {}
+        metrics.register_gauge("chatbot_active_sessions", self.get_session_count, "Open user sessions")
+
+    def get_session_count(self):
+        """Return the number of open sessions."""
+        return len(self.sessions)
+
+    async def get_session(self, user_id):
+        """Return the session for a user, opening it on first use or after eviction.
+
+        Opening reads SQLite, so it runs in the default executor; concurrent
+        requests for the same user share one opening task.
+        """
+        session = self.sessions.get(user_id)
+        if session is None:
+            opening = self._opening.get(user_id)
+            if opening is None:
+                opening = asyncio.ensure_future(self._open_session(user_id))
+                self._opening[user_id] = opening
+                opening.add_done_callback(lambda _: self._opening.pop(user_id, None))
+            session = await asyncio.shield(opening)
+        session.touch()
+        return session
+
+    async def _open_session(self, user_id):
+        # An evicted session must flush its personality before the new one loads it
+        closing = self._closing.get(user_id)
+        if closing is not None:
+            await asyncio.shield(closing)
+        loop = asyncio.get_running_loop()
+        chatbot = await loop.run_in_executor(None, self._create_chatbot, user_id)
+        session = ChatSession(user_id, chatbot)
+        self.sessions[user_id] = session
+        return session
+
+    def _create_chatbot(self, user_id):
+        """Build a user's chatbot, resuming their latest conversation if they have one."""
+        personality = DynamicPersonality(
+            user_id=user_id, storage=self.personality_storage
+        )
+        context = f"user:{user_id}"
+        conversation_id = self.db.get_latest_conversation(context)
+        if conversation_id is None:
+            conversation_id = self.db.create_conversation(context)
+        return EmotionChatbot(
+            model=self.model,
+            emotion_detector=self.emotion_detector,
+            db=self.db,
+            personality=personality,
+            response_cache=self.response_cache,
+            conversation_id=conversation_id
+        )
+
+    async def close_session(self, user_id):
+        """Finish a session's pending work and drop it."""
+        session = self.sessions.pop(user_id, None)
+        if session is not None:
+            closing = asyncio.ensure_future(self._close_session(session))
+            self._closing[user_id] = closing
+            closing.add_done_callback(
+                lambda _: self._closing.pop(user_id) if self._closing.get(user_id) is closing else None
+            )
+            await asyncio.shield(closing)
+
+    @staticmethod
+    async def _close_session(session):
+        async with session.lock:
+            await session.chatbot.aclose()
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(None, session.chatbot.personality.close)
+
+    async def evict_idle(self):
+        """Close sessions that have been idle longer than idle_timeout."""
+        now = time.monotonic()
+        idle = [user_id for user_id, session in self.sessions.items()
+                if now - session.last_active > self.idle_timeout and not session.lock.locked()]
+        for user_id in idle:
+            await self.close_session(user_id)
+        return len(idle)
+
+    async def close(self):
+        """Close every session and the shared stores."""
+        for user_id in list(self.sessions):
+            await self.close_session(user_id)
+        if self.memory_lifecycle is not None:
+            self.memory_lifecycle.stop()
+        self.db.close()
+        self.personality_storage.close()
+        self.emotion_detector.close()
+        self.model.close()
+
+
+class ChatServer:
+    def __init__(self, manager, host="127.0.0.1", port=8080, eviction_interval=60):
+        """Minimal asyncio JSON-over-HTTP front end for a SessionManager."""
+        self.manager = manager
+        self.host = host
+        self.port = port
+        self.eviction_interval = eviction_interval
+        self._server = None
+        self._eviction_task = None
+
+    async def start(self):
+        """Start accepting connections and the idle-eviction loop."""
+        self._server = await asyncio.start_server(self.handle_connection, self.host, self.port)
+        self._eviction_task = asyncio.create_task(self._eviction_loop())
+        return self._server
+
+    async def serve_forever(self):
+        """Run the server until cancelled."""
+        await self.start()
+        try:
+            async with self._server:
+                await self._server.serve_forever()
+        finally:
+            await self.stop()
+
+    async def stop(self):
+        """Stop the server and close all sessions."""
+        if self._eviction_task is not None:
+            self._eviction_task.cancel()
+            self._eviction_task = None
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+        await self.manager.close()
+
+    async def _eviction_loop(self):
+        """Periodically evict idle sessions."""
+        while True:
+            await asyncio.sleep(self.eviction_interval)
+            await self.manager.evict_idle()
+
+    async def handle_connection(self, reader, writer):
+        """Serve a single HTTP request on a connection."""
+        try:
+            method, path, body = await self._read_request(reader)
+            status, payload = await self.dispatch(method, path, body)
+        except (ValueError, json.JSONDecodeError) as e:
+            status, payload = 400, {"error": str(e)}
+        except Exception as e:
+            status, payload = 500, {"error": str(e)}
+
+        # Handlers return a dict for JSON or a str for plain text (the metrics export)
+        if isinstance(payload, str):
+            data, content_type = payload.encode("utf-8"), "text/plain; version=0.0.4"
+        else:
+            data, content_type = json.dumps(payload).encode("utf-8"), "application/json"
+        writer.write(
+            f"HTTP/1.1 {status} {'OK' if status == 200 else 'Error'}\r\n"
+            f"Content-Type: {content_type}\r\n"
+            f"Content-Length: {len(data)}\r\n"
+            f"Connection: close\r\n\r\n".encode("ascii") + data
+        )
+        await writer.drain()
+        writer.close()
+
+    @staticmethod
+    async def _read_request(reader):
+        """Parse the request line, headers and JSON body."""
+        request_line = (await reader.readline()).decode("latin-1").strip()
+        if not request_line:
+            raise ValueError("Empty request")
+        method, path, _ = request_line.split(" ", 2)
+
+        headers = {}
+        while True:
+            line = (await reader.readline()).decode("latin-1").strip()
+            if not line:
+                break
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        length = int(headers.get("content-length", 0))
+        body = json.loads(await reader.readexactly(length)) if length else {}
+        return method, path, body
+
+    async def dispatch(self, method, path, body):
+        """Route a request to its handler and return (status, payload)."""
+        if method == "GET" and path == "/health":
+            return 200, {"status": "ok", "sessions": len(self.manager.sessions)}
+
+        if method == "GET" and path == "/metrics":
+            return 200, metrics.export_prometheus()
+
+        if method != "POST" or path not in ("/chat", "/feedback"):
+            return 404, {"error": f"Unknown endpoint {method} {path}"}
+
+        user_id = body.get("user_id")
+        if not user_id:
+            raise ValueError("Missing user_id")
+        session = await self.manager.get_session(str(user_id))
+
+        async with session.lock:
+            session.touch()
+            if path == "/chat":
+                message = body.get("message")
+                if not message:
+                    raise ValueError("Missing message")
+                response = await session.chatbot.achat(message)
+                return 200, {"user_id": session.user_id, "response": response}
+
+            score = int(body.get("score", 0))
+            if not 1 <= score <= 5:
+                raise ValueError("score must be between 1 and 5")
+            accepted = await session.chatbot.aprovide_feedback(score, body.get("text"))
+            return 200, {"user_id": session.user_id, "accepted": accepted}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Multi-user AI Friend chat server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--idle-timeout", type=float, default=1800, help="Seconds before an idle session is evicted")
+    parser.add_argument("--write-behind", action="store_true", help="Queue message writes in the background")
+    parser.add_argument("--quantize-emotion", action="store_true", help="Use the int8-quantized emotion model")
+    parser.add_argument("--emotion-batch-window", type=float, default=None,
+                        help="Micro-batch concurrent emotion requests within this many seconds")
+    parser.add_argument("--memory-lifecycle", action="store_true",
+                        help="Promote, consolidate and evict vector memories in the background")
+    parser.add_argument("--metrics", action="store_true",
+                        help="Record stage timings for GET /metrics and log one JSON line per turn")
+    parser.add_argument("--llm-deadline", type=float, default=30.0,
+                        help="Seconds a reply may take, retries included, before the fallback reply is sent")
+    parser.add_argument("--llm-hedge", default=None,
+                        help="Send a second model request after this many seconds, or 'p95'")
+    parser.add_argument("--response-cache", action="store_true",
+                        help="Answer short repeated messages from a per-user semantic cache instead of the model")
+    parser.add_argument("--context-cache", action="store_true",
+                        help="Register each user's stable prompt prefix as a Gemini cached context "
+                             "(only takes effect for prefixes of 32768 tokens or more)")
+    args = parser.parse_args()
+
+    if args.metrics:
+        metrics.enable()
+        logging.basicConfig(format="%(message)s")
+        turn_logger.setLevel(logging.INFO)
+
+    manager = SessionManager(
+        idle_timeout=args.idle_timeout,
+        write_behind=args.write_behind,
+        quantize_emotion=args.quantize_emotion,
+        emotion_batch_window=args.emotion_batch_window,
+        memory_lifecycle=args.memory_lifecycle,
+        llm_deadline=args.llm_deadline,
+        llm_hedge_after=args.llm_hedge if args.llm_hedge in (None, "p95") else float(args.llm_hedge),
+        response_cache=args.response_cache,
+        context_caching=args.context_cache
+    )
+    server = ChatServer(manager, args.host, args.port)
+    print(f"AI Friend server listening on http://{args.host}:{args.port}")
+    try:
+        asyncio.run(server.serve_forever())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
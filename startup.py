@@ -0,0 +1,87 @@
+import threading
+import time
+from contextlib import contextmanager
+
+
+class StartupProfiler:
+    def __init__(self):
+        """Collect import and load timings per component."""
+        self.records = []
+        self._lock = threading.Lock()
+        self.started_at = time.perf_counter()
+
+    @contextmanager
+    def track(self, component, phase):
+        """Time a block as one phase (e.g. "import" or "load") of a component."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.records.append({
+                    "component": component,
+                    "phase": phase,
+                    "thread": threading.current_thread().name,
+                    "start_s": start - self.started_at,
+                    "seconds": time.perf_counter() - start,
+                })
+
+    def report(self):
+        """Return a printable breakdown of the recorded timings."""
+        with self._lock:
+            records = sorted(self.records, key=lambda record: record["start_s"])
+
+        lines = [f"{'component':<20} {'phase':<8} {'start':>8} {'seconds':>8}  thread"]
+        for record in records:
+            lines.append(
+                f"{record['component']:<20} {record['phase']:<8} {record['start_s']:>8.3f} "
+                f"{record['seconds']:>8.3f}  {record['thread']}"
+            )
+        lines.append(f"wall clock since start: {time.perf_counter() - self.started_at:.3f}s")
+        return "\n".join(lines)
+
+
+# Process-wide profiler used by every lazily loaded component
+profiler = StartupProfiler()
+
+
+class BackgroundLoader:
+    def __init__(self, name, factory):
+        """Run factory on a background thread; get() waits for and returns its result."""
+        self.name = name
+        self._result = None
+        self._error = None
+        self._done = threading.Event()
+        self._thread = threading.Thread(target=self._run, args=(factory,), name=f"load-{name}", daemon=True)
+        self._thread.start()
+
+    @classmethod
+    def ready(cls, value):
+        """Wrap an already-built component in a loader."""
+        loader = cls.__new__(cls)
+        loader.name = type(value).__name__
+        loader._result = value
+        loader._error = None
+        loader._done = threading.Event()
+        loader._done.set()
+        return loader
+
+    def _run(self, factory):
+        try:
+            self._result = factory()
+        except Exception as e:
+            self._error = e
+        finally:
+            self._done.set()
+
+    def is_ready(self):
+        """Return True once loading has finished (successfully or not)."""
+        return self._done.is_set()
+
+    def get(self, timeout=None):
+        """Wait for the component and return it, re-raising any load error."""
+        if not self._done.wait(timeout):
+            raise TimeoutError(f"{self.name} did not finish loading in {timeout}s")
+        if self._error is not None:
+            raise self._error
+        return self._result
@@ -0,0 +1,133 @@
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from metrics import metrics
+
+# Pragmas applied to every connection. WAL lets readers run while a write is in progress,
+# and synchronous=NORMAL only syncs at checkpoints, which is still crash-safe in WAL mode.
+DEFAULT_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "busy_timeout": 5000,
+    "cache_size": -16000,  # 16 MB page cache per connection
+    "temp_store": "MEMORY",
+}
+
+
+class SQLiteStorage:
+    def __init__(self, db_path, pool_size=4, pragmas=None):
+        """SQLite database with a single writer connection and a pool of reader connections.
+
+        write() serializes writers on one connection and commits (or rolls back) when
+        the outermost write block exits. read() borrows a read-only connection from a
+        pool of up to pool_size, so concurrent sessions read without waiting on each
+        other or on the writer. Reads that must see a write() block's own uncommitted
+        changes should use the connection write() yields. In-memory databases (and
+        pool_size=0) use the writer connection for everything.
+        """
+        self.db_path = db_path
+        self.name = os.path.basename(db_path)
+        self.pragmas = dict(DEFAULT_PRAGMAS, **(pragmas or {}))
+        self.pool_size = pool_size
+
+        # Single writer
+        self._write_lock = threading.RLock()
+        self._write_depth = 0
+        self.writer = self._connect()
+
+        # Reader pool, opened lazily
+        self._shared = db_path == ":memory:" or pool_size <= 0
+        self._pool_cond = threading.Condition()
+        self._idle_readers = []
+        self._readers = []
+
+    def _connect(self, read_only=False):
+        """Open a connection with the configured pragmas."""
+        conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        for name, value in self.pragmas.items():
+            conn.execute(f"PRAGMA {name} = {value}")
+        if read_only:
+            conn.execute("PRAGMA query_only = ON")
+        return conn
+
+    @contextmanager
+    def write(self):
+        """Hold the writer connection for one transaction."""
+        with self._write_lock, metrics.span("sqlite_write", db=self.name):
+            self._write_depth += 1
+            try:
+                yield self.writer
+                if self._write_depth == 1:
+                    self.writer.commit()
+            except BaseException:
+                if self._write_depth == 1:
+                    self.writer.rollback()
+                raise
+            finally:
+                self._write_depth -= 1
+
+    @contextmanager
+    def read(self):
+        """Borrow a reader connection from the pool."""
+        with metrics.span("sqlite_read", db=self.name):
+            if self._shared:
+                with self._write_lock:
+                    yield self.writer
+                return
+            with self._borrow_reader() as conn:
+                yield conn
+
+    @contextmanager
+    def _borrow_reader(self):
+        """Take an idle reader, opening one if the pool has room, and return it afterwards."""
+        with self._pool_cond:
+            while not self._idle_readers and len(self._readers) >= self.pool_size:
+                self._pool_cond.wait()
+            if self._idle_readers:
+                conn = self._idle_readers.pop()
+            else:
+                conn = self._connect(read_only=True)
+                self._readers.append(conn)
+        try:
+            yield conn
+        finally:
+            with self._pool_cond:
+                self._idle_readers.append(conn)
+                self._pool_cond.notify()
+
+    def get_user_version(self):
+        """Return the schema version recorded in the database."""
+        with self.read() as conn:
+            return conn.execute("PRAGMA user_version").fetchone()[0]
+
+    def migrate(self, migrations):
+        """Apply migrations newer than the database's user_version, in order.
+
+        migrations is a list where entry n (counting from 1) upgrades the schema to
+        version n; each is an SQL statement or a callable taking the connection.
+        Returns the resulting schema version.
+        """
+        with self.write() as conn:
+            # Explicit transaction so schema changes apply together with the version bump
+            if not conn.in_transaction:
+                conn.execute("BEGIN IMMEDIATE")
+            version = conn.execute("PRAGMA user_version").fetchone()[0]
+            for number, migration in enumerate(migrations[version:], start=version + 1):
+                if callable(migration):
+                    migration(conn)
+                else:
+                    conn.execute(migration)
+                conn.execute(f"PRAGMA user_version = {number}")
+                version = number
+        return version
+
+    def close(self):
+        """Close the writer and every reader connection."""
+        with self._pool_cond:
+            for conn in self._readers:
+                conn.close()
+            self._readers = []
+            self._idle_readers = []
+        with self._write_lock:
+            self.writer.close()
@@ -0,0 +1,74 @@
+import argparse
+import json
+import random
+import string
+import time
+from topic_engine import TopicEngine, load_taxonomy
+
+
+def naive_extract(taxonomy, text):
+    """The original substring scan over every topic phrase, for comparison."""
+    text_lower = text.lower()
+    return [topic for topic, synonyms in taxonomy.items()
+            if any(phrase in text_lower for phrase in [topic] + synonyms)]
+
+
+def synthetic_taxonomy(size, synonyms_per_topic, rng):
+    """Build a taxonomy of random pseudo-words, seeded with the default topics."""
+    taxonomy = dict(list(load_taxonomy().items())[:size])
+    while len(taxonomy) < size:
+        word = lambda: "".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(4, 10)))
+        taxonomy[word()] = [word() if rng.random() < 0.8 else f"{word()} {word()}" for _ in range(synonyms_per_topic)]
+    return taxonomy
+
+
+def time_per_message(fn, messages, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for message in messages:
+            fn(message)
+    return (time.perf_counter() - start) * 1e6 / (repeat * len(messages))
+
+
+def run(sizes, synonyms_per_topic=5, messages=200, words_per_message=30, repeat=3, seed=0):
+    """Per-message topic extraction cost as the taxonomy grows."""
+    rng = random.Random(seed)
+    report = []
+    for size in sizes:
+        taxonomy = synthetic_taxonomy(size, synonyms_per_topic, rng)
+        vocabulary = [phrase for topic, synonyms in taxonomy.items() for phrase in [topic] + synonyms]
+        filler = ["i", "really", "think", "that", "my", "the", "was", "today", "and", "about", "start"]
+        texts = [" ".join(rng.choice(vocabulary) if rng.random() < 0.1 else rng.choice(filler)
+                          for _ in range(words_per_message)) for _ in range(messages)]
+
+        build_start = time.perf_counter()
+        engine = TopicEngine(taxonomy)
+        build_ms = (time.perf_counter() - build_start) * 1000
+
+        report.append({
+            "topics": size,
+            "phrases": len(engine.matcher),
+            "compile_ms": build_ms,
+            "engine_us_per_message": time_per_message(engine.match_keywords, texts, repeat),
+            "naive_us_per_message": time_per_message(lambda text: naive_extract(taxonomy, text), texts, repeat),
+        })
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Topic extraction cost versus taxonomy size")
+    parser.add_argument("--sizes", nargs="+", type=int, default=[18, 1000, 10000])
+    parser.add_argument("--synonyms", type=int, default=5)
+    parser.add_argument("--messages", type=int, default=200)
+    parser.add_argument("--output", help="Write the JSON report to this file")
+    args = parser.parse_args()
+
+    output = json.dumps(run(args.sizes, args.synonyms, args.messages), indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output)
+
+
+if __name__ == "__main__":
+    main()
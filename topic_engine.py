@@ -0,0 +1,100 @@
+import json
+import os
+import numpy as np
+from embedding_service import get_embedding_service
+from phrase_matcher import PhraseMatcher, tokenize
+
+DEFAULT_TAXONOMY_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "topic_taxonomy.json")
+
+
+def load_taxonomy(path=DEFAULT_TAXONOMY_PATH):
+    """Load a {topic: [synonym, ...]} taxonomy from a JSON file."""
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+class TopicEngine:
+    def __init__(self, taxonomy=None, use_embeddings=False, embedding_service=None, similarity_threshold=0.45,
+                 max_embedding_topics=2):
+        """Match topics by keyword phrases and, optionally, by embedding similarity.
+
+        taxonomy maps each topic to its synonym phrases (defaults to topic_taxonomy.json).
+        Phrases are matched on whole words in one pass over the message: every word
+        n-gram up to the longest phrase is looked up in a hash table, so the cost per
+        message does not grow with the number of topics. With use_embeddings (or an
+        explicit embedding_service), topics whose centroid is within similarity_threshold
+        of the message embedding are added as well. The shared embedding service is
+        fetched on first use, and the message embedding comes from its cache.
+        """
+        self.taxonomy = taxonomy if taxonomy is not None else load_taxonomy()
+        self.use_embeddings = use_embeddings or embedding_service is not None
+        self._embedding_service = embedding_service
+        self.similarity_threshold = similarity_threshold
+        self.max_embedding_topics = max_embedding_topics
+
+        # Compiled phrase table: token n-gram -> topic
+        self.matcher = PhraseMatcher()
+        for topic, synonyms in self.taxonomy.items():
+            for phrase in [topic] + list(synonyms):
+                self.matcher.add(phrase, topic)
+
+        self._topic_names = list(self.taxonomy)
+        self._centroids = None
+
+    @classmethod
+    def from_file(cls, path, **kwargs):
+        """Build an engine from a taxonomy JSON file."""
+        return cls(load_taxonomy(path), **kwargs)
+
+    def match_keywords(self, text):
+        """Return topics whose phrases occur as whole words, in order of first mention."""
+        found = []
+        for topic in self.matcher.iter_matches(tokenize(text)):
+            if topic not in found:
+                found.append(topic)
+        return found
+
+    @property
+    def embedding_service(self):
+        """Embedding service used for classification, defaulting to the shared one."""
+        if self._embedding_service is None:
+            self._embedding_service = get_embedding_service()
+        return self._embedding_service
+
+    def _topic_centroids(self):
+        """Normalized mean embedding of each topic's phrases, computed once."""
+        if self._centroids is None:
+            phrases, owners = [], []
+            for index, topic in enumerate(self._topic_names):
+                for phrase in [topic] + list(self.taxonomy[topic]):
+                    phrases.append(phrase)
+                    owners.append(index)
+
+            # Encoded with the model directly so taxonomy phrases don't evict cached turn embeddings
+            embeddings = np.asarray(self.embedding_service.model.encode(phrases, batch_size=64), dtype=np.float32)
+            owners = np.asarray(owners)
+            centroids = np.zeros((len(self._topic_names), embeddings.shape[1]), dtype=np.float32)
+            np.add.at(centroids, owners, embeddings)
+            norms = np.linalg.norm(centroids, axis=1, keepdims=True)
+            norms[norms == 0] = 1.0
+            self._centroids = centroids / norms
+        return self._centroids
+
+    def classify_embedding(self, embedding):
+        """Return the topics whose centroid is most similar to an embedding, above the threshold."""
+        query = np.asarray(embedding, dtype=np.float32)
+        query = query / (np.linalg.norm(query) or 1.0)
+        scores = self._topic_centroids() @ query
+        ranked = np.argsort(-scores)[:self.max_embedding_topics]
+        return [self._topic_names[index] for index in ranked if scores[index] >= self.similarity_threshold]
+
+    def extract_topics(self, text, embedding=None):
+        """Keyword topics plus, when embeddings are enabled, semantically similar topics."""
+        topics = self.match_keywords(text)
+        if self.use_embeddings and text.strip():
+            if embedding is None:
+                embedding = self.embedding_service.encode(text)
+            for topic in self.classify_embedding(embedding):
+                if topic not in topics:
+                    topics.append(topic)
+        return topics
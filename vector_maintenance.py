@@ -0,0 +1,386 @@
+import argparse
+import json
+import os
+import shutil
+import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+import numpy as np
+from chat_database import ChatDatabase
+from embedding_service import DEFAULT_MODEL_NAME
+from memory_lifecycle import summary_id, summary_metadata
+from memory_service import LONG_TERM_COLLECTION, RECENT_COLLECTION, EnhancedMemoryService
+from storage import SQLiteStorage
+from vector_store import create_vector_store, default_vector_store_path, get_vector_backend
+
+SUMMARY_PREFIX = summary_id("")
+
+# Embedding model of an encoding worker process
+_encoder = None
+
+
+def _init_encoder(model_name, fake_models, threads):
+    """Load the embedding model once per worker process."""
+    global _encoder
+    if fake_models:
+        from fake_llm import FakeEmbeddingModel
+        _encoder = FakeEmbeddingModel()
+        return
+    import torch
+    from sentence_transformers import SentenceTransformer
+    # Workers split the cores instead of each using all of them
+    torch.set_num_threads(threads)
+    _encoder = SentenceTransformer(model_name)
+
+
+def _encode(texts, batch_size):
+    return np.asarray(_encoder.encode(texts, batch_size=batch_size), dtype=np.float32)
+
+
+def _split_ids(ids):
+    """Split vector ids into message ids and summary ids (int arrays) plus unrecognized ids."""
+    messages, summaries, other = [], [], []
+    for vector_id in ids:
+        if vector_id.isdigit():
+            messages.append(int(vector_id))
+        elif vector_id.startswith(SUMMARY_PREFIX) and vector_id[len(SUMMARY_PREFIX):].isdigit():
+            summaries.append(int(vector_id[len(SUMMARY_PREFIX):]))
+        else:
+            other.append(vector_id)
+    return np.array(messages, dtype=np.int64), np.array(summaries, dtype=np.int64), other
+
+
+class ConsistencyReport:
+    def __init__(self, sqlite_counts, vector_counts, missing, extra):
+        """Differences between SQLite and the vector collections.
+
+        missing[collection] holds (message ids, summary ids) that should be in the
+        collection but are not; extra[collection] holds vector ids that should not be.
+        """
+        self.sqlite_counts = sqlite_counts
+        self.vector_counts = vector_counts
+        self.missing = missing
+        self.extra = extra
+
+    @property
+    def is_consistent(self):
+        return not any(len(messages) or len(summaries) for messages, summaries in self.missing.values()) \
+            and not any(self.extra.values())
+
+    def summary(self):
+        """Return the counts as a dict."""
+        return {
+            "sqlite": self.sqlite_counts,
+            "vectors": self.vector_counts,
+            "missing": {name: {"messages": len(messages), "summaries": len(summaries)}
+                        for name, (messages, summaries) in self.missing.items()},
+            "extra": {name: len(ids) for name, ids in self.extra.items()},
+            "consistent": self.is_consistent,
+        }
+
+
+class VectorMaintenance:
+    def __init__(self, storage, vector_store, model_name=DEFAULT_MODEL_NAME, workers=None, fake_models=False,
+                 chunk_size=4096, batch_size=128):
+        """Check, repair and rebuild the vector memory tiers from the messages in SQLite.
+
+        SQLite is the source of truth: every message that is not evicted belongs in
+        the long-term or recent collection according to is_long_term, and every
+        conversation summary belongs in the long-term collection. Texts are embedded
+        chunk_size at a time on a pool of workers processes (0 encodes in this
+        process) while this process adds finished chunks, so memory stays bounded
+        however many rows there are.
+        """
+        self.storage = storage
+        self.vector_store = vector_store
+        self.collections = {
+            RECENT_COLLECTION: vector_store.get_collection(RECENT_COLLECTION),
+            LONG_TERM_COLLECTION: vector_store.get_collection(LONG_TERM_COLLECTION),
+        }
+        self.chunk_size = chunk_size
+        self.batch_size = batch_size
+        self.workers = os.cpu_count() if workers is None else workers
+
+        # Encoding processes start (and load the model) on first use
+        self._encoder_args = (model_name, fake_models, max(1, (os.cpu_count() or 1) // max(1, self.workers)))
+        self._pool = None
+
+    def _expected_ids(self):
+        """Return the message ids each collection should hold and the summary ids, from SQLite."""
+        recent, long_term = [], []
+        with self.storage.read() as conn:
+            cursor = conn.execute("SELECT id, is_long_term FROM messages WHERE is_evicted = 0")
+            while True:
+                rows = cursor.fetchmany(self.chunk_size * 4)
+                if not rows:
+                    break
+                for message_id, is_long_term in rows:
+                    (long_term if is_long_term else recent).append(message_id)
+            summaries = [row[0] for row in conn.execute("SELECT id FROM conversation_summaries WHERE is_evicted = 0")]
+        return {
+            RECENT_COLLECTION: (np.array(recent, dtype=np.int64), np.array([], dtype=np.int64)),
+            LONG_TERM_COLLECTION: (np.array(long_term, dtype=np.int64), np.array(summaries, dtype=np.int64)),
+        }
+
+    def check(self):
+        """Diff the ids in SQLite against both vector collections."""
+        expected = self._expected_ids()
+        missing, extra, vector_counts = {}, {}, {}
+        for name, collection in self.collections.items():
+            stored_messages, stored_summaries, other = [], [], []
+            for ids in collection.iter_ids():
+                messages, summaries, unknown = _split_ids(ids)
+                stored_messages.append(messages)
+                stored_summaries.append(summaries)
+                other.extend(unknown)
+            stored_messages = np.concatenate(stored_messages or [np.array([], dtype=np.int64)])
+            stored_summaries = np.concatenate(stored_summaries or [np.array([], dtype=np.int64)])
+            expected_messages, expected_summaries = expected[name]
+
+            missing[name] = (np.setdiff1d(expected_messages, stored_messages),
+                             np.setdiff1d(expected_summaries, stored_summaries))
+            extra[name] = (
+                [str(message_id) for message_id in np.setdiff1d(stored_messages, expected_messages)]
+                + [summary_id(row_id) for row_id in np.setdiff1d(stored_summaries, expected_summaries)]
+                + other
+            )
+            vector_counts[name] = len(stored_messages) + len(stored_summaries) + len(other)
+
+        sqlite_counts = {name: len(messages) + len(summaries) for name, (messages, summaries) in expected.items()}
+        return ConsistencyReport(sqlite_counts, vector_counts, missing, extra)
+
+    def repair(self, report=None):
+        """Delete stray vectors and add missing ones; return how many of each."""
+        report = report or self.check()
+        deleted = 0
+        for name, ids in report.extra.items():
+            for start in range(0, len(ids), 1000):
+                self.collections[name].delete(ids[start:start + 1000])
+            deleted += len(ids)
+
+        def chunks():
+            for name, (messages, summaries) in report.missing.items():
+                for start in range(0, len(messages), self.chunk_size):
+                    yield self._message_entries(self._fetch_messages(messages[start:start + self.chunk_size]))
+                for start in range(0, len(summaries), self.chunk_size):
+                    yield self._summary_entries(self._fetch_summaries(summaries[start:start + self.chunk_size]))
+
+        return {"deleted": deleted, "added": self._index(chunks())}
+
+    def rebuild(self):
+        """Index every message and summary in SQLite into the (empty) collections; return throughput."""
+        if any(collection.count() for collection in self.collections.values()):
+            raise ValueError("rebuild needs empty collections; build into a new vector store path")
+
+        def chunks():
+            last_id = 0
+            while True:
+                with self.storage.read() as conn:
+                    rows = conn.execute(
+                        "SELECT id, conversation_id, role, content, emotion, emotion_confidence, is_long_term FROM messages WHERE id > ? AND is_evicted = 0 ORDER BY id LIMIT ?",
+                        (last_id, self.chunk_size)
+                    ).fetchall()
+                if not rows:
+                    break
+                last_id = rows[-1][0]
+                yield self._message_entries(rows)
+
+            with self.storage.read() as conn:
+                cursor = conn.execute("SELECT id, conversation_id, summary FROM conversation_summaries WHERE is_evicted = 0")
+                while True:
+                    rows = cursor.fetchmany(self.chunk_size)
+                    if not rows:
+                        break
+                    yield self._summary_entries(rows)
+
+        start = time.perf_counter()
+        added = self._index(chunks())
+        seconds = time.perf_counter() - start
+        return {
+            "vectors": added,
+            "seconds": seconds,
+            "vectors_per_second": added / seconds if seconds else 0.0,
+            "workers": self.workers,
+        }
+
+    def _fetch_messages(self, message_ids):
+        rows = []
+        with self.storage.read() as conn:
+            for start in range(0, len(message_ids), 500):
+                batch = [int(message_id) for message_id in message_ids[start:start + 500]]
+                rows.extend(conn.execute(
+                    f"SELECT id, conversation_id, role, content, emotion, emotion_confidence, is_long_term FROM messages WHERE id IN ({','.join('?' * len(batch))})",
+                    batch
+                ).fetchall())
+        return rows
+
+    def _fetch_summaries(self, row_ids):
+        rows = []
+        with self.storage.read() as conn:
+            for start in range(0, len(row_ids), 500):
+                batch = [int(row_id) for row_id in row_ids[start:start + 500]]
+                rows.extend(conn.execute(
+                    f"SELECT id, conversation_id, summary FROM conversation_summaries WHERE id IN ({','.join('?' * len(batch))})",
+                    batch
+                ).fetchall())
+        return rows
+
+    @staticmethod
+    def _message_entries(rows):
+        """(collection, id, document, metadata) entries for message rows."""
+        return [
+            (LONG_TERM_COLLECTION if is_long_term else RECENT_COLLECTION, str(message_id), content,
+             EnhancedMemoryService._serialize_metadata(
+                 ChatDatabase.message_metadata(role, emotion, confidence, conversation_id)))
+            for message_id, conversation_id, role, content, emotion, confidence, is_long_term in rows
+        ]
+
+    @staticmethod
+    def _summary_entries(rows):
+        """(collection, id, document, metadata) entries for summary rows."""
+        return [
+            (LONG_TERM_COLLECTION, summary_id(row_id), summary,
+             EnhancedMemoryService._serialize_metadata(summary_metadata(conversation_id)))
+            for row_id, conversation_id, summary in rows
+        ]
+
+    def _submit(self, texts):
+        """Start encoding texts; returns a future of the embedding matrix."""
+        if self.workers > 0:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(self.workers, initializer=_init_encoder, initargs=self._encoder_args)
+            return self._pool.submit(_encode, texts, self.batch_size)
+        if _encoder is None:
+            _init_encoder(*self._encoder_args)
+        future = Future()
+        future.set_result(_encode(texts, self.batch_size))
+        return future
+
+    def _index(self, chunks):
+        """Encode entry chunks on the pool, adding finished chunks in order; return the number added."""
+        in_flight = deque()
+        added = 0
+        for entries in chunks:
+            if not entries:
+                continue
+            in_flight.append((entries, self._submit([document for _, _, document, _ in entries])))
+            # Keep every worker busy without holding more than a few chunks in memory
+            if len(in_flight) > max(1, self.workers) * 2:
+                added += self._add(*in_flight.popleft())
+        while in_flight:
+            added += self._add(*in_flight.popleft())
+        return added
+
+    def _add(self, entries, future):
+        """Add one encoded chunk with one add per collection."""
+        embeddings = future.result()
+        for name, collection in self.collections.items():
+            rows = [index for index, entry in enumerate(entries) if entry[0] == name]
+            if rows:
+                collection.add(
+                    ids=[entries[index][1] for index in rows],
+                    embeddings=embeddings[rows],
+                    documents=[entries[index][2] for index in rows],
+                    metadatas=[entries[index][3] for index in rows]
+                )
+        return len(entries)
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+
+
+def migrate_vectors(source_store, target_store, batch_size=4096):
+    """Copy both memory collections with their stored embeddings into another store; return counts.
+
+    Nothing is re-embedded, so moving to a compact backend (e.g. chroma to
+    numpy-int8) costs one read and one write per vector.
+    """
+    counts = {}
+    for name in (RECENT_COLLECTION, LONG_TERM_COLLECTION):
+        source = source_store.get_collection(name)
+        target = target_store.get_collection(name)
+        copied = 0
+        while True:
+            records = source.get(include_embeddings=True, limit=batch_size, offset=copied)
+            if not records["ids"]:
+                break
+            target.add(records["ids"], np.asarray(records["embeddings"], dtype=np.float32),
+                       records["documents"], records["metadatas"])
+            copied += len(records["ids"])
+        counts[name] = copied
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check, repair or rebuild vector memory from the chat database, "
+                                                 "or migrate it to another backend")
+    parser.add_argument("command", choices=["check", "repair", "rebuild", "migrate"])
+    parser.add_argument("--db", default="emotion_chat_memory.db")
+    parser.add_argument("--vector-store", default=None,
+                        help="chroma, numpy, numpy16, numpy-int8 or numpy-pq (default: $VECTOR_BACKEND)")
+    parser.add_argument("--path", help="Vector store directory (default: the backend's)")
+    parser.add_argument("--to", help="Backend to migrate to, e.g. numpy-int8")
+    parser.add_argument("--to-path", help="Directory to migrate to (default: the target backend's)")
+    parser.add_argument("--workers", type=int, default=None, help="Encoding processes (default: CPU count, 0 = none)")
+    parser.add_argument("--chunk-size", type=int, default=4096, help="Texts per encoding task and vector add")
+    parser.add_argument("--batch-size", type=int, default=128, help="Texts per embedding forward pass")
+    parser.add_argument("--model", default=DEFAULT_MODEL_NAME, help="Embedding model for repair and rebuild")
+    parser.add_argument("--fake-models", action="store_true", help="Use the hashing stand-in embedding model")
+    args = parser.parse_args()
+
+    backend = get_vector_backend(args.vector_store)
+    path = args.path or default_vector_store_path(backend)
+
+    if args.command == "migrate":
+        if not args.to:
+            parser.error("migrate needs --to")
+        to_path = args.to_path or default_vector_store_path(args.to)
+        if os.path.abspath(to_path) == os.path.abspath(path):
+            parser.error("--to-path must differ from the source path")
+        start = time.perf_counter()
+        counts = migrate_vectors(create_vector_store(backend, path), create_vector_store(args.to, to_path),
+                                 batch_size=args.chunk_size)
+        print(json.dumps({"store": to_path, "backend": args.to, "vectors": counts,
+                          "seconds": time.perf_counter() - start}, indent=2))
+        return
+
+    # Rebuilds go to a fresh directory that replaces the old one only once it is complete
+    store_path = path + ".rebuild" if args.command == "rebuild" else path
+    if args.command == "rebuild" and os.path.exists(store_path):
+        shutil.rmtree(store_path)
+
+    # Older databases lack columns the checks query, so bring the schema up to date first
+    storage = SQLiteStorage(args.db)
+    ChatDatabase.migrate_schema(storage)
+    maintenance = VectorMaintenance(
+        storage, create_vector_store(backend, store_path), model_name=args.model,
+        workers=args.workers, fake_models=args.fake_models,
+        chunk_size=args.chunk_size, batch_size=args.batch_size
+    )
+    try:
+        if args.command == "check":
+            result = maintenance.check().summary()
+        elif args.command == "repair":
+            result = maintenance.repair()
+            result["after"] = maintenance.check().summary()
+        else:
+            result = maintenance.rebuild()
+    finally:
+        maintenance.close()
+        storage.close()
+
+    if args.command == "rebuild":
+        if os.path.exists(path):
+            if os.path.exists(path + ".bak"):
+                shutil.rmtree(path + ".bak")
+            os.rename(path, path + ".bak")
+            result["previous_store"] = path + ".bak"
+        os.rename(store_path, path)
+        result["store"] = path
+
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,582 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import numpy as np
+from quantization import Int8Codec, PQCodec
+from startup import profiler
+
+logger = logging.getLogger(__name__)
+
+
+class VectorCollection:
+    """Interface every vector memory backend collection implements."""
+
+    def add(self, ids, embeddings, documents, metadatas):
+        """Add vectors with their documents and metadata."""
+        raise NotImplementedError
+
+    def query(self, embedding, n_results, where=None):
+        """Return up to n_results (id, document, metadata, cosine distance), closest first."""
+        raise NotImplementedError
+
+    def get(self, ids=None, include_embeddings=False, limit=None, offset=0):
+        """Return a dict of ids, documents, metadatas (and embeddings) for the given ids."""
+        raise NotImplementedError
+
+    def delete(self, ids):
+        """Remove vectors by id."""
+        raise NotImplementedError
+
+    def count(self):
+        """Return the number of stored vectors."""
+        raise NotImplementedError
+
+    def iter_ids(self, batch_size=10000):
+        """Yield lists of up to batch_size stored ids, without documents or embeddings."""
+        raise NotImplementedError
+
+
+class ChromaCollection(VectorCollection):
+    def __init__(self, collection):
+        """Adapter over a Chroma collection."""
+        self.collection = collection
+
+    def add(self, ids, embeddings, documents, metadatas):
+        self.collection.add(ids=ids, embeddings=embeddings, documents=documents,
+                            metadatas=[metadata or None for metadata in metadatas])
+
+    def query(self, embedding, n_results, where=None):
+        results = self.collection.query(
+            query_embeddings=[embedding],
+            n_results=n_results,
+            where=where or None,
+            include=["documents", "metadatas", "distances"]
+        )
+        return list(zip(results['ids'][0], results['documents'][0],
+                        [metadata or {} for metadata in results['metadatas'][0]], results['distances'][0]))
+
+    def get(self, ids=None, include_embeddings=False, limit=None, offset=0):
+        include = ["documents", "metadatas"] + (["embeddings"] if include_embeddings else [])
+        if ids is not None:
+            records = self.collection.get(ids=list(ids), include=include)
+        else:
+            records = self.collection.get(limit=limit, offset=offset, include=include)
+        return {key: records.get(key) for key in ["ids"] + include}
+
+    def delete(self, ids):
+        if ids:
+            self.collection.delete(ids=list(ids))
+
+    def count(self):
+        return self.collection.count()
+
+    def iter_ids(self, batch_size=10000):
+        # One id-only read: paging with offset makes Chroma rescan from the start for every page
+        ids = self.collection.get(include=[])["ids"]
+        for start in range(0, len(ids), batch_size):
+            yield ids[start:start + batch_size]
+
+
+class ChromaVectorStore:
+    def __init__(self, path="./chatbot_memory"):
+        """Persistent Chroma client holding HNSW cosine collections."""
+        os.makedirs(path, exist_ok=True)
+        with profiler.track("chroma", "import"):
+            import chromadb
+        with profiler.track("chroma", "load"):
+            self.client = chromadb.PersistentClient(path=path)
+
+    def get_collection(self, name):
+        """Return (creating if needed) a named collection."""
+        return ChromaCollection(self.client.get_or_create_collection(
+            name=name,
+            metadata={"hnsw:space": "cosine"}
+        ))
+
+
+class NumpyCollection(VectorCollection):
+    def __init__(self, path, dtype="float32", ann_threshold=50000, nlist=None, nprobe=8, chunk_rows=65536,
+                 quantization=None, rerank_factor=None, pq_subspaces=None, pq_train_size=10000):
+        """Exact (or IVF above ann_threshold) cosine search over a memory-mapped vector file.
+
+        Normalized vectors are appended to vectors.bin; ids, documents and metadata live
+        in a sidecar SQLite table whose row number is the vector's position in the file.
+        Deleted rows are tombstoned. The file's dtype is recorded in the sidecar; opening
+        a collection with a different dtype converts the file (dtype=None keeps it).
+
+        With quantization ("int8" or "pq") searches scan compact codes in codes.bin
+        instead, and the n_results * rerank_factor best matches (the codec's default
+        factor when None, 0 for none) are re-scored against vectors.bin, which then
+        only has those rows paged in. Codes missing for existing rows (a collection
+        created without quantization or with another codec, or appends from an
+        interrupted run) are encoded when the collection is opened and before each
+        query. PQ codebooks are trained once pq_train_size vectors are
+        stored; smaller collections are searched exactly.
+        """
+        if quantization not in (None, "int8", "pq"):
+            raise ValueError(f"Unknown quantization: {quantization}")
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.ann_threshold = ann_threshold
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.chunk_rows = chunk_rows
+        self.quantization = quantization
+        self.rerank_factor = rerank_factor
+        self.pq_subspaces = pq_subspaces
+        self.pq_train_size = pq_train_size
+        self.vectors_path = os.path.join(path, "vectors.bin")
+        self.codes_path = os.path.join(path, "codes.bin")
+        self.codebook_path = os.path.join(path, "pq_codebook.npy")
+        self._lock = threading.RLock()
+
+        self.conn = sqlite3.connect(os.path.join(path, "index.sqlite"), check_same_thread=False)
+        self.conn.execute('''
+        CREATE TABLE IF NOT EXISTS vectors (
+            row INTEGER PRIMARY KEY,
+            id TEXT NOT NULL,
+            document TEXT,
+            metadata TEXT,
+            deleted INTEGER DEFAULT 0
+        )
+        ''')
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_vectors_id ON vectors(id, deleted)")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS settings (key TEXT PRIMARY KEY, value TEXT)")
+        self.conn.commit()
+
+        result = self.conn.execute("SELECT value FROM settings WHERE key = 'dim'").fetchone()
+        self.dim = int(result[0]) if result else None
+        self._matrix = None
+        self._live = self._load_live_mask()
+
+        stored_dtype = self._load_dtype()
+        self.dtype = np.dtype(dtype) if dtype is not None else stored_dtype or np.dtype("float32")
+        if stored_dtype is not None and stored_dtype != self.dtype:
+            self._convert_vectors(stored_dtype)
+        elif stored_dtype is None:
+            self.conn.execute("INSERT OR REPLACE INTO settings VALUES ('dtype', ?)", (self.dtype.name,))
+            self.conn.commit()
+        self._ivf = None
+        self._codes_map = None
+        self._codec = self._load_codec()
+        if self.quantization is not None:
+            # Encode rows stored without (or with other) codes now rather than on the first query
+            self._ready_codec()
+
+    def _load_live_mask(self):
+        """Boolean mask of rows that have not been deleted."""
+        rows = self.conn.execute("SELECT row, deleted FROM vectors ORDER BY row").fetchall()
+        live = np.ones(len(rows), dtype=bool)
+        for row, deleted in rows:
+            if deleted:
+                live[row] = False
+        return live
+
+    def _load_dtype(self):
+        """Return the dtype of vectors.bin, inferring it from the file size for collections that predate the setting."""
+        result = self.conn.execute("SELECT value FROM settings WHERE key = 'dtype'").fetchone()
+        if result:
+            return np.dtype(result[0])
+        if not self.dim or not len(self._live) or not os.path.exists(self.vectors_path):
+            return None
+        itemsize = os.path.getsize(self.vectors_path) // (len(self._live) * self.dim)
+        return {2: np.dtype("float16"), 4: np.dtype("float32")}.get(itemsize)
+
+    def _convert_vectors(self, stored_dtype):
+        """Rewrite vectors.bin from stored_dtype to self.dtype."""
+        logger.info("Converting %s from %s to %s", self.vectors_path, stored_dtype.name, self.dtype.name)
+        rows = len(self._live)
+        if rows:
+            source = np.memmap(self.vectors_path, dtype=stored_dtype, mode="r", shape=(rows, self.dim))
+            temporary_path = self.vectors_path + ".convert"
+            with open(temporary_path, "wb") as f:
+                for start in range(0, rows, self.chunk_rows):
+                    f.write(np.asarray(source[start:start + self.chunk_rows]).astype(self.dtype).tobytes())
+            del source
+            os.replace(temporary_path, self.vectors_path)
+        self.conn.execute("INSERT OR REPLACE INTO settings VALUES ('dtype', ?)", (self.dtype.name,))
+        self.conn.commit()
+
+    def _vectors(self):
+        """Memory-map the vector file (re-mapped after appends)."""
+        if self._matrix is None or len(self._matrix) != len(self._live):
+            if not len(self._live):
+                return np.zeros((0, self.dim or 0), dtype=self.dtype)
+            self._matrix = np.memmap(self.vectors_path, dtype=self.dtype, mode="r",
+                                     shape=(len(self._live), self.dim))
+        return self._matrix
+
+    def _load_codec(self):
+        """Return the codec for stored codes, dropping codes written by a different one."""
+        if self.quantization is None:
+            return None
+        result = self.conn.execute("SELECT value FROM settings WHERE key = 'codec'").fetchone()
+        if result is None or result[0] != self.quantization:
+            for path in (self.codes_path, self.codebook_path):
+                if os.path.exists(path):
+                    os.remove(path)
+            self.conn.execute("INSERT OR REPLACE INTO settings VALUES ('codec', ?)", (self.quantization,))
+            self.conn.commit()
+
+        if self.quantization == "int8":
+            return Int8Codec(self.dim) if self.dim else None
+        if os.path.exists(self.codebook_path):
+            return PQCodec(np.load(self.codebook_path))
+        return None
+
+    def _train_pq(self):
+        """Train and save a PQ codebook on a sample of live vectors."""
+        rows = np.flatnonzero(self._live)
+        if len(rows) > self.pq_train_size:
+            rows = np.sort(np.random.default_rng(0).choice(rows, self.pq_train_size, replace=False))
+        subspaces = self.pq_subspaces or next(
+            count for count in range(max(1, self.dim // 8), 0, -1) if self.dim % count == 0
+        )
+        codec = PQCodec.train(self._vectors()[rows].astype(np.float32), subspaces)
+
+        temporary_path = self.codebook_path + ".tmp.npy"
+        np.save(temporary_path, codec.codebooks)
+        os.replace(temporary_path, self.codebook_path)
+        self._truncate_codes(0)
+        return codec
+
+    def _codes_rows(self):
+        if not os.path.exists(self.codes_path):
+            return 0
+        return os.path.getsize(self.codes_path) // self._codec.code_size
+
+    def _truncate_codes(self, rows):
+        """Cut codes.bin down to whole code rows for the first rows vectors."""
+        self._codes_map = None
+        if os.path.exists(self.codes_path):
+            os.truncate(self.codes_path, min(rows, self._codes_rows()) * self._codec.code_size)
+
+    def _ready_codec(self):
+        """Return the codec once every row has codes, training and backfilling as needed."""
+        if self._codec is None and self.quantization == "pq" and self._live.sum() >= self.pq_train_size:
+            self._codec = self._train_pq()
+        if self._codec is None:
+            return None
+
+        rows = self._codes_rows()
+        if rows != len(self._live):
+            # Drop any partial row, then encode the rows that have no codes yet
+            rows = min(rows, len(self._live))
+            self._truncate_codes(rows)
+            matrix = self._vectors()
+            with open(self.codes_path, "ab") as f:
+                for start in range(rows, len(self._live), self.chunk_rows):
+                    chunk = matrix[start:start + self.chunk_rows].astype(np.float32)
+                    f.write(self._codec.encode(chunk).tobytes())
+        return self._codec
+
+    def _codes(self):
+        """Memory-map the code file (re-mapped after appends)."""
+        if self._codes_map is None or len(self._codes_map) != len(self._live):
+            self._codes_map = np.memmap(self.codes_path, dtype=np.uint8, mode="r",
+                                        shape=(len(self._live), self._codec.code_size))
+        return self._codes_map
+
+    def _score_rows(self, rows, query, prepared=None):
+        """Score the given rows exactly, or against their codes when prepared is a codec query."""
+        if prepared is not None:
+            return self._codec.score(self._codes()[rows], prepared)
+        return self._vectors()[rows].astype(np.float32, copy=False) @ query
+
+    @staticmethod
+    def _normalize(embeddings):
+        matrix = np.asarray(embeddings, dtype=np.float32)
+        if matrix.ndim == 1:
+            matrix = matrix[None, :]
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return matrix / norms
+
+    def add(self, ids, embeddings, documents, metadatas):
+        if not len(ids):
+            return
+        matrix = self._normalize(embeddings)
+
+        with self._lock:
+            if self.dim is None:
+                self.dim = matrix.shape[1]
+                self.conn.execute("INSERT OR REPLACE INTO settings VALUES ('dim', ?)", (str(self.dim),))
+                if self.quantization == "int8":
+                    self._codec = Int8Codec(self.dim)
+
+            # Re-adding an id replaces its previous vector
+            self._delete_locked(ids)
+
+            # Release the mapping before growing the file, dropping any vectors
+            # left behind by an append whose sidecar rows were never committed
+            self._matrix = None
+            start = len(self._live)
+            expected_size = start * self.dim * self.dtype.itemsize
+            if os.path.exists(self.vectors_path) and os.path.getsize(self.vectors_path) > expected_size:
+                os.truncate(self.vectors_path, expected_size)
+            with open(self.vectors_path, "ab") as f:
+                f.write(matrix.astype(self.dtype).tobytes())
+            self.conn.executemany(
+                "INSERT INTO vectors (row, id, document, metadata) VALUES (?, ?, ?, ?)",
+                [(start + offset, str(message_id), document, json.dumps(metadata or {}))
+                 for offset, (message_id, document, metadata) in enumerate(zip(ids, documents, metadatas))]
+            )
+            self.conn.commit()
+            self._live = np.concatenate([self._live, np.ones(len(ids), dtype=bool)])
+
+            if self._ivf is not None:
+                self._ivf.add(np.arange(start, start + len(ids)), matrix)
+
+            # Codes follow their vectors; rows without codes are encoded by the next query
+            if self._codec is not None:
+                self._truncate_codes(start)
+                if self._codes_rows() == start:
+                    with open(self.codes_path, "ab") as f:
+                        f.write(self._codec.encode(matrix).tobytes())
+
+    def _allowed_rows(self, where):
+        """Rows whose metadata matches an equality filter ({k: v} or {"$and": [...]})."""
+        clauses = where.get("$and", [where]) if where else []
+        conditions, params = [], []
+        for clause in clauses:
+            for key, value in clause.items():
+                conditions.append("json_extract(metadata, ?) = ?")
+                params.extend([f"$.{key}", value])
+        rows = self.conn.execute(
+            "SELECT row FROM vectors WHERE deleted = 0 AND " + " AND ".join(conditions), params
+        ).fetchall()
+        mask = np.zeros(len(self._live), dtype=bool)
+        mask[[row for (row,) in rows]] = True
+        return mask
+
+    def _candidate_rows(self, query):
+        """Rows to score: all of them, or the nprobe closest IVF lists above the threshold."""
+        live_count = int(self._live.sum())
+        if live_count < self.ann_threshold:
+            self._ivf = None
+            return None
+        if self._ivf is None or self._ivf.trained_size * 2 < live_count:
+            nlist = self.nlist or max(16, int(np.sqrt(live_count)))
+            self._ivf = IVFIndex.train(self._vectors(), np.flatnonzero(self._live), nlist)
+        return self._ivf.search_rows(query, self.nprobe)
+
+    def query(self, embedding, n_results, where=None):
+        query = self._normalize(embedding)[0]
+
+        with self._lock:
+            if not len(self._live) or n_results <= 0:
+                return []
+            codec = self._ready_codec() if self.quantization else None
+            prepared = codec.prepare(query) if codec is not None else None
+            matrix = self._codes() if codec is not None else self._vectors()
+            mask = self._allowed_rows(where) if where else self._live
+            candidates = self._candidate_rows(query)
+
+            if candidates is None:
+                # Exact search: score contiguous chunks of the whole file, then mask
+                rows = np.arange(len(mask))
+                scores = np.empty(len(mask), dtype=np.float32)
+                for start in range(0, len(mask), self.chunk_rows):
+                    chunk = matrix[start:start + self.chunk_rows]
+                    if codec is not None:
+                        scores[start:start + len(chunk)] = codec.score(chunk, prepared)
+                    else:
+                        scores[start:start + len(chunk)] = chunk.astype(np.float32, copy=False) @ query
+                scores[~mask] = -np.inf
+                valid = int(mask.sum())
+            else:
+                # Approximate search: score only the rows in the probed IVF lists
+                rows = candidates[mask[candidates]]
+                scores = self._score_rows(rows, query, prepared)
+                valid = len(rows)
+
+            if codec is not None:
+                # Re-score the best code matches with the full-precision vectors
+                rerank_factor = codec.rerank_factor if self.rerank_factor is None else self.rerank_factor
+                shortlist = min(valid, n_results * rerank_factor)
+                if shortlist > 0:
+                    rows = np.sort(rows[np.argpartition(-scores, shortlist - 1)[:shortlist]])
+                    scores = self._score_rows(rows, query)
+                    valid = shortlist
+
+            k = min(n_results, valid)
+            if k <= 0:
+                return []
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+            return self._records(rows[top], 1.0 - scores[top])
+
+    def _records(self, rows, distances):
+        """Look up ids, documents and metadata for matched rows."""
+        placeholders = ",".join("?" * len(rows))
+        found = {
+            row: (message_id, document, json.loads(metadata))
+            for row, message_id, document, metadata in self.conn.execute(
+                f"SELECT row, id, document, metadata FROM vectors WHERE row IN ({placeholders})",
+                [int(row) for row in rows]
+            )
+        }
+        return [found[int(row)] + (float(distance),) for row, distance in zip(rows, distances)]
+
+    def get(self, ids=None, include_embeddings=False, limit=None, offset=0):
+        with self._lock:
+            if ids is not None:
+                ids = [str(message_id) for message_id in ids]
+                placeholders = ",".join("?" * len(ids))
+                rows = self.conn.execute(
+                    f"SELECT row, id, document, metadata FROM vectors WHERE deleted = 0 AND id IN ({placeholders})",
+                    ids
+                ).fetchall() if ids else []
+            else:
+                rows = self.conn.execute(
+                    "SELECT row, id, document, metadata FROM vectors WHERE deleted = 0 ORDER BY row LIMIT ? OFFSET ?",
+                    (-1 if limit is None else limit, offset)
+                ).fetchall()
+
+            records = {
+                "ids": [row[1] for row in rows],
+                "documents": [row[2] for row in rows],
+                "metadatas": [json.loads(row[3]) for row in rows],
+            }
+            if include_embeddings:
+                matrix = self._vectors()
+                records["embeddings"] = [matrix[row[0]].astype(np.float32) for row in rows]
+            return records
+
+    def _delete_locked(self, ids):
+        ids = [str(message_id) for message_id in ids]
+        placeholders = ",".join("?" * len(ids))
+        rows = self.conn.execute(
+            f"SELECT row FROM vectors WHERE deleted = 0 AND id IN ({placeholders})", ids
+        ).fetchall()
+        if rows:
+            self.conn.executemany("UPDATE vectors SET deleted = 1 WHERE row = ?", rows)
+            self._live[[row for (row,) in rows]] = False
+
+    def delete(self, ids):
+        if not ids:
+            return
+        with self._lock:
+            self._delete_locked(ids)
+            self.conn.commit()
+
+    def count(self):
+        with self._lock:
+            return int(self._live.sum())
+
+    def iter_ids(self, batch_size=10000):
+        with self._lock:
+            ids = [row[0] for row in self.conn.execute("SELECT id FROM vectors WHERE deleted = 0 ORDER BY row")]
+        for start in range(0, len(ids), batch_size):
+            yield ids[start:start + batch_size]
+
+    def get_storage_report(self):
+        """Bytes per vector that searches scan, and bytes on disk for vectors and codes."""
+        with self._lock:
+            codec = self._ready_codec() if self.quantization else None
+            dim = self.dim or 0
+            files = [self.vectors_path, self.codes_path, self.codebook_path]
+            return {
+                "rows": len(self._live),
+                "quantization": codec.name if codec is not None else None,
+                "scan_bytes_per_vector": codec.code_size if codec is not None else dim * self.dtype.itemsize,
+                "disk_bytes": sum(os.path.getsize(path) for path in files if os.path.exists(path)),
+            }
+
+    def close(self):
+        """Close the sidecar table."""
+        self.conn.close()
+
+
+class IVFIndex:
+    def __init__(self, centroids, lists, trained_size):
+        """Inverted-file index: k-means centroids and the rows assigned to each."""
+        self.centroids = centroids
+        self.lists = lists
+        self.trained_size = trained_size
+
+    @classmethod
+    def train(cls, matrix, rows, nlist, iterations=10, sample_size=20000, seed=0):
+        """Cluster a sample of rows with spherical k-means and assign every row."""
+        rng = np.random.default_rng(seed)
+        sample_rows = rows if len(rows) <= sample_size else rng.choice(rows, sample_size, replace=False)
+        sample = matrix[np.sort(sample_rows)].astype(np.float32)
+        nlist = min(nlist, len(sample))
+        centroids = sample[rng.choice(len(sample), nlist, replace=False)]
+
+        for _ in range(iterations):
+            assignment = np.argmax(sample @ centroids.T, axis=1)
+            for index in range(nlist):
+                members = sample[assignment == index]
+                if len(members):
+                    centroid = members.sum(axis=0)
+                    centroids[index] = centroid / (np.linalg.norm(centroid) or 1.0)
+
+        index = cls(centroids, [np.zeros(0, dtype=np.int64) for _ in range(nlist)], len(rows))
+        for start in range(0, len(rows), 65536):
+            chunk = rows[start:start + 65536]
+            index.add(chunk, matrix[chunk].astype(np.float32))
+        return index
+
+    def add(self, rows, vectors):
+        """Assign new rows to their nearest list."""
+        assignment = np.argmax(vectors @ self.centroids.T, axis=1)
+        for list_index in np.unique(assignment):
+            self.lists[list_index] = np.concatenate([self.lists[list_index], rows[assignment == list_index]])
+
+    def search_rows(self, query, nprobe):
+        """Rows in the nprobe lists closest to the query."""
+        nprobe = min(nprobe, len(self.centroids))
+        closest = np.argpartition(-(self.centroids @ query), nprobe - 1)[:nprobe]
+        return np.sort(np.concatenate([self.lists[index] for index in closest]))
+
+
+class NumpyVectorStore:
+    def __init__(self, path="./chatbot_vectors", dtype="float32", ann_threshold=50000, quantization=None):
+        """In-process vector store with one NumpyCollection directory per collection."""
+        self.path = path
+        self.dtype = dtype
+        self.ann_threshold = ann_threshold
+        self.quantization = quantization
+        self.collections = {}
+
+    def get_collection(self, name):
+        """Return (creating if needed) a named collection."""
+        if name not in self.collections:
+            self.collections[name] = NumpyCollection(
+                os.path.join(self.path, name), dtype=self.dtype, ann_threshold=self.ann_threshold,
+                quantization=self.quantization
+            )
+        return self.collections[name]
+
+
+def get_vector_backend(backend=None):
+    """Return the backend name to use, defaulting to $VECTOR_BACKEND or chroma."""
+    return backend or os.getenv("VECTOR_BACKEND", "chroma")
+
+
+def default_vector_store_path(backend=None):
+    """Return the directory a backend stores its collections in by default."""
+    return "./chatbot_memory" if get_vector_backend(backend) == "chroma" else "./chatbot_vectors"
+
+
+def create_vector_store(backend=None, path=None):
+    """Create a vector store by name, defaulting to $VECTOR_BACKEND.
+
+    "numpy-int8" and "numpy-pq" search the numpy store through int8 or product-quantized
+    codes. They share ./chatbot_vectors with "numpy" and "numpy16" and keep whatever
+    dtype the vectors were persisted with (float32 for a new store), so switching an
+    existing store to them encodes codes for its collections when they are opened.
+    A PQ codebook is only trained once a collection holds enough vectors.
+    """
+    backend = get_vector_backend(backend)
+    path = path or default_vector_store_path(backend)
+    if backend == "chroma":
+        return ChromaVectorStore(path)
+    if backend in ("numpy", "numpy16"):
+        return NumpyVectorStore(path, dtype="float16" if backend == "numpy16" else "float32")
+    if backend in ("numpy-int8", "numpy-pq"):
+        return NumpyVectorStore(path, dtype=None, quantization=backend[len("numpy-"):])
+    raise ValueError(f"Unknown vector backend: {backend}")
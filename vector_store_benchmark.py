@@ -0,0 +1,102 @@
+import argparse
+import json
+import multiprocessing
+import resource
+import sys
+import tempfile
+import time
+import numpy as np
+from vector_store import create_vector_store
+
+
+def current_rss_mb():
+    """Resident set size of this process in MB (peak RSS where /proc is unavailable)."""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def bench_backend(backend, size, dim, queries, batch_size, top_k, seed, results):
+    """Insert size random vectors, run queries and record latency and RSS."""
+    rng = np.random.default_rng(seed)
+    with tempfile.TemporaryDirectory() as path:
+        rss_before = current_rss_mb()
+        store = create_vector_store(backend, path)
+        collection = store.get_collection("benchmark")
+
+        insert_start = time.perf_counter()
+        for start in range(0, size, batch_size):
+            count = min(batch_size, size - start)
+            embeddings = rng.normal(size=(count, dim)).astype(np.float32)
+            collection.add(
+                ids=[str(start + offset) for offset in range(count)],
+                embeddings=embeddings.tolist(),
+                documents=[f"message {start + offset}" for offset in range(count)],
+                metadatas=[{"conversation_id": str((start + offset) % 50)} for offset in range(count)]
+            )
+        insert_seconds = time.perf_counter() - insert_start
+
+        latencies = []
+        for _ in range(queries):
+            query = rng.normal(size=dim).astype(np.float32).tolist()
+            start = time.perf_counter()
+            collection.query(query, top_k)
+            latencies.append((time.perf_counter() - start) * 1000)
+
+        results[backend] = {
+            "size": size,
+            "insert_total_s": insert_seconds,
+            "insert_per_s": size / insert_seconds,
+            "query_p50_ms": percentile(latencies, 0.50),
+            "query_p95_ms": percentile(latencies, 0.95),
+            "query_p99_ms": percentile(latencies, 0.99),
+            "rss_mb": current_rss_mb(),
+            "rss_growth_mb": current_rss_mb() - rss_before,
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare vector memory backends on insert/query latency and RSS")
+    parser.add_argument("--backends", nargs="+", default=["chroma", "numpy", "numpy16"])
+    parser.add_argument("--sizes", nargs="+", type=int, default=[1000, 10000])
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--output", help="Write the JSON report to this file")
+    args = parser.parse_args()
+
+    # Each backend runs in a fresh process so RSS numbers are not shared
+    report = []
+    with multiprocessing.Manager() as manager:
+        for size in args.sizes:
+            results = manager.dict()
+            for backend in args.backends:
+                process = multiprocessing.Process(
+                    target=bench_backend,
+                    args=(backend, size, args.dim, args.queries, args.batch_size, args.top_k, 0, results)
+                )
+                process.start()
+                process.join()
+            report.append(dict(results))
+
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output)
+
+
+if __name__ == "__main__":
+    main()